@@ -0,0 +1,307 @@
+"""
+Benchmarks for the StoryWindow hot paths.
+
+Runs headless, so no display or audio device is needed:
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --compare baseline.json --threshold 0.15
+
+Results are written as JSON. With --compare, every benchmark whose median got slower
+than the baseline by more than --threshold is reported and the exit code is 1.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks import standins  # noqa: E402
+
+RESOLUTIONS = [(800, 600), (1920, 1080), (2560, 1440)]
+SHORT_TEXT = "Welcome to the game!"
+LONG_TEXT = " ".join(["The city lights flickered as the rain kept falling on the empty streets."] * 40)
+HEAVY_MODULES = ("numpy", "pygame", "ffpyplayer", "keyboard", "sqlite3")
+
+# Runs in a fresh interpreter, so the import is cold
+STARTUP_SCRIPT = '''
+import json, sys, time
+started = time.perf_counter()
+import imagegamepy
+import_ms = (time.perf_counter() - started) * 1000.0
+game = imagegamepy.body(sys.argv[1], headless=True)
+game.dialog("Welcome to the game!")
+game.render_frame()
+times = game.startup_times()
+times["import_wall_ms"] = import_ms
+times["loaded"] = [name for name in %r if name in sys.modules]
+print(json.dumps(times))
+''' % (HEAVY_MODULES,)
+
+
+def measure(func, repeat=5, setup=None):
+    """Runs `func` `repeat` times (after `setup`, untimed) and returns timing stats in ms."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000.0)
+    return summarize(times)
+
+
+def summarize(times):
+    return {
+        "median_ms": statistics.median(times),
+        "min_ms": min(times),
+        "max_ms": max(times),
+        "runs": len(times),
+    }
+
+
+class Bench:
+    def __init__(self, workdir, repeat, quick):
+        import imagegamepy
+        from imagegamepy.assets import LAZY_GIF_FRAMES
+        from PIL import Image
+        self.ig = imagegamepy
+        self.Image = Image
+        self.workdir = workdir
+        self.repeat = repeat
+        self.resolutions = RESOLUTIONS[:2] if quick else RESOLUTIONS
+        self.results = {}
+        self.background = os.path.join(workdir, "background.jpg")
+        Image.radial_gradient("L").resize((3000, 2000)).convert("RGB").save(self.background, quality=90)
+        self.gif = os.path.join(workdir, "sprite.gif")
+        # Longer GIFs are decoded lazily, so keep this one short enough for load() to decode every frame
+        self.gif_frames = LAZY_GIF_FRAMES
+        frames = [Image.new("RGB", (256, 256), (i * 8 % 256, 80, 160)) for i in range(self.gif_frames)]
+        frames[0].save(self.gif, save_all=True, append_images=frames[1:], duration=40, loop=0)
+
+    def window(self, size=(800, 600), **kw):
+        kw.setdefault("save_backend", "memory")
+        return self.ig.body(self.background, headless=True, size=size, **kw)
+
+    def record(self, name, stats):
+        self.results[name] = stats
+        print("%-45s %9.2f ms (min %.2f)" % (name, stats["median_ms"], stats["min_ms"]))
+
+    def bench_startup(self):
+        env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+        runs = []
+        for _ in range(self.repeat):
+            output = subprocess.check_output([sys.executable, "-c", STARTUP_SCRIPT, self.background],
+                                             cwd=self.workdir, env=env)
+            runs.append(json.loads(output.decode().strip().splitlines()[-1]))
+        self.record("startup[import]", summarize([run["import_wall_ms"] for run in runs]))
+        self.record("startup[window]", summarize([run["init_ms"] for run in runs]))
+        self.record("startup[first frame]", summarize([run["first_frame_ms"] for run in runs]))
+        if runs[-1]["loaded"]:
+            print("  loaded at startup: " + ", ".join(runs[-1]["loaded"]))
+
+    def bench_noise(self):
+        for size in self.resolutions:
+            game = self.window(size)
+            image = game.background_image
+            for pattern in ("HL", "VL", "CL"):
+                for blur in (0, 20, 60):
+                    game.noise_params = self.ig.noise(80, pattern, blur)
+                    self.record("apply_noise[%s,blur=%d,%dx%d]" % (pattern, blur, size[0], size[1]),
+                                measure(lambda: game.apply_noise(image), self.repeat))
+
+    def bench_warm(self):
+        for size in self.resolutions:
+            game = self.window(size)
+            image = game.background_source.resize(size)
+            self.record("apply_warm[%dx%d]" % size, measure(lambda: game.apply_warm(image, 35), self.repeat))
+            grade = self.ig.Grade(warm=20, tint=("#203040", 15), contrast=1.2, vignette=40)
+            self.record("apply_grade[all,%dx%d]" % size, measure(lambda: game.apply_grade(image, grade), self.repeat))
+
+            def transition():
+                game.set_warm(60 if game.warm == 0 else 0)
+                while game._grade_transition is not None:
+                    game.root.advance(0.05)
+
+            self.record("set_warm[60 steps,%dx%d]" % size, measure(transition, self.repeat))
+
+    def bench_resize(self):
+        for size in self.resolutions:
+            game = self.window()
+            event = type("Event", (), {"width": size[0], "height": size[1]})
+
+            def resize():
+                game.resize_image(event)
+                game.root.advance(1)
+
+            def other_size():
+                game.background_image = game.background_cache.get(game.background_source, (640, 480), game.warm, game.apply_warm)
+
+            self.record("resize_image[cold,%dx%d]" % size,
+                        measure(resize, self.repeat, lambda: (game.background_cache.clear(), other_size())))
+            self.record("resize_image[cached,%dx%d]" % size, measure(resize, self.repeat, other_size))
+            game.canvas.width, game.canvas.height = size
+            warm = [0]
+
+            def update():
+                warm[0] = (warm[0] + 1) % 100
+                game.warm = warm[0]
+                game.update_background()
+
+            self.record("update_background[warm step,%dx%d]" % size, measure(update, self.repeat))
+
+    def bench_dialog(self):
+        for label, text in (("short", SHORT_TEXT), ("long", LONG_TEXT)):
+            game = self.window()
+
+            def type_out():
+                game.dialog(text, speed=1)
+                while not game.dialogs.done:
+                    game.root.advance(0.5)
+
+            self.record("dialog[%s,%d chars]" % (label, len(text)), measure(type_out, self.repeat))
+
+    def bench_profiler(self):
+        for profiled in (False, True):
+            game = self.window()
+            if profiled:
+                game.enable_profiler()
+
+            def type_out():
+                game.dialog(LONG_TEXT, speed=1)
+                while not game.dialogs.done:
+                    game.root.advance(0.5)
+
+            self.record("dialog[long,%s]" % ("profiled" if profiled else "not profiled"), measure(type_out, self.repeat))
+
+    def bench_option_saves(self):
+        for history in (0, 1000, 10000):
+            for backend in ("jsonl", "sqlite"):
+                directory = tempfile.mkdtemp(dir=self.workdir)
+                cwd = os.getcwd()
+                os.chdir(directory)
+                try:
+                    game = self.window(save_backend=backend)
+                    for i in range(history):
+                        game.save_store.record("chapter%d" % i, {"choice": "a"})
+                    counter = [history]
+
+                    def choose():
+                        counter[0] += 1
+                        game.root.feed("<Down>", "<Return>")
+                        game.option(["a", "b"], "black", "white", save_type="json", id="chapter%d" % counter[0])
+                        game.return_options("chapter%d" % (counter[0] // 2))
+
+                    self.record("option_save[%s,history=%d]" % (backend, history), measure(choose, self.repeat))
+                    game.save_store.close()
+                finally:
+                    os.chdir(cwd)
+
+    def bench_gif(self):
+        game = self.window()
+        self.record("load_gif[cold,%d frames]" % self.gif_frames,
+                    measure(lambda: game.load("gif", [(128, 128), (0, 0)], self.gif), self.repeat, game.assets.clear))
+        self.record("load_gif[cached,%d frames]" % self.gif_frames,
+                    measure(lambda: game.load("gif", [(128, 128), (0, 0)], self.gif), self.repeat))
+
+    def bench_video(self):
+        from imagegamepy.video import VideoPipeline, frame_to_image
+        for size in self.resolutions:
+            frame = standins.FakeVideoImage((1920, 1080))
+            self.record("video_frame[1920x1080->%dx%d]" % size,
+                        measure(lambda: frame_to_image(frame, size), self.repeat))
+            frame = standins.FakeVideoImage(size)
+            self.record("video_frame[prescaled %dx%d]" % size, measure(lambda: frame_to_image(frame, size), self.repeat))
+
+            # One presentation tick that finds a full queue of overdue frames: drops all but the newest and shows it
+            game = self.window(size)
+            pipeline = VideoPipeline(standins.FakeMediaPlayer(size=size), size, (0, 0), game.root, game.canvas,
+                                     game.animations.make_photo)
+            pipeline.running = True
+            image = self.Image.new("RGB", size, (40, 80, 120))
+
+            def queue_overdue():
+                if pipeline._job is not None:
+                    game.root.after_cancel(pipeline._job)
+                now = pipeline.clock()
+                for i in range(pipeline.frames.maxsize):
+                    pipeline.frames.put_nowait((now - 1.0 + i * 0.01, image))
+
+            self.record("video_present[drop %d, %dx%d]" % (pipeline.frames.maxsize - 1, size[0], size[1]),
+                        measure(pipeline._present, self.repeat, queue_overdue))
+            pipeline.running = False
+
+    def run(self, selected=None):
+        for name in ("startup", "noise", "warm", "resize", "dialog", "profiler", "option_saves", "gif", "video"):
+            if selected and name not in selected:
+                continue
+            getattr(self, "bench_" + name)()
+        return self.results
+
+
+def compare(results, baseline, threshold):
+    """Returns a list of (name, baseline_ms, current_ms) for benchmarks that regressed."""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get("results", {}).get(name)
+        if base is None:
+            continue
+        if stats["median_ms"] > base["median_ms"] * (1.0 + threshold):
+            regressions.append((name, base["median_ms"], stats["median_ms"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the imagegamepy StoryWindow hot paths.")
+    parser.add_argument("--output", default="benchmark_results.json", help="where to write the JSON results")
+    parser.add_argument("--compare", metavar="BASELINE", help="baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="allowed slowdown before flagging, as a fraction")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--quick", action="store_true", help="skip the largest resolution")
+    parser.add_argument("--only", nargs="*", help="benchmark groups to run, e.g. noise dialog")
+    parser.add_argument("--standins", action="store_true", help="use stand-ins even if the real media modules are installed")
+    args = parser.parse_args(argv)
+
+    installed = standins.install(force=args.standins)
+    workdir = tempfile.mkdtemp(prefix="imagegamepy-bench-")
+    try:
+        results = Bench(workdir, args.repeat, args.quick).run(args.only)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "machine": platform.machine(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "standins": installed,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("Results written to " + args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for name, before, after in regressions:
+            print("REGRESSION %-45s %9.2f ms -> %9.2f ms (+%.0f%%)" % (name, before, after, (after / before - 1) * 100))
+        if regressions:
+            return 1
+        print("No regressions above %.0f%%" % (args.threshold * 100))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
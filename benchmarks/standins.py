@@ -0,0 +1,196 @@
+"""
+Stand-ins for the optional media backends, so the benchmarks run on a box without
+a display, an audio device, pygame, ffpyplayer or keyboard installed.
+
+Real modules are always preferred; a stand-in is only registered when the import fails
+or when install() is called with force=True.
+"""
+import importlib
+import sys
+import types
+
+
+class FakeSound:
+    def __init__(self, file=None, buffer=None):
+        self.file = file
+        self.volume = 1.0
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def play(self, loops=0, maxtime=0, fade_ms=0):
+        return None
+
+    def stop(self):
+        pass
+
+    def fadeout(self, ms):
+        pass
+
+    def get_length(self):
+        return 0.0
+
+
+class FakeChannel:
+    """Plays until stopped: stand-in sounds have no length to run out."""
+
+    def __init__(self, channel_id=0):
+        self.id = channel_id
+        self.sound = None
+        self.volume = 1.0
+
+    def play(self, sound, loops=0, maxtime=0, fade_ms=0):
+        self.sound = sound
+
+    def stop(self):
+        self.sound = None
+
+    def fadeout(self, ms):
+        self.stop()
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def get_busy(self):
+        return self.sound is not None
+
+    def get_sound(self):
+        return self.sound
+
+
+class FakeMusic:
+    def __init__(self):
+        self.file = None
+        self.busy = False
+        self.volume = 1.0
+
+    def load(self, file):
+        self.file = file
+
+    def play(self, loops=0, start=0.0, fade_ms=0):
+        self.busy = True
+
+    def stop(self):
+        self.busy = False
+
+    def fadeout(self, ms):
+        self.stop()
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+    def get_busy(self):
+        return self.busy
+
+
+class FakeMixer(types.ModuleType):
+    """The parts of pygame.mixer that AudioManager uses: channels, Sound and the music stream."""
+
+    def __init__(self):
+        super().__init__("pygame.mixer")
+        self.Sound = FakeSound
+        self.music = FakeMusic()
+        self._init = None
+        self._channels = {}
+
+    def init(self, frequency=44100, size=-16, channels=2, *args, **kw):
+        self._init = (frequency, size, channels)
+
+    def get_init(self):
+        return self._init
+
+    def quit(self):
+        self._init = None
+
+    def set_num_channels(self, count):
+        pass
+
+    def Channel(self, channel_id):
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            channel = self._channels[channel_id] = FakeChannel(channel_id)
+        return channel
+
+    def stop(self):
+        for channel in self._channels.values():
+            channel.stop()
+
+    def fadeout(self, ms):
+        self.stop()
+
+
+class FakeVideoImage:
+    """Mimics ffpyplayer.pic.Image for an rgb24 frame."""
+
+    def __init__(self, size):
+        self.size = size
+        self.data = bytearray(size[0] * size[1] * 3)
+
+    def get_size(self):
+        return self.size
+
+    def to_bytearray(self):
+        return [self.data]
+
+    def to_memoryview(self, keep_align=False):
+        return [memoryview(self.data)]
+
+
+class FakeMediaPlayer:
+    """Returns `frames` synthetic frames at `fps`, without any timing of its own."""
+
+    def __init__(self, filename=None, ff_opts=None, size=(1920, 1080), frames=120, fps=30.0, **kw):
+        self.size = size
+        self.frames = frames
+        self.fps = fps
+        self.index = 0
+        self.output_size = None
+        self.image = FakeVideoImage(size)
+
+    def set_size(self, width=-1, height=-1):
+        self.output_size = (width, height)
+
+    def get_frame(self, *args, **kw):
+        if self.index >= self.frames:
+            return None, 'eof'
+        pts = self.index / self.fps
+        self.index += 1
+        return (self.image, pts), 0.0
+
+    def close_player(self):
+        pass
+
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    return module
+
+
+def install(force=False):
+    """Registers stand-ins for pygame.mixer, ffpyplayer.player and keyboard where needed."""
+    installed = []
+
+    def missing(name):
+        if force:
+            return True
+        try:
+            importlib.import_module(name)
+            return False
+        except Exception:
+            return True
+
+    if missing("pygame"):
+        mixer = FakeMixer()
+        sys.modules["pygame"] = _module("pygame", mixer=mixer)
+        sys.modules["pygame.mixer"] = mixer
+        installed.append("pygame.mixer")
+    if missing("ffpyplayer.player"):
+        player = _module("ffpyplayer.player", MediaPlayer=FakeMediaPlayer)
+        sys.modules["ffpyplayer"] = _module("ffpyplayer", player=player)
+        sys.modules["ffpyplayer.player"] = player
+        installed.append("ffpyplayer.player")
+    if missing("keyboard"):
+        sys.modules["keyboard"] = _module("keyboard", is_pressed=lambda key: False)
+        installed.append("keyboard")
+    return installed
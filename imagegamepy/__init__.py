@@ -1 +1,2 @@
 from .game_lib import *
+from .story import compile_story, load_story, StoryGraph, StoryRunner
@@ -0,0 +1,138 @@
+import asyncio
+import functools
+
+POLL_INTERVAL = 1 / 120.0
+
+
+class AsyncStory:
+    """
+    Awaitable versions of the StoryWindow calls, for writing a story as a coroutine.
+
+    Nothing here runs a nested Tk loop: option(), dialog() and wait_key() resolve from
+    Tk callbacks, and decoding or save I/O runs on executor threads, so other tasks
+    keep running while the story waits for the player.
+    Use it through StoryWindow.run_async() or run().
+    """
+
+    def __init__(self, window, loop):
+        self.window = window
+        self.loop = loop
+        self.waiting_for_input = 0
+
+    def _future(self):
+        return self.loop.create_future()
+
+    def _wait_input(self, future):
+        self.waiting_for_input += 1
+        future.add_done_callback(lambda f: setattr(self, "waiting_for_input", self.waiting_for_input - 1))
+        return future
+
+    async def dialog(self, text, text_color="white", speed=50, position="bottom left", dialog_box_color="black"):
+        """Shows a dialog and returns once the typewriter has finished every page."""
+        future = self._future()
+        self.window.dialog(text, text_color, speed, position, dialog_box_color)
+        self.window.dialogs.when_done(lambda: future.done() or future.set_result(None))
+        await future
+
+    async def wait_key(self, sequence="<Return>"):
+        """Returns the next `sequence` key event."""
+        future = self._wait_input(self._future())
+        root = self.window.root
+
+        def on_key(event):
+            root.unbind(sequence)
+            if not future.done():
+                future.set_result(event)
+
+        root.bind(sequence, on_key)
+        try:
+            return await future
+        finally:
+            if not future.done():
+                root.unbind(sequence)
+
+    async def option(self, option_list, option_background_color='', option_list_color='', save_type='default', id='interface'):
+        """Shows an option menu and returns the result once the player has chosen; a 'json' save runs on an executor."""
+        future = self._wait_input(self._future())
+        self.window.open_options(option_list, option_background_color, option_list_color, save_type, id,
+                                 on_chosen=lambda result: future.done() or future.set_result(result), record=False)
+        result = await future
+        if save_type == 'json':
+            await self.run_in_executor(self.window.profiler.wrap("save", self.window.save_store.record), id, result)
+        return result
+
+    async def return_options(self, id=None):
+        return await self.run_in_executor(self.window.profiler.wrap("save", self.window.save_store.get), id)
+
+    async def load(self, resource_type, settings, address, l=''):
+        """Decodes `address` on the asset threads first, so load() itself only has to show it."""
+        window = self.window
+        if resource_type in ('png', 'gif'):
+            if not (isinstance(settings, list) and len(settings) == 2):
+                raise ValueError(f"For {resource_type}, settings must be a list with [scale, position].")
+            await asyncio.wrap_future(window.assets.request(address, settings[0], resource_type), loop=self.loop)
+        elif resource_type == 'audio' and not window.audio.should_stream(address, -1 if l == 'l' else 0):
+            window.audio.ensure_mixer()
+            await self.run_in_executor(window.audio.sound, address)
+        return window.load(resource_type, settings, address, l)
+
+    async def preload(self, items):
+        await asyncio.gather(*[asyncio.wrap_future(f, loop=self.loop) for f in self.window.preload(items)])
+
+    async def wait(self, ms):
+        """Sleeps on the window's clock, which is virtual in headless mode."""
+        future = self._future()
+        self.window.root.after(int(ms), lambda: future.done() or future.set_result(None))
+        await future
+
+    def run_in_executor(self, func, *args, **kw):
+        return self.loop.run_in_executor(self.window.assets.executor, functools.partial(func, *args, **kw))
+
+
+async def _pump(window, story, task, poll_interval):
+    import tkinter as tk
+
+    root = window.root
+    headless = window.backend.headless
+    while not task.done():
+        if headless:
+            # Hand out queued key events the way wait_variable() would, one per turn
+            if story.waiting_for_input:
+                if not root.events and root.input_provider is not None:
+                    root.events.extend(root.input_provider() or [])
+                if not root.events:
+                    raise RuntimeError("Headless window is waiting for input; feed() key events first.")
+                root.event_generate(root.events.pop(0))
+            root.advance(poll_interval)
+            await asyncio.sleep(0)
+        else:
+            try:
+                root.update()
+            except tk.TclError:
+                # The window was closed
+                return
+            await asyncio.sleep(poll_interval)
+
+
+def run(window, story_fn, poll_interval=POLL_INTERVAL):
+    """
+    Runs `story_fn(story)` as a coroutine while keeping the window responsive.
+
+    asyncio drives the loop: Tk events are processed every `poll_interval` seconds,
+    or the virtual clock is advanced by that much in headless mode.
+    Returns whatever the coroutine returns, or None if the window was closed first.
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        story = AsyncStory(window, loop)
+        task = loop.create_task(story_fn(story))
+        pump = loop.create_task(_pump(window, story, task, poll_interval))
+        loop.run_until_complete(asyncio.wait([task, pump], return_when=asyncio.FIRST_COMPLETED))
+        task.cancel()
+        pump.cancel()
+        loop.run_until_complete(asyncio.gather(task, pump, return_exceptions=True))
+        if not pump.cancelled() and pump.exception() is not None:
+            raise pump.exception()
+        return None if task.cancelled() else task.result()
+    finally:
+        loop.close()
@@ -0,0 +1,182 @@
+import math
+import time
+from collections import OrderedDict
+
+MIN_FRAME_DURATION = 20
+
+
+class Sprite:
+    """
+    Handle of an animated image on the canvas.
+
+    The sprite owns a single canvas item whose image is swapped when the frame changes.
+    Frames may be attached after creation, e.g. once a background decode finishes.
+    """
+
+    def __init__(self, scheduler, position, anchor="nw", photo_cache=64):
+        self.scheduler = scheduler
+        self.position = position
+        self.anchor = anchor
+        self.photo_cache = photo_cache
+        self.frames = None
+        self.durations = []
+        self.frame_index = 0
+        self.item = None
+        self.paused = False
+        self.stopped = False
+        self._photos = OrderedDict()
+        self._next_change = None
+        self._paused_at = None
+
+    def attach(self, frames, durations):
+        if self.stopped:
+            return
+        self.frames = frames
+        self.durations = [max(d or 100, MIN_FRAME_DURATION) / 1000.0 for d in durations]
+        self.frame_index = 0
+        self.item = self.scheduler.canvas.create_image(self.position[0], self.position[1],
+                                                       image=self._photo(0), anchor=self.anchor)
+        now = self.scheduler.clock()
+        self._next_change = now + self.durations[0]
+        if self.paused:
+            self._paused_at = now
+        self.scheduler._wake()
+
+    def pause(self):
+        if not self.paused and not self.stopped:
+            self.paused = True
+            self._paused_at = self.scheduler.clock()
+
+    def resume(self):
+        if self.paused and not self.stopped:
+            self.paused = False
+            if self._next_change is not None:
+                self._next_change += self.scheduler.clock() - self._paused_at
+            self._paused_at = None
+            self.scheduler._wake()
+
+    def stop(self):
+        """Stops the animation and removes it from the canvas."""
+        if self.stopped:
+            return
+        self.stopped = True
+        if self.item is not None:
+            self.scheduler.canvas.delete(self.item)
+            self.item = None
+        self._photos.clear()
+        self.scheduler._remove(self)
+
+    @property
+    def animated(self):
+        return self.frames is not None and len(self.durations) > 1
+
+    def _photo(self, index):
+        photo = self._photos.get(index)
+        if photo is None:
+            photo = self.scheduler.make_photo(self.frames[index])
+            self._photos[index] = photo
+            while len(self._photos) > self.photo_cache:
+                self._photos.popitem(last=False)
+        else:
+            self._photos.move_to_end(index)
+        return photo
+
+    def _advance(self, now):
+        """Moves to the frame that should be visible at `now`. Returns True if it changed."""
+        if self.paused or not self.animated or now < self._next_change:
+            return False
+        index = self.frame_index
+        # Skip frames we are too late for instead of playing them back to back
+        while now >= self._next_change:
+            index = (index + 1) % len(self.durations)
+            self._next_change += self.durations[index]
+        if index == self.frame_index:
+            return False
+        self.frame_index = index
+        self.scheduler.canvas.itemconfig(self.item, image=self._photo(index))
+        prefetch = getattr(self.frames, 'prefetch', None)
+        if prefetch is not None and self.scheduler.executor is not None:
+            prefetch((index + 1) % len(self.durations), self.scheduler.executor)
+        return True
+
+
+class AnimationScheduler:
+    """
+    Drives every animated sprite from one `after` chain.
+
+    The next tick is scheduled for the earliest pending frame change, so nothing runs
+    while all sprites are paused or static.
+
+    :param root: Tk root used for scheduling.
+    :param canvas: Canvas the sprites are drawn on.
+    :param make_photo: Callable turning a PIL image into something the canvas can show.
+    :param executor: Optional executor used to decode upcoming frames of lazy animations.
+    :param min_tick: Shortest delay between two ticks in milliseconds.
+    :param clock: Time source in seconds, time.monotonic unless the window runs on a virtual clock.
+    """
+
+    def __init__(self, root, canvas, make_photo, executor=None, min_tick=10, clock=time.monotonic):
+        self.root = root
+        self.clock = clock
+        self.canvas = canvas
+        self.make_photo = make_photo
+        self.executor = executor
+        self.min_tick = min_tick
+        self.sprites = []
+        self._job = None
+        self._job_due = None
+
+    def add(self, position, frames=None, durations=None, anchor="nw"):
+        sprite = Sprite(self, position, anchor)
+        self.sprites.append(sprite)
+        if frames is not None:
+            sprite.attach(frames, durations or [100] * len(frames))
+        return sprite
+
+    def pause_all(self):
+        for sprite in self.sprites:
+            sprite.pause()
+
+    def resume_all(self):
+        for sprite in self.sprites:
+            sprite.resume()
+
+    def stop_all(self):
+        for sprite in list(self.sprites):
+            sprite.stop()
+
+    def _remove(self, sprite):
+        if sprite in self.sprites:
+            self.sprites.remove(sprite)
+        if not self.sprites and self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def _wake(self):
+        due = self._next_due()
+        if due is None:
+            return
+        if self._job is not None:
+            if self._job_due <= due:
+                return
+            self.root.after_cancel(self._job)
+        self._schedule(due)
+
+    def _next_due(self):
+        dues = [s._next_change for s in self.sprites if s.animated and not s.paused]
+        return min(dues) if dues else None
+
+    def _schedule(self, due):
+        # Rounded up: a tick that comes a fraction of a millisecond early changes nothing and waits min_tick more
+        delay = max(int(math.ceil((due - self.clock()) * 1000)), self.min_tick)
+        self._job_due = due
+        self._job = self.root.after(delay, self._tick)
+
+    def _tick(self):
+        self._job = None
+        now = self.clock()
+        for sprite in list(self.sprites):
+            sprite._advance(now)
+        due = self._next_due()
+        if due is not None:
+            self._schedule(due)
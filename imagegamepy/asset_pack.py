@@ -0,0 +1,316 @@
+"""
+Prebaked asset packs.
+
+A pack holds backgrounds, sprites and GIF frames already decoded and scaled to the
+sizes a story uses, as raw 4-byte-per-pixel planes (RGBA, or RGBX for opaque images)
+so Pillow can map them straight out of the file. Layout:
+
+    8 bytes   magic b"IGPACK1\\0"
+    4 bytes   little-endian length of the JSON index
+    ...       JSON index
+    ...       planes, each aligned to PLANE_ALIGN bytes; index offsets count from the
+              first aligned byte after the index
+
+Build one with `imagegamepy-pack story.json --size 1280x720`.
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from PIL import Image
+
+from .assets import DecodedAsset, decode_image
+from .background import BackgroundSource, warm_image
+
+MAGIC = b"IGPACK1\0"
+PLANE_ALIGN = 64
+PACK_KINDS = ('background', 'png', 'gif')
+
+
+def _align(offset):
+    return (offset + PLANE_ALIGN - 1) // PLANE_ALIGN * PLANE_ALIGN
+
+
+def source_hash(address):
+    digest = hashlib.sha1()
+    with open(address, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stat(address):
+    st = os.stat(address)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def entry_name(kind, source, size, warm=0):
+    return "%s:%s:%dx%d:%d" % (kind, source.replace(os.sep, "/"), size[0], size[1], warm)
+
+
+class PackEntry:
+    """One image (or GIF frame sequence) to put in a pack."""
+
+    def __init__(self, kind, address, size, warm=0):
+        if kind not in PACK_KINDS:
+            raise ValueError("Unsupported pack entry kind: " + str(kind))
+        self.kind = kind
+        self.address = address
+        self.size = (int(size[0]), int(size[1]))
+        self.warm = warm
+
+
+def _plane(image):
+    if image.mode != "RGBA":
+        image = image.convert("RGBA") if "A" in image.getbands() or image.info.get("transparency") is not None \
+            else image.convert("RGB").convert("RGBX")
+    return image.mode, image.tobytes()
+
+
+def render_entry(entry):
+    """Decodes and scales `entry`. Returns (planes, durations), planes being (mode, bytes) pairs."""
+    if entry.kind == 'background':
+        image = BackgroundSource.open(entry.address, entry.size).resize(entry.size)
+        return [_plane(warm_image(image, entry.warm))], [0]
+    asset = decode_image(entry.address, entry.size, entry.kind)
+    frames = [asset.frames[i] for i in range(len(asset.durations))]
+    return [_plane(frame) for frame in frames], list(asset.durations)
+
+
+def entries_from_story(graph, size, warm=False):
+    """Pack entries for every background and image asset of a StoryGraph, backgrounds at `size`."""
+    entries = []
+    for scene in graph.scenes:
+        if scene.background:
+            entries.append(PackEntry('background', scene.background, size))
+            if warm and scene.warm:
+                entries.append(PackEntry('background', scene.background, size, scene.warm))
+        for asset in scene.assets:
+            if asset["type"] in ('png', 'gif'):
+                entries.append(PackEntry(asset["type"], asset["address"], asset["settings"][0]))
+    return entries
+
+
+def build_pack(entries, output, log=None):
+    """
+    Writes `entries` into the pack file `output`.
+
+    Entries whose source hash and target size match the existing pack are copied
+    from it instead of being decoded again. Returns (built, reused) counts.
+    """
+    base_dir = os.path.dirname(os.path.abspath(output))
+    old = None
+    if os.path.exists(output):
+        try:
+            old = AssetPack(output)
+        except ValueError:
+            old = None
+    index = {}
+    blobs = []
+    built = reused = 0
+    hashes = {}
+    for entry in entries:
+        source = os.path.relpath(os.path.abspath(entry.address), base_dir)
+        name = entry_name(entry.kind, source, entry.size, entry.warm)
+        if name in index:
+            continue
+        if entry.address not in hashes:
+            hashes[entry.address] = source_hash(entry.address)
+        previous = old.entries.get(name) if old is not None else None
+        if previous is not None and previous["hash"] == hashes[entry.address]:
+            planes = [(previous["mode"], old.plane_bytes(frame)) for frame in previous["frames"]]
+            durations = previous["durations"]
+            reused += 1
+        else:
+            planes, durations = render_entry(entry)
+            built += 1
+            if log is not None:
+                log("built " + name)
+        index[name] = {
+            "kind": entry.kind, "source": source, "size": list(entry.size), "warm": entry.warm,
+            "hash": hashes[entry.address], "stat": _stat(entry.address), "mode": planes[0][0],
+            "durations": durations, "frames": [],
+        }
+        blobs.append((name, planes))
+    if old is not None:
+        old.close()
+
+    offset = 0
+    for name, planes in blobs:
+        for _, data in planes:
+            index[name]["frames"].append([offset, len(data)])
+            offset = _align(offset + len(data))
+    header = json.dumps({"version": 1, "entries": index}).encode("utf-8")
+    data_start = _align(len(MAGIC) + 4 + len(header))
+
+    tmp = output + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header)))
+        f.write(header)
+        for name, planes in blobs:
+            for (_, data), (start, _) in zip(planes, index[name]["frames"]):
+                f.seek(data_start + start)
+                f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, output)
+    return built, reused
+
+
+class AssetPack:
+    """
+    Read-only view of a pack file through mmap.
+
+    Images returned by image() and asset() share memory with the mapping, so they
+    cost no decode, no resize and no copy. An entry is ignored once its source file
+    has changed on disk, and the regular decoding path takes over.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.base_dir = os.path.dirname(os.path.abspath(path))
+        self._file = open(path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("Empty asset pack: " + path)
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("Not an imagegamepy asset pack: " + path)
+        (length,) = struct.unpack_from("<I", self._map, len(MAGIC))
+        start = len(MAGIC) + 4
+        self.entries = json.loads(self._map[start:start + length].decode("utf-8"))["entries"]
+        self.data_start = _align(start + length)
+        self._view = memoryview(self._map)
+        self._by_source = {}
+        for entry in self.entries.values():
+            address = os.path.normpath(os.path.join(self.base_dir, entry["source"]))
+            self._by_source[(entry["kind"], address, tuple(entry["size"]), entry["warm"])] = entry
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def plane_bytes(self, frame):
+        offset, length = frame
+        offset += self.data_start
+        return self._map[offset:offset + length]
+
+    def image(self, entry, index=0):
+        offset, length = entry["frames"][index]
+        offset += self.data_start
+        mode = entry["mode"]
+        return Image.frombuffer(mode, tuple(entry["size"]), self._view[offset:offset + length], "raw", mode, 0, 1)
+
+    def lookup(self, kind, address, size, warm=0):
+        """The entry for `address` at `size`, or None if it is missing or its source has changed."""
+        path = os.path.normpath(os.path.abspath(address))
+        entry = self._by_source.get((kind, path, tuple(int(v) for v in size), warm))
+        if entry is not None:
+            try:
+                fresh = _stat(path) == entry["stat"]
+            except OSError:
+                fresh = False
+            if not fresh:
+                entry = None
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def asset(self, address, scale, resource_type='png'):
+        """A DecodedAsset backed by the pack, as AssetManager.request() would produce, or None."""
+        entry = self.lookup(resource_type, address, scale)
+        if entry is None:
+            return None
+        frames = [self.image(entry, i) for i in range(len(entry["frames"]))]
+        key = (os.path.abspath(address), "pack", tuple(scale))
+        return DecodedAsset(key, frames, entry["durations"], resource_type, nbytes=0)
+
+    def background(self, address, size, cache=None):
+        """
+        A background source using the packed resize of `address` at `size`, or None.
+
+        Packed warm variants of the same size are put into `cache` too.
+        """
+        entry = self.lookup('background', address, size)
+        if entry is None:
+            return None
+        source = PackedBackground(address, self.image(entry).convert("RGB"))
+        if cache is not None:
+            self.prime(source, size, cache)
+        return source
+
+    def prime(self, source, size, cache):
+        """Puts the packed background `source` and its packed warm variants at `size` into `cache`."""
+        cache.prime(source, size, source.image)
+        for (kind, path, packed_size, warm), variant in self._by_source.items():
+            if warm and kind == 'background' and packed_size == tuple(size) and path == os.path.normpath(os.path.abspath(source.address)):
+                cache.prime(source, size, self.image(variant).convert("RGB"), warm)
+
+    def close(self):
+        try:
+            self._view.release()
+            self._map.close()
+        except (BufferError, AttributeError):
+            # Images still point into the mapping; it goes away with them
+            pass
+        self._file.close()
+
+
+class PackedBackground(BackgroundSource):
+    """A background whose packed resize is used as is; other sizes decode the source file."""
+
+    def __init__(self, address, image):
+        self.key = ("file", os.path.abspath(address), os.path.getmtime(address))
+        self.address = address
+        self.drafted = False
+        self.levels = [image]
+        self.packed_size = image.size
+        self._decoded = False
+
+    def resize(self, size):
+        if tuple(size) == self.packed_size and not self._decoded:
+            return self.levels[0]
+        if not self._decoded:
+            self._decoded = True
+            self.drafted = True
+            self._build_pyramid(self.levels[0])
+        return BackgroundSource.resize(self, size)
+
+
+def _parse_size(text):
+    try:
+        width, height = text.lower().split("x")
+        return int(width), int(height)
+    except ValueError:
+        raise argparse.ArgumentTypeError("sizes look like 1280x720")
+
+
+def main(argv=None):
+    from .story import load_story
+
+    parser = argparse.ArgumentParser(prog="imagegamepy-pack",
+                                     description="Prebake the backgrounds, sprites and GIF frames of a story into an asset pack.")
+    parser.add_argument("story", help="story JSON file")
+    parser.add_argument("--size", type=_parse_size, default=(800, 600), help="window size the backgrounds are baked at")
+    parser.add_argument("--output", "-o", help="pack file, by default next to the story with a .igpack extension")
+    parser.add_argument("--warm", action="store_true", help="also bake the warm-graded variant of each scene background")
+    args = parser.parse_args(argv)
+
+    output = args.output or os.path.splitext(args.story)[0] + ".igpack"
+    entries = entries_from_story(load_story(args.story), args.size, args.warm)
+    built, reused = build_pack(entries, output, log=print)
+    print("%s: %d entries built, %d reused" % (output, built, reused))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
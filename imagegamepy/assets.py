@@ -0,0 +1,201 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, Future
+from PIL import Image, ImageSequence
+
+from .profiler import NULL_PROFILER
+
+IMAGE_FORMATS = ['png', 'jpg', 'jpeg']
+LAZY_GIF_FRAMES = 24
+
+
+class DecodedAsset:
+    """Decoded and scaled frames of an image file, ready to be turned into PhotoImages."""
+
+    def __init__(self, key, frames, durations, image_format, nbytes=None):
+        self.key = key
+        self.frames = frames
+        self.durations = durations
+        self.format = image_format
+        if nbytes is None:
+            nbytes = sum(f.size[0] * f.size[1] * len(f.getbands()) for f in frames)
+        self.nbytes = nbytes
+
+
+class LazyFrames:
+    """
+    Frames of a long GIF, decoded and scaled only when they are first asked for.
+
+    GIF frames are stored as deltas, so decoding is cheapest in playback order.
+    Only the last `cache_size` scaled frames are kept.
+    """
+
+    def __init__(self, address, scale, cache_size=16):
+        self.address = address
+        self.scale = tuple(scale)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._img = Image.open(address)
+        self.durations = []
+        for frame in ImageSequence.Iterator(self._img):
+            self.durations.append(frame.info.get('duration') or 100)
+        self._img.seek(0)
+
+    @property
+    def nbytes(self):
+        return self.cache_size * self.scale[0] * self.scale[1] * 4
+
+    def __len__(self):
+        return len(self.durations)
+
+    def __getitem__(self, index):
+        with self._lock:
+            frame = self.cache.get(index)
+            if frame is not None:
+                self.cache.move_to_end(index)
+                return frame
+            self._img.seek(index)
+            frame = self._img.convert('RGBA').resize(self.scale, Image.LANCZOS)
+            self.cache[index] = frame
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+            return frame
+
+    def prefetch(self, index, executor):
+        """Decodes `index` on `executor` so it is cached before it is shown."""
+        if index not in self.cache:
+            executor.submit(self.__getitem__, index)
+
+
+def asset_key(address, scale):
+    return (os.path.abspath(address), os.path.getmtime(address), tuple(scale))
+
+
+def open_image(address, resource_type='png'):
+    """
+    Opens `address` and checks its format. Only the header is read, so this is cheap
+    enough to run on the Tk thread before the decode is handed to the asset threads.
+    """
+    try:
+        img = Image.open(address)
+    except Exception as e:
+        raise ValueError("Cannot open image file: " + str(e))
+    if resource_type == 'png' and (img.format or '').lower() not in IMAGE_FORMATS:
+        img.close()
+        raise ValueError("File format not supported for png. Supported: png, jpg, jpeg.")
+    return img
+
+
+def decode_image(address, scale, resource_type='png'):
+    """Opens `address` and resizes it (and every GIF frame) to `scale`."""
+    img = open_image(address, resource_type)
+    image_format = (img.format or '').lower()
+    scale = tuple(scale)
+    frames, durations = [], []
+    if resource_type == 'gif' and getattr(img, 'n_frames', 1) > LAZY_GIF_FRAMES:
+        frames = LazyFrames(address, scale)
+        return DecodedAsset(asset_key(address, scale), frames, frames.durations, image_format, frames.nbytes)
+    if resource_type == 'gif':
+        try:
+            for frame in ImageSequence.Iterator(img):
+                durations.append(frame.info.get('duration') or 100)
+                frames.append(frame.convert('RGBA').resize(scale, Image.LANCZOS))
+        except Exception:
+            frames, durations = [], []
+    if not frames:
+        img.seek(0)
+        frames = [img.resize(scale, Image.LANCZOS)]
+        durations = [img.info.get('duration') or 100]
+    return DecodedAsset(asset_key(address, scale), frames, durations, image_format)
+
+
+class AssetManager:
+    """
+    Decodes and scales images on a thread pool and keeps the results in an LRU cache.
+
+    Entries are keyed by (path, mtime, scale), so an edited file is decoded again.
+    Images found in `pack` (an AssetPack) are served from it without decoding.
+    The cache is trimmed to `memory_budget` bytes of decoded pixels.
+
+    :param max_workers: Number of decoding threads.
+    :param memory_budget: Maximum size of the decoded pixels kept in the cache, in bytes.
+    """
+
+    def __init__(self, max_workers=4, memory_budget=256 * 1024 * 1024):
+        self.memory_budget = memory_budget
+        self.pack = None
+        self.profiler = NULL_PROFILER
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="imagegamepy-assets")
+        self.cache = OrderedDict()
+        self.pending = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def request(self, address, scale, resource_type='png'):
+        """Returns a Future for the decoded asset. Cached assets come back already resolved."""
+        try:
+            key = asset_key(address, scale)
+        except OSError as e:
+            raise ValueError("Cannot open image file: " + str(e))
+        if self.pack is not None:
+            asset = self.pack.asset(address, scale, resource_type)
+            if asset is not None:
+                future = Future()
+                future.set_result(asset)
+                return future
+        with self._lock:
+            asset = self.cache.get(key)
+            if asset is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                future = Future()
+                future.set_result(asset)
+                return future
+            future = self.pending.get(key)
+            if future is not None:
+                self.hits += 1
+                return future
+            self.misses += 1
+            future = self.executor.submit(self.profiler.wrap("decode", decode_image), address, scale, resource_type)
+            self.pending[key] = future
+        future.add_done_callback(lambda f, key=key: self._store(key, f))
+        return future
+
+    def get(self, address, scale, resource_type='png'):
+        """Blocking version of `request`."""
+        return self.request(address, scale, resource_type).result()
+
+    def preload(self, items):
+        """
+        Starts decoding assets in the background.
+
+        :param items: Iterable of (resource_type, scale, address) tuples.
+        :return: List of Futures, in the same order.
+        """
+        return [self.request(address, scale, resource_type) for resource_type, scale, address in items]
+
+    def _store(self, key, future):
+        with self._lock:
+            self.pending.pop(key, None)
+            if future.cancelled() or future.exception() is not None:
+                return
+            asset = future.result()
+            if key in self.cache:
+                return
+            self.cache[key] = asset
+            self.nbytes += asset.nbytes
+            while self.nbytes > self.memory_budget and len(self.cache) > 1:
+                _, evicted = self.cache.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+            self.nbytes = 0
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,288 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+STREAM_THRESHOLD = 1024 * 1024
+LOOP_PRIORITY = 1
+
+
+def sound_key(address):
+    return (os.path.abspath(address), os.path.getmtime(address))
+
+
+class SoundHandle:
+    """A sound effect playing on one channel of the pool."""
+
+    def __init__(self, manager, channel_id, sound, address):
+        self.manager = manager
+        self.channel_id = channel_id
+        self.sound = sound
+        self.address = address
+
+    @property
+    def playing(self):
+        return self.manager.owner(self.channel_id) is self
+
+    def set_volume(self, volume):
+        if self.playing:
+            self.manager.channel(self.channel_id).set_volume(volume / 100.0)
+
+    def stop(self, fade_ms=0):
+        if not self.playing:
+            return
+        channel = self.manager.channel(self.channel_id)
+        if fade_ms:
+            channel.fadeout(fade_ms)
+        else:
+            channel.stop()
+
+
+class MusicHandle:
+    """A track streamed through mixer.music. Only the latest music handle is live."""
+
+    def __init__(self, manager, address, volume):
+        self.manager = manager
+        self.address = address
+        self.volume = volume
+
+    @property
+    def playing(self):
+        return self.manager.music is self and (self.manager.music_pending or self.manager.mixer.music.get_busy())
+
+    def set_volume(self, volume):
+        self.volume = volume
+        if self.manager.music is self:
+            self.manager.mixer.music.set_volume(volume / 100.0)
+
+    def stop(self, fade_ms=0):
+        if self.manager.music is self:
+            self.manager.stop_music(fade_ms)
+
+    def crossfade(self, address, volume=None, duration=1000, loops=-1):
+        """Fades this track out and `address` in. Returns the new MusicHandle."""
+        return self.manager.play_music(address, self.volume if volume is None else volume, loops, duration)
+
+
+class AudioManager:
+    """
+    Plays sound effects from a bounded cache of decoded Sounds and streams long tracks.
+
+    Sound effects are decoded once and kept in an LRU cache trimmed to `memory_budget`
+    bytes of PCM. They play on a fixed pool of channels; when every channel is busy, the
+    oldest sound with a lower or equal priority is stopped to make room. Looping sounds
+    default to LOOP_PRIORITY, so one-shot effects cannot steal an ambience loop's channel.
+    Long looping tracks go through mixer.music, which decodes them while playing
+    instead of holding the whole track in memory.
+
+    pygame is only imported, and the mixer initialised, when the first sound is played or preloaded.
+
+    :param mixer: The pygame.mixer module, or None to import it on first use.
+    :param root: Tk root (or headless root) used to schedule fades.
+    :param executor: Optional executor used by preload().
+    :param channels: Size of the channel pool.
+    :param memory_budget: Maximum size of the decoded sounds kept in the cache, in bytes.
+    :param stream_threshold: Looping files at least this large (in bytes) are streamed.
+    """
+
+    def __init__(self, mixer, root, executor=None, channels=16, memory_budget=64 * 1024 * 1024,
+                 stream_threshold=STREAM_THRESHOLD):
+        self.mixer = mixer
+        self.root = root
+        self.executor = executor
+        self.num_channels = channels
+        self.memory_budget = memory_budget
+        self.stream_threshold = stream_threshold
+        self.cache = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stolen = 0
+        self.dropped = 0
+        self.music = None
+        self.music_pending = False
+        self._music_job = None
+        self._channels = {}
+        self._owners = {}
+        self._lock = threading.Lock()
+
+    def ensure_mixer(self):
+        if self.mixer is None:
+            try:
+                from pygame import mixer
+            except ImportError:
+                raise ImportError("pygame is required for audio playback.")
+            self.mixer = mixer
+        if not self.mixer.get_init():
+            self.mixer.init()
+            self.mixer.set_num_channels(self.num_channels)
+        return self.mixer
+
+    def channel(self, channel_id):
+        channel = self._channels.get(channel_id)
+        if channel is None:
+            channel = self._channels[channel_id] = self.mixer.Channel(channel_id)
+        return channel
+
+    def owner(self, channel_id):
+        """The SoundHandle still playing on `channel_id`, if any."""
+        owner = self._owners.get(channel_id)
+        if owner is None:
+            return None
+        channel = self.channel(channel_id)
+        if not channel.get_busy() or channel.get_sound() is not owner[2].sound:
+            return None
+        return owner[2]
+
+    def _sound_size(self, sound):
+        frequency, size, channels = self.mixer.get_init()
+        return int(sound.get_length() * frequency) * channels * (abs(size) // 8)
+
+    def sound(self, address):
+        """Returns the decoded Sound for `address`, decoding it on a cache miss."""
+        self.ensure_mixer()
+        key = sound_key(address)
+        with self._lock:
+            sound = self.cache.get(key)
+            if sound is not None:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return sound
+            self.misses += 1
+        sound = self.mixer.Sound(address)
+        self._store(key, sound)
+        return sound
+
+    def _store(self, key, sound):
+        with self._lock:
+            if key in self.cache:
+                return
+            self.cache[key] = sound
+            self.nbytes += self._sound_size(sound)
+            while self.nbytes > self.memory_budget and len(self.cache) > 1:
+                _, evicted = self.cache.popitem(last=False)
+                self.nbytes -= self._sound_size(evicted)
+
+    def preload(self, addresses):
+        """
+        Decodes sound effects ahead of time.
+
+        :param addresses: Iterable of audio file paths.
+        :return: List of Futures resolving to the Sounds, in the same order.
+        """
+        self.ensure_mixer()
+        futures = []
+        for address in addresses:
+            if self.executor is not None:
+                futures.append(self.executor.submit(self.sound, address))
+            else:
+                future = Future()
+                future.set_result(self.sound(address))
+                futures.append(future)
+        return futures
+
+    def should_stream(self, address, loops):
+        """
+        Whether a long looping file goes through mixer.music. That is a single stream, so while
+        another track plays there the file is decoded and played on a channel instead.
+        """
+        return loops == -1 and not self.music_busy() and os.path.getsize(address) >= self.stream_threshold
+
+    def music_busy(self):
+        return self.music is not None and self.music.playing
+
+    def play(self, address, volume=100, loops=0, priority=None, fade_ms=0):
+        """
+        Plays `address` from the sound cache on a free channel of the pool.
+
+        :param priority: Defaults to LOOP_PRIORITY for endless loops (`loops=-1`) and 0 otherwise.
+        :return: A SoundHandle, or None when every channel holds a higher priority sound.
+        """
+        if priority is None:
+            priority = LOOP_PRIORITY if loops == -1 else 0
+        sound = self.sound(address)
+        channel_id = self._free_channel(priority)
+        if channel_id is None:
+            self.dropped += 1
+            return None
+        channel = self.channel(channel_id)
+        channel.play(sound, loops=loops, fade_ms=fade_ms)
+        channel.set_volume(volume / 100.0)
+        handle = SoundHandle(self, channel_id, sound, address)
+        self._owners[channel_id] = (priority, time.monotonic(), handle)
+        return handle
+
+    def _free_channel(self, priority):
+        victim = None
+        for channel_id in range(self.num_channels):
+            if self.owner(channel_id) is None:
+                return channel_id
+            owner = self._owners[channel_id]
+            if owner[0] <= priority and (victim is None or owner[:2] < self._owners[victim][:2]):
+                victim = channel_id
+        if victim is not None:
+            self.channel(victim).stop()
+            self.stolen += 1
+        return victim
+
+    def play_music(self, address, volume=100, loops=-1, fade_ms=0):
+        """
+        Streams `address` through mixer.music.
+
+        mixer.music has a single stream, so when a track is already playing it is faded
+        out over `fade_ms` before the new one fades in over the same time.
+        """
+        mixer = self.ensure_mixer()
+        if self._music_job is not None:
+            self.root.after_cancel(self._music_job)
+            self._music_job = None
+        handle = MusicHandle(self, address, volume)
+        self.music = handle
+        if fade_ms and mixer.music.get_busy():
+            mixer.music.fadeout(fade_ms)
+            self.music_pending = True
+            self._music_job = self.root.after(fade_ms, self._start_music, handle, loops, fade_ms)
+        else:
+            self._start_music(handle, loops, fade_ms)
+        return handle
+
+    def _start_music(self, handle, loops, fade_ms):
+        self._music_job = None
+        self.music_pending = False
+        if self.music is not handle:
+            return
+        self.mixer.music.load(handle.address)
+        self.mixer.music.set_volume(handle.volume / 100.0)
+        self.mixer.music.play(loops=loops, fade_ms=fade_ms)
+
+    def stop_music(self, fade_ms=0):
+        if self._music_job is not None:
+            self.root.after_cancel(self._music_job)
+            self._music_job = None
+        self.music_pending = False
+        self.music = None
+        if self.mixer is None or not self.mixer.get_init():
+            return
+        if fade_ms:
+            self.mixer.music.fadeout(fade_ms)
+        else:
+            self.mixer.music.stop()
+
+    def stop_all(self, fade_ms=0):
+        self.stop_music(fade_ms)
+        if self.mixer is None or not self.mixer.get_init():
+            return
+        if fade_ms:
+            self.mixer.fadeout(fade_ms)
+        else:
+            self.mixer.stop()
+
+    def stats(self):
+        return {"cached": len(self.cache), "nbytes": self.nbytes, "hits": self.hits, "misses": self.misses,
+                "stolen": self.stolen, "dropped": self.dropped}
+
+    def clear(self):
+        with self._lock:
+            self.cache.clear()
+            self.nbytes = 0
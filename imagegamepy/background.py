@@ -0,0 +1,143 @@
+import os
+from collections import OrderedDict
+from PIL import Image
+
+from .grading import Grade, grade_image
+from .profiler import NULL_PROFILER
+
+PYRAMID_MIN_SIZE = 256
+
+
+def warm_image(image, warm):
+    """Blends `image` towards red (warm > 0) or blue (warm < 0) by abs(warm) percent."""
+    if warm == 0:
+        return image
+    return grade_image(image, Grade(warm=warm))
+
+
+class BackgroundSource:
+    """
+    A decoded background and its downsampled pyramid.
+
+    Level 0 is the decoded source, every next level is half the size of the previous one.
+    Resizes start from the smallest level that is still at least as large as the target.
+    """
+
+    def __init__(self, image, key, address=None, drafted=False):
+        self.key = key
+        self.address = address
+        self.drafted = drafted
+        self.levels = []
+        self._build_pyramid(image.convert("RGB"))
+
+    @classmethod
+    def open(cls, address, target_size=None):
+        try:
+            img = Image.open(address)
+            drafted = False
+            if target_size and img.format == "JPEG":
+                full_size = img.size
+                # Let the JPEG decoder skip the detail we would throw away anyway
+                img.draft("RGB", target_size)
+                drafted = img.size != full_size
+            img.load()
+        except Exception as e:
+            raise ValueError("Invalid background image address: " + str(e))
+        key = ("file", os.path.abspath(address), os.path.getmtime(address))
+        return cls(img, key, address, drafted)
+
+    @classmethod
+    def from_color(cls, size, color):
+        return cls(Image.new("RGB", size, color), ("color", color, tuple(size)))
+
+    @property
+    def image(self):
+        return self.levels[0]
+
+    def _build_pyramid(self, image):
+        self.levels = [image]
+        while min(self.levels[-1].size) // 2 >= PYRAMID_MIN_SIZE:
+            self.levels.append(self.levels[-1].reduce(2))
+
+    def ensure(self, size):
+        """Decodes the file again at full resolution if a drafted source is too small for `size`."""
+        w, h = self.levels[0].size
+        if self.drafted and (size[0] > w or size[1] > h):
+            img = Image.open(self.address)
+            img.load()
+            self.drafted = False
+            self._build_pyramid(img.convert("RGB"))
+
+    def level_for(self, size):
+        for level in reversed(self.levels):
+            if level.size[0] >= size[0] and level.size[1] >= size[1]:
+                return level
+        return self.levels[0]
+
+    def resize(self, size):
+        self.ensure(size)
+        level = self.level_for(size)
+        if level.size == tuple(size):
+            return level.copy()
+        return level.resize(size, Image.LANCZOS)
+
+
+class BackgroundCache:
+    """
+    Bounded LRU cache of resized and graded backgrounds keyed by (source, size, grade key).
+
+    The ungraded resize is cached under key 0, so a grade change only re-grades it.
+    Plain warm values are grade keys too.
+    """
+
+    def __init__(self, max_entries=12):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.profiler = NULL_PROFILER
+
+    def _get(self, key):
+        image = self.entries.get(key)
+        if image is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+        return image
+
+    def _put(self, key, image):
+        self.entries[key] = image
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def base(self, source, size):
+        """The ungraded resize of `source` at `size`."""
+        size = (max(int(size[0]), 1), max(int(size[1]), 1))
+        base_key = (source.key, size, 0)
+        base = self._get(base_key)
+        if base is None:
+            with self.profiler.span("resize"):
+                base = source.resize(size)
+            self._put(base_key, base)
+        return base
+
+    def get(self, source, size, warm, apply_warm):
+        if warm == 0:
+            return self.base(source, size)
+        size = (max(int(size[0]), 1), max(int(size[1]), 1))
+        key = (source.key, size, warm)
+        image = self._get(key)
+        if image is not None:
+            return image
+        image = apply_warm(self.base(source, size), warm)
+        self._put(key, image)
+        return image
+
+    def prime(self, source, size, image, warm=0):
+        """Stores a resize of `source` made elsewhere, e.g. by a prefetch thread or an asset pack."""
+        self._put((source.key, tuple(size), warm), image)
+
+    def clear(self):
+        self.entries.clear()
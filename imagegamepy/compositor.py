@@ -0,0 +1,257 @@
+from PIL import Image, ImageChops, ImageColor
+
+LAYERS = ("background", "noise", "sprites", "video")
+FULL_FRAME_RATIO = 0.5
+
+
+def _intersect(a, b):
+    box = (max(a[0], b[0]), max(a[1], b[1]), min(a[2], b[2]), min(a[3], b[3]))
+    return box if box[0] < box[2] and box[1] < box[3] else None
+
+
+def _area(box):
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+def merge_boxes(boxes, size):
+    """Merges overlapping boxes; falls back to the whole frame when that is cheaper."""
+    frame = (0, 0, size[0], size[1])
+    pending = [b for b in (_intersect(box, frame) for box in boxes) if b]
+    merged = []
+    while pending:
+        box = pending.pop()
+        changed = True
+        while changed:
+            changed = False
+            for other in list(pending):
+                if _intersect((box[0] - 1, box[1] - 1, box[2] + 1, box[3] + 1), other):
+                    box = (min(box[0], other[0]), min(box[1], other[1]), max(box[2], other[2]), max(box[3], other[3]))
+                    pending.remove(other)
+                    changed = True
+        merged.append(box)
+    if sum(_area(b) for b in merged) > FULL_FRAME_RATIO * _area(frame):
+        return [frame]
+    return merged
+
+
+class LayerItem:
+    def __init__(self, image, position, mode):
+        self.image = image
+        self.position = position
+        self.mode = mode
+
+    @property
+    def box(self):
+        x, y = int(self.position[0]), int(self.position[1])
+        return (x, y, x + self.image.size[0], y + self.image.size[1])
+
+
+class Layer:
+    def __init__(self, name):
+        self.name = name
+        self.items = {}
+        self.dirty = []
+
+
+class LayeredCompositor:
+    """
+    Composites the StoryWindow layers (background, noise, sprites, video)
+    into one RGB frame, recomputing only dirty rectangles.
+
+    Every non-empty layer keeps a flattened copy of itself and everything below it,
+    so a change in the video layer never re-blends the background or the noise.
+
+    Item modes: 'replace' pastes the image, 'over' uses its alpha, 'add' adds it.
+    """
+
+    def __init__(self, size, background_color=(0, 0, 0), on_dirty=None):
+        self.size = tuple(size)
+        if isinstance(background_color, str):
+            background_color = ImageColor.getrgb(background_color)[:3]
+        self.background_color = background_color
+        self.on_dirty = on_dirty
+        self.layers = [Layer(name) for name in LAYERS]
+        self._by_name = dict((layer.name, layer) for layer in self.layers)
+        self._flat = {}
+        self._active = ()
+        self._keys = 0
+        self.frame = Image.new("RGB", self.size, background_color)
+        self.composed_area = 0
+
+    def layer(self, name):
+        return self._by_name[name]
+
+    def new_key(self):
+        self._keys += 1
+        return self._keys
+
+    def set(self, layer_name, key, image, position=(0, 0), mode="over"):
+        layer = self._by_name[layer_name]
+        old = layer.items.get(key)
+        if old is not None:
+            layer.dirty.append(old.box)
+        item = LayerItem(image, position, mode)
+        layer.items[key] = item
+        layer.dirty.append(item.box)
+        self._changed()
+
+    def move(self, layer_name, key, position):
+        item = self._by_name[layer_name].items.get(key)
+        if item is not None:
+            self.set(layer_name, key, item.image, position, item.mode)
+
+    def remove(self, layer_name, key):
+        layer = self._by_name[layer_name]
+        old = layer.items.pop(key, None)
+        if old is not None:
+            layer.dirty.append(old.box)
+            self._changed()
+
+    def clear(self, layer_name):
+        for key in list(self._by_name[layer_name].items):
+            self.remove(layer_name, key)
+
+    def invalidate(self, box=None):
+        self.layers[0].dirty.append(box or (0, 0) + self.size)
+        self._changed()
+
+    def resize(self, size):
+        self.size = tuple(size)
+        self._flat = {}
+        self._active = ()
+        self.frame = Image.new("RGB", self.size, self.background_color)
+        self.invalidate()
+
+    @property
+    def is_dirty(self):
+        return any(layer.dirty for layer in self.layers)
+
+    def _changed(self):
+        if self.on_dirty is not None:
+            self.on_dirty()
+
+    def compose(self):
+        """Brings `frame` up to date and returns the boxes that changed."""
+        active = tuple(i for i, layer in enumerate(self.layers) if layer.items)
+        if active != self._active:
+            # A layer appeared or went empty: the flattened caches no longer line up
+            self._active = active
+            self._flat = dict((i, Image.new("RGB", self.size, self.background_color)) for i in active[:-1])
+            for layer in self.layers:
+                layer.dirty = []
+            self.layers[0].dirty.append((0, 0) + self.size)
+        changed = []
+        below = None
+        for i, layer in enumerate(self.layers):
+            changed = merge_boxes(changed + layer.dirty, self.size) if layer.dirty else changed
+            layer.dirty = []
+            if i not in active:
+                continue
+            target = self._flat.get(i, self.frame)
+            for box in changed:
+                if below is None:
+                    target.paste(self.background_color, box)
+                else:
+                    target.paste(below.crop(box), box[:2])
+                for item in layer.items.values():
+                    self._draw(target, item, box)
+            below = target
+        if not active:
+            for box in changed:
+                self.frame.paste(self.background_color, box)
+        self.composed_area = sum(_area(box) for box in changed)
+        return changed
+
+    def _draw(self, target, item, box):
+        item_box = item.box
+        clip = _intersect(item_box, box)
+        if clip is None:
+            return
+        src = item.image.crop((clip[0] - item_box[0], clip[1] - item_box[1],
+                               clip[2] - item_box[0], clip[3] - item_box[1]))
+        if item.mode == "add":
+            target.paste(ImageChops.add(target.crop(clip), src.convert("RGB")), clip[:2])
+        elif item.mode == "over" and src.mode in ("RGBA", "LA", "P"):
+            src = src.convert("RGBA")
+            target.paste(src, clip[:2], src)
+        else:
+            target.paste(src.convert("RGB"), clip[:2])
+
+
+class LayerPhoto:
+    """PhotoImage-like holder for layer items; paste() marks the item dirty."""
+
+    def __init__(self, image=None, size=None, **kw):
+        self.pil = image if isinstance(image, Image.Image) else Image.new(image, size)
+        self.listeners = []
+
+    def paste(self, im, *args, **kw):
+        self.pil = im
+        for listener in self.listeners:
+            listener(self)
+
+    def width(self):
+        return self.pil.size[0]
+
+    def height(self):
+        return self.pil.size[1]
+
+
+class LayerCanvas:
+    """
+    Canvas-shaped view of one compositor layer.
+
+    Lets the animation scheduler and the video pipeline draw into a layer with the
+    same create_image/itemconfig/delete calls they use on a Tk canvas.
+    """
+
+    def __init__(self, compositor, layer_name, canvas):
+        self.compositor = compositor
+        self.layer_name = layer_name
+        self.canvas = canvas
+        self.items = {}
+
+    def winfo_width(self):
+        return self.canvas.winfo_width()
+
+    def winfo_height(self):
+        return self.canvas.winfo_height()
+
+    def _image(self, photo):
+        return photo.pil if hasattr(photo, "pil") else photo
+
+    def _on_paste(self, photo):
+        for key, (item_photo, position) in self.items.items():
+            if item_photo is photo:
+                self.compositor.set(self.layer_name, key, photo.pil, position)
+
+    def create_image(self, x, y, image=None, anchor="nw", **kw):
+        key = self.compositor.new_key()
+        self._place(key, image, (x, y), anchor)
+        return key
+
+    def _place(self, key, photo, position, anchor):
+        image = self._image(photo)
+        if anchor == "center":
+            position = (position[0] - image.size[0] // 2, position[1] - image.size[1] // 2)
+        if isinstance(photo, LayerPhoto) and self._on_paste not in photo.listeners:
+            photo.listeners.append(self._on_paste)
+        self.items[key] = (photo, position)
+        self.compositor.set(self.layer_name, key, image, position)
+
+    def itemconfig(self, key, cnf=None, **kw):
+        options = dict(cnf or {}, **kw)
+        if key in self.items and "image" in options:
+            self._place(key, options["image"], self.items[key][1], "nw")
+
+    itemconfigure = itemconfig
+
+    def coords(self, key, *coords):
+        if key in self.items and coords:
+            photo, _ = self.items[key]
+            self._place(key, photo, (coords[0], coords[1]), "nw")
+
+    def delete(self, *keys):
+        for key in keys:
+            if self.items.pop(key, None) is not None:
+                self.compositor.remove(self.layer_name, key)
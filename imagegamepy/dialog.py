@@ -0,0 +1,227 @@
+import math
+import tkinter as tk
+import tkinter.font as tkfont
+
+DIALOG_FONT = ("Helvetica", 14)
+DIALOG_BORDER = 10
+FRAME_INTERVAL = 16
+
+
+def dialog_box(position, canvas_width, canvas_height):
+    """Returns the (x1, y1, x2, y2) rectangle of a dialog box at `position`."""
+    position = position.lower()
+    if position == "bottom right":
+        return canvas_width // 2, canvas_height - 160, canvas_width - 10, canvas_height - 10
+    if position == "top left":
+        return 10, 10, canvas_width // 2, 150
+    if position == "top right":
+        return canvas_width // 2, 10, canvas_width - 10, 150
+    if position == "center":
+        box_width = int(canvas_width * 0.6)
+        box_height = 150
+        x1 = (canvas_width - box_width) // 2
+        y1 = (canvas_height - box_height) // 2
+        return x1, y1, x1 + box_width, y1 + box_height
+    return 10, canvas_height - 160, canvas_width // 2, canvas_height - 10
+
+
+def paginate(text, measure, linespace, width_px, height_px):
+    """
+    Splits `text` into pages that fit a box of width_px x height_px.
+
+    Lines are word-wrapped with `measure(string) -> pixels`, the way a Text widget with
+    wrap="word" would, and each page holds as many lines as `linespace` allows.
+    """
+    lines_per_page = max(height_px // max(linespace, 1), 1)
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split(" "):
+            candidate = word if not line else line + " " + word
+            if line and measure(candidate) > width_px:
+                lines.append(line + " ")
+                line = word
+            else:
+                line = candidate
+        lines.append(line + "\n")
+    lines[-1] = lines[-1][:-1]
+    pages = ["".join(lines[i:i + lines_per_page]) for i in range(0, len(lines), lines_per_page)]
+    return [page.rstrip("\n") for page in pages] or [""]
+
+
+class DialogBox:
+    """A pooled dialog: stippled rectangle plus an embedded, read-only Text widget."""
+
+    def __init__(self, canvas, text_factory=tk.Text):
+        self.canvas = canvas
+        self.rect = canvas.create_rectangle(0, 0, 0, 0, outline="", stipple="gray50", state="hidden")
+        self.widget = text_factory(canvas, wrap="word", font=DIALOG_FONT, bd=DIALOG_BORDER, highlightthickness=0)
+        self.widget.config(state="disabled")
+        self.window = canvas.create_window(0, 0, anchor="nw", window=self.widget, state="hidden")
+        self.widget.bind("<MouseWheel>", self._on_mousewheel)
+
+    def _on_mousewheel(self, event):
+        self.widget.yview_scroll(-1 * (event.delta // 120), "units")
+
+    def show(self, box, text_color, dialog_box_color):
+        x1, y1, x2, y2 = box
+        self.canvas.coords(self.rect, x1, y1, x2, y2)
+        self.canvas.itemconfig(self.rect, fill=dialog_box_color, state="normal")
+        self.canvas.coords(self.window, x1 + 10, y1 + 10)
+        self.canvas.itemconfig(self.window, width=x2 - x1 - 20, height=y2 - y1 - 20, state="normal")
+        self.canvas.tag_raise(self.rect)
+        self.canvas.tag_raise(self.window)
+        self.widget.config(bg=dialog_box_color, fg=text_color)
+        self.clear()
+
+    def hide(self):
+        self.canvas.itemconfig(self.rect, state="hidden")
+        self.canvas.itemconfig(self.window, state="hidden")
+
+    def clear(self):
+        self.widget.config(state="normal")
+        self.widget.delete("1.0", "end")
+        self.widget.config(state="disabled")
+
+    def append(self, text):
+        self.widget.config(state="normal")
+        self.widget.insert("end", text)
+        self.widget.see("end")
+        self.widget.config(state="disabled")
+
+    def destroy(self):
+        self.canvas.delete(self.rect)
+        self.canvas.delete(self.window)
+        self.widget.destroy()
+
+
+class DialogRenderer:
+    """
+    Typewriter for StoryWindow.dialog with one reused DialogBox per position.
+
+    Characters are appended instead of re-inserting the whole text, several per tick
+    when `speed` is shorter than a frame. Text is paginated up front; a finished page
+    moves on after `page_pause` ms or when advance() is called.
+    """
+
+    def __init__(self, root, canvas, frame_interval=FRAME_INTERVAL, page_pause=1500,
+                 text_factory=tk.Text, font_factory=tkfont.Font):
+        self.root = root
+        self.canvas = canvas
+        self.text_factory = text_factory
+        self.font_factory = font_factory
+        self.frame_interval = frame_interval
+        self.page_pause = page_pause
+        self.boxes = {}
+        self.active = None
+        self.pages = []
+        self.page = 0
+        self.shown = 0
+        self.done = True
+        self._job = None
+        self._step = 1
+        self._interval = frame_interval
+        self._callbacks = []
+        self._font = None
+
+    def show(self, text, text_color="white", speed=50, position="bottom left", dialog_box_color="black"):
+        self.cancel()
+        key = position.lower()
+        box = self.boxes.get(key)
+        if box is None:
+            box = self.boxes[key] = DialogBox(self.canvas, self.text_factory)
+        if self.active is not None and self.active is not box:
+            self.active.hide()
+        self.active = box
+        rect = dialog_box(key, self.canvas.winfo_width(), self.canvas.winfo_height())
+        box.show(rect, text_color, dialog_box_color)
+        if self._font is None:
+            self._font = self.font_factory(font=DIALOG_FONT)
+        inner_width = rect[2] - rect[0] - 20 - 2 * DIALOG_BORDER - 4
+        inner_height = rect[3] - rect[1] - 20 - 2 * DIALOG_BORDER
+        self.pages = paginate(text, self._font.measure, self._font.metrics("linespace"), inner_width, inner_height)
+        self.page = 0
+        self.shown = 0
+        self.done = False
+        # Never tick faster than a frame; type several characters per tick instead
+        self._interval = max(int(speed), self.frame_interval)
+        self._step = max(int(math.ceil(self._interval / max(speed, 1))), 1)
+        self._type()
+        return box
+
+    def _type(self):
+        self._job = None
+        page = self.pages[self.page]
+        if self.shown < len(page):
+            chunk = page[self.shown:self.shown + self._step]
+            self.shown += len(chunk)
+            self.active.append(chunk)
+            self._job = self.root.after(self._interval, self._type)
+        elif self.page < len(self.pages) - 1:
+            self._job = self.root.after(self.page_pause, self._next_page)
+        else:
+            self._finish()
+
+    def _next_page(self):
+        self._job = None
+        self.page += 1
+        self.shown = 0
+        self.active.clear()
+        self._type()
+
+    def _finish(self):
+        self.done = True
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def advance(self):
+        """Completes the current page, or turns to the next one if it is already complete."""
+        if self.done or self.active is None:
+            return
+        self.cancel_job()
+        page = self.pages[self.page]
+        if self.shown < len(page):
+            self.active.append(page[self.shown:])
+            self.shown = len(page)
+            self._type()
+        elif self.page < len(self.pages) - 1:
+            self._next_page()
+        else:
+            # The last chunk is typed but the finishing tick has not run yet
+            self._finish()
+
+    def skip_to_end(self):
+        """Shows the last page in full and finishes the dialog."""
+        if self.done or self.active is None:
+            return
+        self.cancel_job()
+        self.page = len(self.pages) - 1
+        self.active.clear()
+        self.active.append(self.pages[self.page])
+        self.shown = len(self.pages[self.page])
+        self._finish()
+
+    def when_done(self, callback):
+        """Calls `callback` once the current dialog has been typed out completely."""
+        if self.done:
+            callback()
+        else:
+            self._callbacks.append(callback)
+
+    def cancel_job(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+
+    def cancel(self):
+        """Stops the running animation, e.g. when a new dialog replaces it."""
+        self.cancel_job()
+        if not self.done:
+            self._finish()
+
+    def close(self):
+        self.cancel()
+        if self.active is not None:
+            self.active.hide()
+            self.active = None
@@ -0,0 +1,335 @@
+"""
+Automated playthroughs of branching stories.
+
+The explorer replays a story on headless windows, answering every option menu from a
+script of choice indices. Each run follows its script and then takes the first option
+at every new menu. Every option it meets for the first time becomes a new script, so
+all paths get enumerated. Runs are spread over a process pool. Each run uses its own
+in-memory save store, so runs never share a gamedata file.
+
+    python -m imagegamepy.explorer story.json --workers 8 --output report.json
+"""
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+DIALOG_STEP = 0.05
+MAX_DIALOG_SECONDS = 600
+MAX_SCENES = 10000
+
+
+class _StopPath(Exception):
+    def __init__(self, outcome):
+        super().__init__(outcome)
+        self.outcome = outcome
+
+
+def state_key(parts):
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def script_state(window):
+    """
+    Default state of a scripted story at an option menu: the menu itself, the saves, the
+    background, color grade and noise. Two paths reaching the same state are assumed to continue alike.
+    """
+    return state_key((window.option_id, tuple(window.option_list), repr(window.save_store.as_legacy()),
+                      window.background_source.key, window.grade.key, window.noise_params))
+
+
+class PathRun:
+    """Drives one headless playthrough along a fixed prefix of choices."""
+
+    def __init__(self, window, prefix, known, max_depth, state_fn):
+        self.window = window
+        self.prefix = prefix
+        self.known = known
+        self.max_depth = max_depth
+        self.state_fn = state_fn
+        self.trace = []
+        self.dialog_seconds = 0.0
+        self.load_ms = 0.0
+        self.save_ms = 0.0
+        self.dialogs = 0
+        self.extra = {}
+        self._timing = set()
+        window.root.input_provider = self.choose
+        self._time_calls(window, "load", "load_ms")
+        self._time_calls(window, "set_background_image", "load_ms")
+        self._time_calls(window.save_store, "record", "save_ms")
+
+    def _time_calls(self, obj, name, counter):
+        func = getattr(obj, name)
+
+        def timed(*args, **kw):
+            if counter in self._timing:
+                # Nested inside another timed call of the same counter, which already counts it
+                return func(*args, **kw)
+            self._timing.add(counter)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kw)
+            finally:
+                self._timing.discard(counter)
+                setattr(self, counter, getattr(self, counter) + (time.perf_counter() - start) * 1000.0)
+
+        setattr(obj, name, timed)
+
+    def finish_dialog(self):
+        """Lets the typewriter finish on the virtual clock, the way a reading player would."""
+        dialogs = self.window.dialogs
+        if dialogs.done:
+            return
+        self.dialogs += 1
+        root = self.window.root
+        start = root.now
+        while not dialogs.done:
+            if root.now - start > MAX_DIALOG_SECONDS:
+                raise _StopPath("dialog_timeout")
+            root.advance(DIALOG_STEP)
+        self.dialog_seconds += root.now - start
+
+    def choose(self):
+        if self.window.option_list is None:
+            return None
+        self.finish_dialog()
+        depth = len(self.trace)
+        key = self.state_fn(self.window)
+        options = list(self.window.option_list)
+        if depth < len(self.prefix):
+            choice = self.prefix[depth]
+            if choice >= len(options):
+                raise _StopPath("diverged")
+        else:
+            if key in self.known:
+                raise _StopPath("merged")
+            if depth >= self.max_depth:
+                raise _StopPath("max_depth")
+            choice = 0
+        self.trace.append((self.window.option_id, options, choice, key))
+        return ['<Down>'] * choice + ['<Return>']
+
+    def result(self, outcome, wall_ms, error=None):
+        result = {
+            "choices": [options[choice] for _, options, choice, _ in self.trace],
+            "prefix": list(self.prefix),
+            "trace": [[option_id, options, choice, key] for option_id, options, choice, key in self.trace],
+            "outcome": outcome,
+            "error": error,
+            "wall_ms": wall_ms,
+            "dialog_s": self.dialog_seconds,
+            "dialogs": self.dialogs,
+            "load_ms": self.load_ms,
+            "save_ms": self.save_ms,
+        }
+        result.update((name, list(value)) for name, value in self.extra.items())
+        return result
+
+
+def _open_window(background, size):
+    from .game_lib import StoryWindow
+    from .save_store import MemorySaveStore
+    return StoryWindow(background, headless=True, size=size, save_backend=MemorySaveStore())
+
+
+_graphs = {}
+
+
+def _graph(story):
+    from .story import StoryGraph, compile_story, load_story
+    if isinstance(story, StoryGraph):
+        return story
+    key = story if isinstance(story, str) else id(story)
+    if key not in _graphs:
+        _graphs[key] = load_story(story) if isinstance(story, str) else compile_story(story)
+    return _graphs[key]
+
+
+def _play_graph(window, run, graph):
+    from .story import StoryRunner
+    runner = StoryRunner(window, graph, prefetch_depth=0)
+    # Scene backgrounds load here, either through set_background_image() or from a prefetched decode
+    run._time_calls(runner, "_set_background", "load_ms")
+    run.state_fn = lambda w: state_key(("scene", runner.current.index))
+    # Kept on the run so paths that stop early still report the scenes they went through
+    run.extra["scenes"] = runner.history
+    runner.start()
+    root = window.root
+    while not runner.finished:
+        if len(runner.history) > MAX_SCENES:
+            raise _StopPath("max_depth")
+        if runner._asking:
+            root.advance(0)
+            continue
+        run.finish_dialog()
+        root.event_generate(runner.advance_key)
+
+
+def run_path(story, prefix, known=(), background=None, size=(800, 600), max_depth=64, state_fn=None):
+    """
+    Plays `story` once along `prefix` (a list of option indices), then takes the first
+    option of every new menu. `story` is a StoryGraph, a story dict or JSON path, or a
+    function taking a StoryWindow. Returns the path result as a dict.
+    """
+    window = _open_window(background, size)
+    run = PathRun(window, list(prefix), set(known), max_depth, state_fn or script_state)
+    start = time.perf_counter()
+    outcome, error = "end", None
+    try:
+        if callable(story):
+            story(window)
+        else:
+            _play_graph(window, run, _graph(story))
+    except _StopPath as stop:
+        outcome = stop.outcome
+    except Exception as e:
+        outcome, error = "error", "%s: %s" % (type(e).__name__, e)
+    finally:
+        window.assets.shutdown()
+    return run.result(outcome, (time.perf_counter() - start) * 1000.0, error)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(round(fraction * (len(values) - 1))), len(values) - 1)]
+
+
+class ExplorationReport:
+    """Per-path results plus the option and scene coverage they add up to."""
+
+    def __init__(self, paths, graph=None, wall_s=0.0, truncated=False):
+        self.paths = paths
+        self.graph = graph
+        self.wall_s = wall_s
+        self.truncated = truncated
+
+    def coverage(self):
+        menus = {}
+        for path in self.paths:
+            for option_id, options, choice, key in path["trace"]:
+                menu = menus.setdefault(key, {"id": option_id, "options": options, "taken": set()})
+                menu["taken"].add(choice)
+        untaken = [{"id": menu["id"], "state": key, "options": [menu["options"][i] for i in range(len(menu["options"]))
+                                                                 if i not in menu["taken"]]}
+                   for key, menu in menus.items() if len(menu["taken"]) < len(menu["options"])]
+        coverage = {
+            "menus": len(menus),
+            "choices": sum(len(menu["options"]) for menu in menus.values()),
+            "choices_taken": sum(len(menu["taken"]) for menu in menus.values()),
+            "untaken": untaken,
+        }
+        if self.graph is not None:
+            visited = set(scene for path in self.paths for scene in path.get("scenes", []))
+            coverage["scenes"] = len(self.graph)
+            coverage["scenes_visited"] = len(visited)
+            coverage["unreached_scenes"] = [scene.name for scene in self.graph.scenes if scene.name not in visited]
+        return coverage
+
+    def summary(self):
+        outcomes = {}
+        for path in self.paths:
+            outcomes[path["outcome"]] = outcomes.get(path["outcome"], 0) + 1
+        summary = {"paths": len(self.paths), "outcomes": outcomes, "wall_s": self.wall_s, "truncated": self.truncated}
+        for field in ("wall_ms", "dialog_s", "load_ms", "save_ms"):
+            values = [path[field] for path in self.paths]
+            summary[field] = {
+                "median": statistics.median(values) if values else None,
+                "p95": _percentile(values, 0.95),
+                "max": max(values) if values else None,
+            }
+        return summary
+
+    def errors(self):
+        return [path for path in self.paths if path["outcome"] == "error"]
+
+    def as_dict(self):
+        return {"summary": self.summary(), "coverage": self.coverage(), "paths": self.paths}
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+def explore(story, workers=None, background=None, size=(800, 600), max_depth=64, max_paths=10000,
+            dedupe=True, state_fn=None):
+    """
+    Enumerates every option path of `story` on a process pool and returns an ExplorationReport.
+
+    :param story: A StoryGraph, a story dict or JSON path, or a module-level function taking a StoryWindow.
+    :param workers: Number of worker processes; 0 runs everything in this process.
+    :param background: Background image of the headless windows, for function stories.
+    :param max_depth: Paths stop after this many choices, which also ends story loops.
+    :param max_paths: Exploration stops after this many paths.
+    :param dedupe: Skip the branches of states another path already expanded.
+    :param state_fn: Function of the window giving a state key at an option menu, for function stories.
+    """
+    graph = None if callable(story) else _graph(story)
+    # A path is cheaper to send to the workers than the compiled graph
+    target = story if callable(story) or isinstance(story, str) else graph
+    workers = os.cpu_count() if workers is None else workers
+    seen = set()
+    queue = [[]]
+    paths = []
+    started = time.time()
+
+    def expand(result):
+        paths.append(result)
+        for depth, (_, options, _, key) in enumerate(result["trace"]):
+            if depth < len(result["prefix"]):
+                continue
+            if dedupe and key in seen:
+                break
+            seen.add(key)
+            base = [choice for _, _, choice, _ in result["trace"][:depth]]
+            queue.extend(base + [i] for i in range(1, len(options)))
+
+    def submit_args(prefix):
+        return (target, prefix, frozenset(seen) if dedupe else (), background, size, max_depth, state_fn)
+
+    if workers == 0:
+        while queue and len(paths) < max_paths:
+            expand(run_path(*submit_args(queue.pop())))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = set()
+            while (queue or pending) and len(paths) < max_paths:
+                while queue and len(pending) < workers * 2 and len(paths) + len(pending) < max_paths:
+                    pending.add(pool.submit(run_path, *submit_args(queue.pop())))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    expand(future.result())
+    return ExplorationReport(paths, graph, time.time() - started, truncated=bool(queue))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m imagegamepy.explorer",
+                                     description="Play every branch of a story headlessly and report timings and coverage.")
+    parser.add_argument("story", help="story JSON file")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes, 0 to run in this process")
+    parser.add_argument("--max-depth", type=int, default=64)
+    parser.add_argument("--max-paths", type=int, default=10000)
+    parser.add_argument("--no-dedupe", action="store_true", help="expand every path even when states repeat")
+    parser.add_argument("--output", "-o", help="write the full report as JSON")
+    args = parser.parse_args(argv)
+
+    report = explore(args.story, args.workers, max_depth=args.max_depth, max_paths=args.max_paths,
+                     dedupe=not args.no_dedupe)
+    if args.output:
+        report.save(args.output)
+    print(json.dumps({"summary": report.summary(), "coverage": report.coverage()}, indent=2))
+    for path in report.errors():
+        print("ERROR after %s: %s" % (path["choices"], path["error"]))
+    return 1 if report.errors() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,73 +1,220 @@
-import tkinter as tk
-from PIL import Image, ImageTk, ImageFilter, ImageDraw, ImageSequence, ImageOps
-import random, json, os, keyboard
-from pygame import mixer
-from ffpyplayer.player import MediaPlayer
-import numpy as np
+import logging
+import time
+_IMPORT_STARTED = time.perf_counter()
+from .background import BackgroundSource, BackgroundCache
+from .grading import Grade, GradeTransition, grade_image
+from .profiler import NULL_PROFILER, Profiler
+from .assets import AssetManager, open_image
+from .animation import AnimationScheduler
+from .video import VideoPipeline
+from .save_store import open_save_store, SaveStore, SAVE_BACKENDS
+from .dialog import DialogRenderer
+from .render import TkBackend, HeadlessBackend
+from .audio import AudioManager
+from .compositor import LayeredCompositor, LayerCanvas, LayerPhoto
+
+_log = logging.getLogger("imagegamepy")
+
+# keyboard, pygame, ffpyplayer and NumPy are only imported when a story first needs them
+
+def _load_keyboard():
+    import keyboard
+    return keyboard
+
+
+def _load_media_player():
+    try:
+        from ffpyplayer.player import MediaPlayer
+    except ImportError:
+        raise ImportError("ffpyplayer is required for video playback.")
+    return MediaPlayer
+
 
 class StoryWindow:
-    def __init__(self, background_image_address=None, background_color="#FFFFFF", warm=0, noise_params=None):
-        self.root = tk.Tk()
-        self.root.title("Story Telling Game")
-        self.canvas = tk.Canvas(self.root, width=800, height=600)
-        self.canvas.pack(fill="both", expand=True)
+    def __init__(self, background_image_address=None, background_color="#FFFFFF", warm=0, noise_params=None, noise_tick=200, noise_pool=8, save_backend='jsonl', save_slot='default', headless=False, size=(800, 600), layered=False, asset_pack=None, profile=False):
+        self._created = time.perf_counter()
+        self._first_frame = None
+        # Replaced by a Profiler while profiling; stage spans cost next to nothing until then
+        self.profiler = NULL_PROFILER
+        self.backend = HeadlessBackend(size) if headless else TkBackend(size)
+        self.root = self.backend.root
+        self.canvas = self.backend.canvas
         self.canvas.bind("<Configure>", self.resize_image)
         
         self.background_color = background_color
         self.noise_params = noise_params
-        self.warm = warm
+        self.grade = Grade(warm=warm)
+        self._grade_transition = None
+        self._grade_job = None
+        self.grade_delay = 33
+        self.noise_tick = noise_tick
+        if noise_pool < 1:
+            raise ValueError("noise_pool must be at least 1")
+        self.noise_pool = noise_pool
+        self._noise_engine = None
+        self._noise_photos = []
+        self._noise_job = None
+        self._background_version = 0
+        self.background_cache = BackgroundCache()
+        self.asset_pack = None
+        if asset_pack is not None:
+            from .asset_pack import AssetPack
+            self.asset_pack = AssetPack(asset_pack) if isinstance(asset_pack, str) else asset_pack
+        self.resize_delay = 60
+        self._resize_job = None
+        self._pending_size = None
+        self._applied_size = None
 
         if background_image_address:
-            try:
-                self.original_image = Image.open(background_image_address).convert("RGB")
-            except Exception as e:
-                raise ValueError("Invalid background image address: " + str(e))
+            self.background_source = self._open_background(background_image_address, size)
         else:
-            self.original_image = Image.new("RGB", (800, 600), background_color)
-
-        self.background_image = self.apply_warm(self.original_image.copy(), self.warm)
-        self.photo = ImageTk.PhotoImage(self.background_image)
-        self.image_id = self.canvas.create_image(0, 0, anchor="nw", image=self.photo)
+            self.background_source = BackgroundSource.from_color(size, background_color)
+        self.original_image = self.background_source.image
+
+        self.background_image = self.background_cache.get(self.background_source, size, self.grade.key, self.apply_grade)
+        self.layered = layered
+        self.compositor = None
+        self._compose_job = None
+        if layered:
+            # Background, noise, sprites and video are flattened into one image; only dirty rectangles get uploaded
+            self.compositor = LayeredCompositor(size, background_color, on_dirty=self._schedule_compose)
+            self.photo = self.backend.Photo("RGB", size)
+            self.image_id = self.canvas.create_image(0, 0, anchor="nw", image=self.photo)
+            self.compositor.set("background", "image", self.background_image, mode="replace")
+        else:
+            self.photo = self.backend.Photo(self.background_image)
+            self.image_id = self.canvas.create_image(0, 0, anchor="nw", image=self.photo)
 
         if self.noise_params:
-            self.root.after(200, self.apply_noise_loop)
+            self._noise_job = self.root.after(self.noise_tick, self.apply_noise_loop)
         
         self.dialog_rect = None
         self.dialog_text = None
+        self.dialogs = DialogRenderer(self.root, self.canvas, text_factory=self.backend.Text, font_factory=self.backend.Font)
         self.option_box = None
         self.option_box_items = []
         self.option_highlight = None
         self.current_option_index = 0
-        self.option_chosen = tk.BooleanVar(value=False)
+        self.option_chosen = self.backend.Variable(value=False)
         self.option_result = None
+        self._option_callback = None
+        self._option_record = True
+        self.option_list = None
+        self.option_id = None
         
         # Resource settings placeholders
         self.audio_volume = 50
         self.audio_file = None
+        self.audio_handle = None
         self.png_settings = {}
         self.gif_settings = {}
         self.video_settings = {}
         self.video_player = None
+        self.video_pipeline = None
         self.video_frame = None  # holds current video frame PhotoImage
-        
-        # Initialize pygame mixer for audio if available
-        if mixer:
-            mixer.init()
-        self.gameData()
+        self.assets = AssetManager()
+        self.assets.pack = self.asset_pack
+        self.asset_poll = 15
+        self.asset_errors = []
+        self.sprite_canvas = LayerCanvas(self.compositor, "sprites", self.canvas) if layered else self.canvas
+        self.sprite_photo = LayerPhoto if layered else self.backend.Photo
+        self.animations = AnimationScheduler(self.root, self.sprite_canvas, self.sprite_photo, self.assets.executor, clock=self.backend.clock)
+        # The mixer is started by the first sound that is played or preloaded
+        self.audio = AudioManager(None, self.root, self.assets.executor)
+        if not isinstance(save_backend, SaveStore) and save_backend not in SAVE_BACKENDS:
+            raise ValueError("Unsupported save backend: " + str(save_backend))
+        # The save file is opened by the first save or read
+        self.save_backend = save_backend
+        self.save_slot = save_slot
+        self._save_store = None
+        self._init_time = time.perf_counter() - self._created
+        if not self.backend.headless:
+            self.root.after_idle(self._mark_first_frame)
+        if profile:
+            self.enable_profiler()
+
+    @property
+    def save_store(self):
+        if self._save_store is None:
+            with self.profiler.span("save"):
+                self._save_store = open_save_store(self.save_backend, self.save_slot)
+        return self._save_store
+
+    @property
+    def warm(self):
+        return self.grade.warm
+
+    @warm.setter
+    def warm(self, value):
+        self.grade = self.grade.replace(warm=value)
+
+    @property
+    def noise_engine(self):
+        if self._noise_engine is None:
+            from .noise_engine import NoiseEngine
+            self._noise_engine = NoiseEngine(self.noise_pool)
+        return self._noise_engine
+
+    def _mark_first_frame(self):
+        if self._first_frame is None:
+            self._first_frame = time.perf_counter() - self._created
+
+    def enable_profiler(self, overlay=False, history=1000):
+        """
+    Starts timing every scheduled callback, key handler and heavy stage (decode, resize, grade,
+    upload, canvas, save) of the window.
+
+    :param overlay: Also show live frame-time stats in the top-left corner of the canvas.
+    :param history: Number of durations kept per span for the percentiles.
+    :return: The Profiler; read it with stats(), export it with save_trace('trace.json').
+    """
+        if not self.profiler.enabled:
+            Profiler(self.backend.clock, history).attach(self)
+        if overlay:
+            self.profiler.show_overlay()
+        return self.profiler
+
+    def disable_profiler(self):
+        """
+    Stops profiling and returns the Profiler, whose statistics stay readable.
+    """
+        profiler = self.profiler
+        if profiler.enabled:
+            profiler.detach()
+        return profiler
+
+    def startup_times(self):
+        """
+    Returns how long startup took, in milliseconds: importing imagegamepy, creating the window,
+    and getting the first frame on screen (None until it has been drawn or rendered).
+    """
+        return {
+            "import_ms": _IMPORT_TIME * 1000.0,
+            "init_ms": self._init_time * 1000.0,
+            "first_frame_ms": None if self._first_frame is None else self._first_frame * 1000.0,
+        }
 
     def gameData(self):
-        GAME_FILE = 'gamedata.json'
-        if not os.path.exists(GAME_FILE):
-            with open(GAME_FILE, 'w') as f:
-                json.dump([{'state': ''}, {'story': []}], f)
-        try:
-            with open(GAME_FILE, "r") as file:
-                data = json.load(file)
-                if not isinstance(data, list):
-                    data = []
-                return data
-        except json.JSONDecodeError:
-            return []
+        with self.profiler.span("save"):
+            return self.save_store.as_legacy()
+
+    def set_save_slot(self, slot):
+        """
+    Switches saves and return_options() to another save slot.
+
+    :param slot: Name of the slot, e.g. 'default' or 'slot2'.
+    """
+        if slot == self.save_slot:
+            return
+        if not isinstance(self.save_backend, str):
+            raise ValueError("Save slots can only be switched for named save backends.")
+        if self._save_store is not None:
+            self._save_store.close()
+            self._save_store = None
+        self.save_slot = slot
+
+    def save_slots(self):
+        return self.save_store.slots()
 
 
     def is_key_pressed(self, key):
@@ -77,173 +224,270 @@ class StoryWindow:
     :param key: The key to check (e.g., 'enter', 'a', 'space', etc.).
     :return: True if the key is pressed, False otherwise.
     """
-        return keyboard.is_pressed(key)
+        return _load_keyboard().is_pressed(key)
 
     def resize_image(self, event):
-        new_width, new_height = event.width, event.height
-        resized_image = self.original_image.resize((new_width, new_height), Image.LANCZOS)
-        self.background_image = self.apply_warm(resized_image, self.warm)
-        self.photo = ImageTk.PhotoImage(self.background_image)
-        self.canvas.itemconfig(self.image_id, image=self.photo)
+        # <Configure> fires many times during a drag, only the last size gets rendered
+        self._pending_size = (event.width, event.height)
+        if self._resize_job is not None:
+            self.root.after_cancel(self._resize_job)
+        self._resize_job = self.root.after(self.resize_delay, self._apply_resize)
+
+    def _apply_resize(self):
+        self._resize_job = None
+        if self._pending_size is None:
+            return
+        size, self._pending_size = self._pending_size, None
+        previous, self._applied_size = self._applied_size, size
+        if size == previous:
+            return
+        if self.background_image.size != size:
+            self._show_background(size)
+        if previous is None:
+            # The first <Configure> maps the window, often while option() already shows its menu
+            return
         self.close_text_box()
         self.close_option_box()
 
+    def _show_background(self, size):
+        if self._grade_transition is not None:
+            # Mid-transition, show the current frame of the transition for the new size or source
+            base = self.background_cache.base(self.background_source, size)
+            with self.profiler.span("grade"):
+                image = self._grade_transition.render(base)
+            self._display_background(image)
+            return
+        self._display_background(self.background_cache.get(self.background_source, size, self.grade.key, self.apply_grade))
+
+    def _display_background(self, image):
+        self.background_image = image
+        self.original_image = self.background_source.image
+        if self.layered:
+            if self.compositor.size != self.background_image.size:
+                self.compositor.resize(self.background_image.size)
+                self.photo = self.backend.Photo("RGB", self.background_image.size)
+                self.canvas.itemconfig(self.image_id, image=self.photo)
+            self.compositor.set("background", "image", self.background_image, mode="replace")
+            return
+        with self.profiler.span("upload"):
+            self.photo = self.backend.Photo(self.background_image)
+        with self.profiler.span("canvas"):
+            self.canvas.itemconfig(self.image_id, image=self.photo)
+
+    def _schedule_compose(self):
+        if self._compose_job is None:
+            self._compose_job = self.root.after(0, self._compose)
+
+    def _compose(self):
+        self._compose_job = None
+        boxes = self.compositor.compose()
+        with self.profiler.span("upload"):
+            for box in boxes:
+                self.backend.upload(self.photo, self.compositor.frame, box)
+
+    def _set_background_source(self, source):
+        self.background_source = source
+        self.original_image = source.image
+        self._background_version += 1
+
     def apply_warm(self, image, warm):
-        if warm == 0:
-            return image
-        factor = abs(warm) / 100.0
-        overlay_color = (0, 0, 255) if warm < 0 else (255, 0, 0)
-        overlay = Image.new("RGB", image.size, overlay_color)
-        return Image.blend(image, overlay, factor)
+        return self.apply_grade(image, warm)
+
+    def apply_grade(self, image, grade):
+        with self.profiler.span("grade"):
+            return grade_image(image, Grade.from_key(grade))
+
+    def _open_background(self, address, size):
+        with self.profiler.span("decode"):
+            return self._decode_background(address, size)
+
+    def _decode_background(self, address, size):
+        if self.asset_pack is not None:
+            source = self.asset_pack.background(address, size, self.background_cache)
+            if source is not None:
+                return source
+        return BackgroundSource.open(address, size)
+
+    def use_asset_pack(self, path):
+        """
+    Serves backgrounds, PNG sprites and GIF frames from a pack made with `imagegamepy-pack`.
+
+    :param path: Path of the .igpack file, or None to stop using a pack.
+    """
+        from .asset_pack import AssetPack
+        self.asset_pack = AssetPack(path) if path is not None else None
+        self.assets.pack = self.asset_pack
 
     def apply_noise(self, image):
-        randomness, pattern, blur_val = self.noise_params
-        if pattern not in ["HL", "VL", "CL"]:
-            raise ValueError("unrecognized noise patterns")
-        noise_overlay = Image.new("RGB", image.size, (0, 0, 0))
-        draw = ImageDraw.Draw(noise_overlay)
-        width, height = image.size
-        num_elements = max(int(randomness * 10 / 100), 1)
-        if pattern == "HL":
-            for _ in range(num_elements):
-                y = random.randint(0, height - 1)
-                thickness = random.randint(1, 7)
-                color = (random.randint(100,200), random.randint(100,200), random.randint(100,200))
-                draw.rectangle([0, y, width, y+thickness], fill=color)
-        elif pattern == "VL":
-            for _ in range(num_elements):
-                x = random.randint(0, width - 1)
-                thickness = random.randint(1, 7)
-                color = (random.randint(100,200), random.randint(100,200), random.randint(100,200))
-                draw.rectangle([x, 0, x+thickness, height], fill=color)
-        elif pattern == "CL":
-            for _ in range(num_elements):
-                radius = random.randint(5,20)
-                x = random.randint(0, width)
-                y = random.randint(0, height)
-                color = (random.randint(100,200), random.randint(100,200), random.randint(100,200))
-                draw.ellipse([x-radius, y-radius, x+radius, y+radius], outline=color, width=1)
-        if blur_val > 0:
-            noise_overlay = noise_overlay.filter(ImageFilter.GaussianBlur(radius=blur_val/10.0))
-        return Image.blend(image, noise_overlay, 0.3)
+        return self.noise_engine.render(image, self.noise_params)
 
     def apply_noise_loop(self):
-        noisy_image = self.apply_noise(self.background_image)
-        self.photo = ImageTk.PhotoImage(noisy_image)
+        if not self.noise_params:
+            self._noise_job = None
+            return
+        key = (self._background_version, self.background_image.size, self.grade.key, self.noise_params)
+        if not self.noise_engine.is_current(key):
+            self.noise_engine.build(self.background_image, self.noise_params, key)
+            self._noise_photos = [None] * self.noise_engine.pool_size
+            if self.layered:
+                self.compositor.set("background", "image", self.noise_engine.base_image(), mode="replace")
+        if self.layered:
+            slot, patches = self.noise_engine.next_overlay()
+            self.compositor.clear("noise")
+            for i, (x, y, patch) in enumerate(patches):
+                self.compositor.set("noise", i, patch, (x, y), mode="add")
+            self._noise_job = self.root.after(self.noise_tick, self.apply_noise_loop)
+            return
+        slot, frame = self.noise_engine.next_frame()
+        if self._noise_photos[slot] is None:
+            with self.profiler.span("upload"):
+                self._noise_photos[slot] = self.backend.Photo(frame)
+        self.photo = self._noise_photos[slot]
         self.canvas.itemconfig(self.image_id, image=self.photo)
-        self.root.after(200, self.apply_noise_loop)
+        self._noise_job = self.root.after(self.noise_tick, self.apply_noise_loop)
 
     def update_background(self):
-        width = self.canvas.winfo_width()
-        height = self.canvas.winfo_height()
-        resized_image = self.original_image.resize((width, height), Image.LANCZOS)
-        self.background_image = self.apply_warm(resized_image, self.warm)
-        self.photo = ImageTk.PhotoImage(self.background_image)
-        self.canvas.itemconfig(self.image_id, image=self.photo)
+        self._show_background((self.canvas.winfo_width(), self.canvas.winfo_height()))
 
     def set_warm(self, new_warm, step=1, delay=50):
-        if self.warm == new_warm:
+        frames = -(-abs(new_warm - self.warm) // step) if step > 0 else 0
+        self.set_grade(self.grade.replace(warm=new_warm), frames * delay, delay)
+
+    def set_grade(self, grade=None, duration=0, delay=None, **changes):
+        """
+    Changes the color grade of the background: warm, tint, brightness, contrast and vignette.
+
+    :param grade: A Grade, or None to change only the values given as keywords, e.g. set_grade(vignette=40).
+    :param duration: Length of the transition in milliseconds; 0 switches at once.
+    :param delay: Milliseconds between transition frames, by default game.grade_delay.
+    """
+        target = grade if grade is not None else self.grade
+        if changes:
+            target = target.replace(**changes)
+        delay = self.grade_delay if delay is None else delay
+        previous = self._grade_transition
+        if self._grade_job is not None:
+            self.root.after_cancel(self._grade_job)
+            self._grade_job = None
+        self._grade_transition = None
+        if target == self.grade and previous is None:
             return
-        diff = new_warm - self.warm
-        if abs(diff) < step:
-            self.warm = new_warm
-        else:
-            self.warm += step if diff > 0 else -step
-        self.update_background()
-        self.root.after(delay, self.set_warm, new_warm, step, delay)
+        start = self.grade
+        self.grade = target
+        if duration <= 0 or delay <= 0:
+            self.update_background()
+            return
+        # Frames in between only re-grade the cached resize through interpolated lookup tables
+        self._grade_transition = GradeTransition(start, target, -(-duration // delay),
+                                                 previous.lut if previous is not None else None,
+                                                 previous.vignette if previous is not None else None)
+        self._grade_step(delay)
+
+    def _grade_step(self, delay):
+        self._grade_job = None
+        transition = self._grade_transition
+        if transition is None:
+            return
+        size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+        base = self.background_cache.base(self.background_source, size)
+        with self.profiler.span("grade"):
+            image = transition.step(base)
+        # Noise frames are built from the background on screen, so they follow every frame
+        self._background_version += 1
+        if transition.done:
+            # The last frame is exactly the target grade
+            self._grade_transition = None
+            self.background_cache.prime(self.background_source, size, image, self.grade.key)
+        self._display_background(image)
+        if not transition.done:
+            self._grade_job = self.root.after(delay, self._grade_step, delay)
 
     def set_background_image(self, background_image_address):
-        try:
-            self.original_image = Image.open(background_image_address).convert("RGB")
-        except Exception as e:
-            raise ValueError("Invalid background image address: " + str(e))
+        size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+        self._set_background_source(self._open_background(background_image_address, size))
         self.update_background()
 
     def set_background_color(self, background_color):
         self.background_color = background_color
-        self.original_image = Image.new("RGB", (self.canvas.winfo_width(), self.canvas.winfo_height()), background_color)
+        size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+        self._set_background_source(BackgroundSource.from_color(size, background_color))
         self.update_background()
 
     def set_noise_params(self, noise_params):
+        if noise_params:
+            noise(*noise_params)
         self.noise_params = noise_params
+        if not noise_params:
+            if self._noise_engine is not None:
+                self._noise_engine.invalidate()
+            self._noise_photos = []
+            if self._noise_job is not None:
+                self.root.after_cancel(self._noise_job)
+                self._noise_job = None
+            if self.layered:
+                self.compositor.clear("noise")
+            self.update_background()
+        elif self._noise_job is None:
+            self._noise_job = self.root.after(self.noise_tick, self.apply_noise_loop)
+
+    def set_noise_rate(self, noise_tick=None, noise_pool=None):
+        """
+    Changes how often the noise frame changes and how many frames are kept in the pool.
+
+    :param noise_tick: Delay between two noise frames in milliseconds.
+    :param noise_pool: Number of pre-blended noise frames cycled through.
+    """
+        if noise_tick is not None:
+            if noise_tick <= 0:
+                raise ValueError("noise_tick must be a positive number of milliseconds")
+            self.noise_tick = noise_tick
+        if noise_pool is not None and noise_pool != self.noise_pool:
+            if noise_pool < 1:
+                raise ValueError("noise_pool must be at least 1")
+            self.noise_pool = noise_pool
+            self._noise_engine = None
+            self._noise_photos = []
 
     def dialog(self, text, text_color="white", speed=50, position="bottom left", dialog_box_color="black"):
-    # Remove any existing dialog widget
-        if hasattr(self, 'dialog_widget'):
-            self.dialog_widget.destroy()
-            del self.dialog_widget
+        box = self.dialogs.show(text, text_color, speed, position, dialog_box_color)
+        self.dialog_rect = box.rect
+        self.dialog_widget = box.widget
 
-        # Calculate dialog box coordinates based on position
-        canvas_width = self.canvas.winfo_width()
-        canvas_height = self.canvas.winfo_height()
-        if position.lower() == "bottom left":
-            x1, y1 = 10, canvas_height - 160
-            x2, y2 = canvas_width // 2, canvas_height - 10
-        elif position.lower() == "bottom right":
-            x1, y1 = canvas_width // 2, canvas_height - 160
-            x2, y2 = canvas_width - 10, canvas_height - 10
-        elif position.lower() == "top left":
-            x1, y1 = 10, 10
-            x2, y2 = canvas_width // 2, 150
-        elif position.lower() == "top right":
-            x1, y1 = canvas_width // 2, 10
-            x2, y2 = canvas_width - 10, 150
-        elif position.lower() == "center":
-            box_width = int(canvas_width * 0.6)
-            box_height = 150
-            x1 = (canvas_width - box_width) // 2
-            y1 = (canvas_height - box_height) // 2
-            x2 = x1 + box_width
-            y2 = y1 + box_height
-        else:
-            x1, y1 = 10, canvas_height - 160
-            x2, y2 = canvas_width // 2, canvas_height - 10
-
-    # Draw or update the dialog rectangle background
-        if self.dialog_rect is not None:
-            self.canvas.delete(self.dialog_rect)
-        self.dialog_rect = self.canvas.create_rectangle(x1, y1, x2, y2, fill=dialog_box_color, outline="", stipple="gray50")
-
-    # Compute inner dimensions with some padding
-        width_px = x2 - x1 - 20
-        height_px = y2 - y1 - 20
-
-    # Create an embedded Text widget in the canvas for wrapped and scrollable text
-        self.dialog_widget = tk.Text(self.canvas, wrap="word", bg=dialog_box_color, fg=text_color, font=("Helvetica", 14), bd=10, highlightthickness=0)
-        self.dialog_widget.config(state="disabled")  # make it read-only
-    # Embed the Text widget in the canvas
-        self.canvas.create_window(x1+10, y1+10, anchor="nw", window=self.dialog_widget ,width=width_px, height=height_px)
-
-    # Optionally bind mousewheel scrolling to the text widget (works on Windows)
-        def _on_mousewheel(event):
-            self.dialog_widget.yview_scroll(-1 * (event.delta // 120), "units")
-        self.dialog_widget.bind("<MouseWheel>", _on_mousewheel)
-
-    # Animate text insertion letter-by-letter, auto-scrolling as needed
-        def animate(i=0):
-            if i <= len(text):
-                self.dialog_widget.config(state="normal")
-                self.dialog_widget.delete("1.0", "end")
-                self.dialog_widget.insert("end", text[:i])
-                self.dialog_widget.see("end")  # auto-scroll to the bottom if text exceeds view
-                self.dialog_widget.config(state="disabled")
-                self.root.after(speed, animate, i+1)
-        animate()
+    def skip_dialog(self):
+        """
+    Finishes typing the current dialog page, or turns to the next page if it is already complete.
+    """
+        self.dialogs.advance()
 
+    def skip_dialog_to_end(self):
+        self.dialogs.skip_to_end()
 
     def close_text_box(self):
-        if self.dialog_rect is not None:
-            self.canvas.delete(self.dialog_rect)
-            self.dialog_rect = None
-            if hasattr(self, 'dialog_widget'):
-                self.dialog_widget.destroy()
-                del self.dialog_widget
+        self.dialogs.close()
+        self.dialog_rect = None
+        if hasattr(self, 'dialog_widget'):
+            del self.dialog_widget
         if self.dialog_text is not None:
             self.canvas.delete(self.dialog_text)
             self.dialog_text = None
 
     def option(self, option_list, option_background_color='', option_list_color='', save_type='default', id='interface'):
-        self.canvas.update()  # Ensure canvas dimensions are updated
+        with self.profiler.span("canvas"):
+            self.canvas.update()  # Ensure canvas dimensions are updated
+        self.open_options(option_list, option_background_color, option_list_color, save_type, id)
+        self.root.wait_variable(self.option_chosen)
+        return self.option_result
+
+    def open_options(self, option_list, option_background_color='', option_list_color='', save_type='default', id='interface',
+                     on_chosen=None, record=True):
+        """
+    Shows an option menu without waiting for the choice.
+
+    :param on_chosen: Called with the result once an option is picked.
+    :param record: False to leave saving a 'json' choice to the caller.
+    """
+        with self.profiler.span("canvas"):
+            self.root.update_idletasks()
         canvas_width = self.canvas.winfo_width()
         canvas_height = self.canvas.winfo_height()
         box_width = int(canvas_width * 0.6)
@@ -263,19 +507,14 @@ class StoryWindow:
                                                                x2, y1 + 10 + self.current_option_index * 35 + 33,
                                                                outline="yellow", width=2)
         self.option_result = None
-        self.option_chosen = tk.BooleanVar(value=False)
+        self.option_chosen = self.backend.Variable(value=False)
+        self._option_callback = on_chosen
+        self._option_record = record
+        self.option_list = option_list
+        self.option_id = id
         self.root.bind("<Up>", lambda event: self._option_up(x1, y1, x2, y2))
         self.root.bind("<Down>", lambda event: self._option_down(x1, y1, x2, y2, len(option_list)))
         self.root.bind("<Return>", lambda event: self._option_enter(option_list, save_type, id))
-        self.root.wait_variable(self.option_chosen)
-        self.root.unbind("<Up>")
-        self.root.unbind("<Down>")
-        self.root.unbind("<Return>")
-        self.canvas.delete(self.option_box)
-        for item in self.option_box_items:
-            self.canvas.delete(item)
-        self.canvas.delete(self.option_highlight)
-        return self.option_result
 
     def _option_up(self, x1, y1, x2, y2):
         if self.current_option_index > 0:
@@ -295,34 +534,23 @@ class StoryWindow:
         chosen = option_list[self.current_option_index]
         result = {"options": option_list, "choice": chosen}
         if save_type == 'json':
-            data = self.gameData()
-            if id == "interface":
-                data[0] = result
-            else:
+            if id != "interface":
                 result = {"id": id, "choice": chosen}
-                data[1]['story'].append(result)
-            with open("gamedata.json", "w") as f:
-                json.dump(data, f)
+            if self._option_record:
+                with self.profiler.span("save"):
+                    self.save_store.record(id, result)
         self.option_result = result 
-        self.option_chosen.set(True)
+        self.root.unbind("<Up>")
+        self.root.unbind("<Down>")
+        self.root.unbind("<Return>")
         self.close_option_box()
+        self.option_chosen.set(True)
+        callback, self._option_callback = self._option_callback, None
+        if callback is not None:
+            callback(result)
     def return_options(self, id=None):
-        with open('gamedata.json', 'r') as g:
-            data = json.load(g)
-        if id is None or id == '':
-            return data[0].get("choice")
-        elif id == 'checkmem':
-            story_list = data[1].get("story", [])
-            if story_list:
-                return story_list[-1].get("id")  # Return the last executed option ID
-            else:
-                return None
-        else:
-            story_list = data[1].get("story", [])
-            for item in story_list:
-                if item.get("id") == str(id):
-                    return item.get("choice")
-        return None
+        with self.profiler.span("save"):
+            return self.save_store.get(id)
 
     def close_option_box(self):
         if self.option_box is not None:
@@ -343,90 +571,205 @@ class StoryWindow:
         if resource_type == 'audio':
             if not (isinstance(settings, int) and 0 <= settings <= 100):
                 raise ValueError("For audio, settings must be an integer between 0 and 100 representing volume.")
-            if not mixer:
-                raise ImportError("pygame is required for audio playback.")
             self.audio_volume = settings
             self.audio_file = address
-            sound = mixer.Sound(address)
-            if l == 'l':
-                sound = mixer.Sound(address)
-                sound.set_volume(settings / 100.0)
-                sound.play(loops=-1)
+            loops = -1 if l == 'l' else 0
+            if self.audio.should_stream(address, loops):
+                # Long background tracks are streamed instead of decoded into memory
+                self.audio_handle = self.audio.play_music(address, settings, loops)
             else:
-                sound.set_volume(settings / 100.0)
-                sound.play()
+                self.audio_handle = self.audio.play(address, settings, loops)
             return f"Audio file '{address}' loaded and playing with volume {settings}"
         # For images (png/gif): settings is [scale, position]
         elif resource_type in ['png', 'gif']:
             if not (isinstance(settings, list) and len(settings) == 2):
                 raise ValueError(f"For {resource_type}, settings must be a list with [scale, position].")
-            try:
-                img = Image.open(address)
-            except Exception as e:
-                raise ValueError("Cannot open image file: " + str(e))
-            if resource_type == 'png' and img.format.lower() not in ['png','jpg','jpeg']:
-                raise ValueError("File format not supported for png. Supported: png, jpg, jpeg.")
-            scaled_img = img.resize(settings[0], Image.LANCZOS)
-            photo_img = ImageTk.PhotoImage(scaled_img)
-            pos = settings[1]
-            self.canvas.create_image(pos[0], pos[1], image=photo_img, anchor="nw")
-            if resource_type == 'png':
-                self.png_settings = {"scale": settings[0], "position": pos, "file": address, "photo": photo_img}
-                return f"PNG file '{address}' loaded with scale {settings[0]} and position {pos}"
+            # Bad paths and formats fail here, where the caller can catch them, not on the asset threads
+            open_image(address, resource_type).close()
+            future = self.assets.request(address, settings[0], resource_type)
+            sprite = None
+            if resource_type == 'gif':
+                # The handle exists right away so it can be paused or stopped before the decode finishes
+                sprite = self.animations.add(settings[1])
+                self.gif_settings = {"scale": settings[0], "position": settings[1], "file": address, "sprite": sprite}
+            if future.done() or self.backend.headless:
+                self._show_image(resource_type, settings, address, future.result(), sprite)
             else:
-                frames = []
-                try:
-                    for frame in ImageSequence.Iterator(img):
-                        frame = frame.resize(settings[0], Image.LANCZOS)
-                        frames.append(ImageTk.PhotoImage(frame))
-                except Exception:
-                    frames = [photo_img]
-                self.gif_settings = {"scale": settings[0], "position": pos, "file": address, "frames": frames}
-                def animate_gif(frame_index=0):
-                    self.canvas.create_image(pos[0], pos[1], image=frames[frame_index], anchor="nw")
-                    self.root.after(100, animate_gif, (frame_index + 1) % len(frames))
-                animate_gif()
-                return f"GIF file '{address}' loaded with scale {settings[0]} and position {pos}"
+                # Decoding runs on the asset threads, only the PhotoImage is made here
+                self.root.after(self.asset_poll, self._wait_for_asset, resource_type, settings, address, future, sprite)
+            if resource_type == 'png':
+                return f"PNG file '{address}' loaded with scale {settings[0]} and position {settings[1]}"
+            return f"GIF file '{address}' loaded with scale {settings[0]} and position {settings[1]}"
         # For video: settings is [volume, scale, position]
         elif resource_type == 'video':
             if not (isinstance(settings, list) and len(settings) == 3):
                 raise ValueError("For video, settings must be a list with [volume, scale, position].")
             if not (isinstance(settings[0], int) and 0 <= settings[0] <= 100):
                 raise ValueError("Video volume must be an integer between 0 and 100.")
+            MediaPlayer = _load_media_player()
+            self.stop_video()
             self.video_settings = {"volume": settings[0], "scale": settings[1], "position": settings[2], "file": address}
             self.video_player = MediaPlayer(address, ff_opts={'paused': False, 'out_fmt': 'rgb24', 'volume': settings[0]/100.0})
+            scale = settings[1] or (self.canvas.winfo_width(), self.canvas.winfo_height())
+            if self.layered:
+                self.video_pipeline = VideoPipeline(self.video_player, scale, settings[2], self.root,
+                                                    LayerCanvas(self.compositor, "video", self.canvas), LayerPhoto,
+                                                    clock=self.backend.clock, profiler=self.profiler)
+            else:
+                self.video_pipeline = VideoPipeline(self.video_player, scale, settings[2], self.root, self.canvas, self.backend.Photo,
+                                                    clock=self.backend.clock, profiler=self.profiler)
             self.update_video()
             return f"Video file '{address}' loaded with volume {settings[0]}, scale {settings[1]}, and position {settings[2]}"
 
-    def update_video(self):
-        if self.video_player is None:
+    def preload(self, items):
+        """
+    Decodes images and sound effects in the background so a later load() finds them ready.
+
+    :param items: List of (resource_type, settings, address) tuples, as passed to load().
+    :return: List of futures resolving to the decoded assets.
+    """
+        futures = []
+        for resource_type, settings, address in items:
+            if resource_type == 'audio':
+                futures.extend(self.audio.preload([address]))
+            elif resource_type in ['png', 'gif']:
+                futures.extend(self.assets.preload([(resource_type, settings[0], address)]))
+            else:
+                raise ValueError("Only png, gif and audio resources can be preloaded.")
+        return futures
+
+    def play_music(self, address, volume=50, fade=1000):
+        """
+    Streams a looping background track, fading out the current one first.
+
+    :param address: Path of the audio file.
+    :param volume: Volume between 0 and 100.
+    :param fade: Fade time in milliseconds.
+    :return: Handle with stop(fade_ms), set_volume(volume) and crossfade(address, volume, duration).
+    """
+        self.audio_handle = self.audio.play_music(address, volume, -1, fade)
+        return self.audio_handle
+
+    def stop_audio(self, fade=0):
+        """
+    Stops every sound effect and the music.
+
+    :param fade: Fade-out time in milliseconds.
+    """
+        self.audio.stop_all(fade)
+
+    def _wait_for_asset(self, resource_type, settings, address, future, sprite=None):
+        if not future.done():
+            self.root.after(self.asset_poll, self._wait_for_asset, resource_type, settings, address, future, sprite)
             return
-        frame, val = self.video_player.get_frame()
-        if frame is None:
-            self.root.after(30, self.update_video)
+        try:
+            asset = future.result()
+        except Exception as e:
+            # Nobody can catch an exception raised from an after() callback
+            self.asset_errors.append((address, e))
+            _log.error("Could not decode %s: %s", address, e)
+            if sprite is not None:
+                sprite.stop()
             return
-        img, pts = frame
+        self._show_image(resource_type, settings, address, asset, sprite)
+
+    def _show_image(self, resource_type, settings, address, asset, sprite=None):
+        if resource_type == 'gif':
+            sprite.attach(asset.frames, asset.durations)
+            return
+        pos = settings[1]
+        with self.profiler.span("upload"):
+            photo_img = self.sprite_photo(asset.frames[0])
+        self.sprite_canvas.create_image(pos[0], pos[1], image=photo_img, anchor="nw")
+        self.png_settings = {"scale": settings[0], "position": pos, "file": address, "photo": photo_img}
+
+    def update_video(self):
+        if self.video_pipeline is None:
+            return
+        self.video_pipeline.start()
+
+    def stop_video(self):
+        if self.video_pipeline is not None:
+            self.video_pipeline.stop()
+        self.video_pipeline = None
+        self.video_player = None
 
-        w, h = img.get_size()
-        img_bytes = img.to_bytearray()[0]
-        np_img = np.frombuffer(img_bytes, dtype=np.uint8).reshape((h, w, 3))  # 3 channels = RGB
+    def video_stats(self):
+        """
+    Returns counters of the current video: decoded, shown, dropped and late frames.
+    """
+        if self.video_pipeline is None:
+            return None
+        return self.video_pipeline.stats()
 
-        pil_img = Image.fromarray(np_img)
 
-        scale = self.video_settings.get("scale", (self.canvas.winfo_width(), self.canvas.winfo_height()))
-        pil_img = pil_img.resize(scale, Image.LANCZOS)
+    def play_story(self, story, prefetch_depth=2, prefetch_budget=64 * 1024 * 1024, on_finish=None):
+        """
+    Plays a declarative story and prefetches the assets of the scenes that can come next.
 
-        self.video_frame = ImageTk.PhotoImage(pil_img)
-        pos = self.video_settings.get("position", (0, 0))
-        self.canvas.create_image(pos[0], pos[1], image=self.video_frame, anchor="nw")
-        self.root.after(30, self.update_video)
+    :param story: Path of a JSON story file, a story dict, or a compiled StoryGraph.
+    :param prefetch_depth: How many choices ahead assets are decoded.
+    :param prefetch_budget: Maximum size of prefetched assets waiting to be used, in bytes.
+    :return: The StoryRunner; its stats() method reports prefetch hit rates.
+    """
+        from .story import StoryGraph, StoryRunner, compile_story, load_story
+        if isinstance(story, str):
+            story = load_story(story)
+        elif not isinstance(story, StoryGraph):
+            story = compile_story(story)
+        runner = StoryRunner(self, story, prefetch_depth, prefetch_budget, on_finish=on_finish)
+        runner.start()
+        return runner
+
+    def render_frame(self):
+        """
+    Composites the current scene (background with warm and noise, sprites, video, dialog and options) into one RGB image.
+    Works in both windowed and headless mode.
+    """
+        if self.layered and self.compositor.is_dirty:
+            self._compose()
+        size = (self.canvas.winfo_width(), self.canvas.winfo_height())
+        frame = self.canvas.scene.render(size, self.background_color)
+        self._mark_first_frame()
+        return frame
+
+    def render_sequence(self, duration, fps=30, as_array=False):
+        """
+    Renders `duration` seconds of the scene at `fps` frames per second.
 
+    :return: List of PIL images, or of NumPy arrays with as_array=True.
+    """
+        if as_array:
+            import numpy as np
+        frames = []
+        step = 1.0 / fps
+        start = self.backend.clock()
+        for i in range(int(round(duration * fps))):
+            if self.backend.headless:
+                self.root.advance(start + i * step - self.root.now)
+            else:
+                time.sleep(max(start + i * step - self.backend.clock(), 0))
+                self.root.update()
+            frame = self.render_frame()
+            frames.append(np.asarray(frame) if as_array else frame)
+        return frames
 
     def start(self):
         self.root.mainloop()
 
-def body(background_image_address=None, background_color="#FFFFFF", warm=0, noise=None):
-    window = StoryWindow(background_image_address, background_color, warm, noise)
+    def run_async(self, story, poll_interval=1 / 120.0):
+        """
+    Runs a story written as a coroutine, with awaitable dialog, option, load and wait calls.
+
+    :param story: Async function taking an AsyncStory, e.g. `async def story(s): await s.dialog("Hi")`.
+    :param poll_interval: Seconds between two passes of the Tk event loop.
+    :return: What the coroutine returns, or None if the window was closed first.
+    """
+        from .aio import run
+        return run(self, story, poll_interval)
+
+def body(background_image_address=None, background_color="#FFFFFF", warm=0, noise=None, noise_tick=200, noise_pool=8, save_backend='jsonl', save_slot='default', headless=False, size=(800, 600), layered=False, asset_pack=None, profile=False):
+    window = StoryWindow(background_image_address, background_color, warm, noise, noise_tick, noise_pool, save_backend, save_slot, headless, size, layered, asset_pack, profile)
     return window
 
 def noise(randomness, pattern, blur_val):
@@ -435,3 +778,6 @@ def noise(randomness, pattern, blur_val):
     if not (0 <= randomness <= 100) or not (0 <= blur_val <= 100):
         raise ValueError("randomness and blur_val must be between 0 and 100")
     return (randomness, pattern, blur_val)
+
+
+_IMPORT_TIME = time.perf_counter() - _IMPORT_STARTED
@@ -0,0 +1,177 @@
+"""
+Color grading with per-channel lookup tables.
+
+Warm/cool, tint, brightness and contrast are all per-channel curves, so they fold into
+one 768-entry table that Image.point() applies in a single pass over the resized
+background. The vignette depends on the pixel position, so it is a cached mask that
+gets multiplied in afterwards. Transitions interpolate the tables and masks instead
+of grading or resizing the source again.
+"""
+import struct
+from functools import lru_cache
+from PIL import Image, ImageChops
+
+from .render import _rgb
+
+WARM_COLOR = (255, 0, 0)
+COOL_COLOR = (0, 0, 255)
+IDENTITY_LUT = list(range(256)) * 3
+
+
+class Grade:
+    """
+    A color grade for the background.
+
+    :param warm: -100 to 100. Blends towards red (warm) or blue (cool) by that percentage.
+    :param tint: (color, percent) blend towards any color, e.g. ("#203040", 20), or None.
+    :param brightness: Multiplier applied after the blends; 1.0 leaves the image unchanged.
+    :param contrast: Multiplier of the distance from mid grey; 1.0 leaves the image unchanged.
+    :param vignette: 0 to 100. How much the corners are darkened.
+    """
+
+    def __init__(self, warm=0, tint=None, brightness=1.0, contrast=1.0, vignette=0):
+        if tint is not None:
+            color, strength = tint
+            rgb = _rgb(color)
+            if rgb is None:
+                raise ValueError("Invalid tint color: " + str(color))
+            tint = (tuple(rgb), strength) if strength else None
+        if not 0 <= vignette <= 100:
+            raise ValueError("vignette must be between 0 and 100")
+        self.warm = warm
+        self.tint = tint
+        self.brightness = float(brightness)
+        self.contrast = float(contrast)
+        self.vignette = vignette
+
+    @classmethod
+    def from_key(cls, key):
+        if isinstance(key, Grade):
+            return key
+        if isinstance(key, tuple):
+            return cls(*key[1:])
+        return cls(warm=key)
+
+    @property
+    def key(self):
+        """Hashable cache key. A warm-only grade keys as its warm value, like the warm variants in asset packs."""
+        if self.tint is None and self.brightness == 1.0 and self.contrast == 1.0 and not self.vignette:
+            return self.warm
+        return ("grade", self.warm, self.tint, self.brightness, self.contrast, self.vignette)
+
+    @property
+    def identity(self):
+        return self.key == 0
+
+    def replace(self, **changes):
+        values = {"warm": self.warm, "tint": self.tint, "brightness": self.brightness,
+                  "contrast": self.contrast, "vignette": self.vignette}
+        values.update(changes)
+        return Grade(**values)
+
+    def lut(self):
+        return _lut(self.warm, self.tint, self.brightness, self.contrast)
+
+    def __eq__(self, other):
+        return isinstance(other, Grade) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return "Grade(warm=%r, tint=%r, brightness=%r, contrast=%r, vignette=%r)" % (
+            self.warm, self.tint, self.brightness, self.contrast, self.vignette)
+
+
+def _f32(value):
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+
+@lru_cache(maxsize=64)
+def _lut(warm, tint, brightness, contrast):
+    blends = []
+    if warm:
+        blends.append((COOL_COLOR if warm < 0 else WARM_COLOR, _f32(abs(warm) / 100.0)))
+    if tint is not None:
+        blends.append((tint[0], _f32(tint[1] / 100.0)))
+    lut = []
+    for channel in range(3):
+        for value in range(256):
+            v = value
+            for color, factor in blends:
+                # Image.blend's arithmetic: float32 alpha and products, truncated back to 8 bits
+                v = min(max(int(_f32(v + _f32(factor * (color[channel] - v)))), 0), 255)
+            if brightness != 1.0 or contrast != 1.0:
+                v = min(max(int((v * brightness - 128.0) * contrast + 128.0), 0), 255)
+            lut.append(v)
+    return lut
+
+
+@lru_cache(maxsize=8)
+def vignette_mask(size, strength):
+    """RGB mask to multiply with: white in the middle, corners darkened by `strength` percent."""
+    falloff = strength / 100.0
+    gradient = Image.radial_gradient("L").point(lambda g: int(255 - 255 * falloff * (g / 255.0) ** 2 + 0.5))
+    mask = gradient.resize(size, Image.BILINEAR)
+    return Image.merge("RGB", (mask, mask, mask))
+
+
+def grade_image(image, grade, lut=None, mask=None):
+    """
+    Applies `grade` to an RGB image. `lut` and `mask` override the grade's own table and
+    vignette mask, which is how transitions show the frames in between.
+    """
+    if lut is None:
+        lut = None if grade.identity else grade.lut()
+        if mask is None and grade.vignette:
+            mask = vignette_mask(image.size, grade.vignette)
+    if lut is not None and lut != IDENTITY_LUT:
+        image = image.point(lut)
+    if mask is not None:
+        image = ImageChops.multiply(image, mask)
+    return image
+
+
+def lerp_lut(a, b, t):
+    return [int(x + (y - x) * t + 0.5) for x, y in zip(a, b)]
+
+
+class GradeTransition:
+    """
+    Frames between two grades. Every frame is one table lookup (plus one mask multiply
+    when either grade has a vignette) over the same resized base image.
+
+    `start_lut` and `start_vignette` let a transition start from the middle of another one.
+    """
+
+    def __init__(self, start, end, frames, start_lut=None, start_vignette=None):
+        self.end = end
+        self.frames = max(int(frames), 1)
+        self.frame = 0
+        self.start_lut = start_lut if start_lut is not None else start.lut()
+        self.end_lut = end.lut()
+        self.start_vignette = start.vignette if start_vignette is None else start_vignette
+        self.lut = self.start_lut
+        self.vignette = self.start_vignette
+
+    @property
+    def done(self):
+        return self.frame >= self.frames
+
+    def step(self, base):
+        """Advances one frame and returns `base` graded for it."""
+        self.frame += 1
+        t = self.frame / float(self.frames)
+        self.lut = lerp_lut(self.start_lut, self.end_lut, t)
+        self.vignette = self.start_vignette + (self.end.vignette - self.start_vignette) * t
+        return self.render(base)
+
+    def render(self, base):
+        """`base` graded for the current frame."""
+        mask = None
+        if self.start_vignette or self.end.vignette:
+            # The mask is linear in the strength, so blending the two end masks gives the one in between
+            t = self.frame / float(self.frames)
+            mask = Image.blend(vignette_mask(base.size, self.start_vignette),
+                               vignette_mask(base.size, self.end.vignette), t)
+        return grade_image(base, self.end, self.lut, mask)
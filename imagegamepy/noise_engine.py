@@ -0,0 +1,175 @@
+import numpy as np
+from PIL import Image
+
+NOISE_PATTERNS = ("HL", "VL", "CL")
+NOISE_ALPHA = 0.3
+
+
+def _gaussian_kernel(blur_val):
+    # Same radius as the ImageFilter.GaussianBlur(blur_val / 10.0) used before
+    sigma = blur_val / 10.0
+    if sigma <= 0:
+        return None
+    half = max(int(np.ceil(sigma * 3)), 1)
+    x = np.arange(-half, half + 1, dtype=np.float32)
+    kernel = np.exp(-(x * x) / (2 * sigma * sigma))
+    return kernel / kernel.sum()
+
+
+def _blur_axis(array, kernel, axis):
+    if kernel is None:
+        return array
+    half = len(kernel) // 2
+    pad = [(0, 0)] * array.ndim
+    pad[axis] = (half, half)
+    padded = np.pad(array, pad, mode="constant")
+    out = np.zeros_like(array)
+    length = array.shape[axis]
+    for i, weight in enumerate(kernel):
+        out += weight * np.take(padded, range(i, i + length), axis=axis)
+    return out
+
+
+def _runs(profile):
+    """(start, stop) ranges where a 1-D profile is visibly non-zero."""
+    visible = profile.max(axis=1) >= 0.5
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], visible.astype(np.int8), [0]))))
+    return [(int(start), int(stop)) for start, stop in zip(edges[0::2], edges[1::2])]
+
+
+class NoiseEngine:
+    """
+    Builds noise frames for the "HL", "VL" and "CL" patterns with NumPy and
+    keeps them in a ring buffer so the noise loop only has to cycle through them.
+
+    :param pool_size: Number of pre-blended frames kept for the current background.
+    :param seed: Optional seed for reproducible noise.
+    """
+
+    def __init__(self, pool_size=8, seed=None):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.pool_size = pool_size
+        self.rng = np.random.default_rng(seed)
+        self.key = None
+        self.frames = []
+        self.overlays = []
+        self.index = 0
+        self._base = None
+        self._noise_params = None
+
+    def build(self, image, noise_params, key=None):
+        """Prepares a new pool for `image`. Frames are generated lazily as they are cycled."""
+        randomness, pattern, blur_val = noise_params
+        if pattern not in NOISE_PATTERNS:
+            raise ValueError("unrecognized noise patterns")
+        # Everything outside the noise shapes is just the darkened background
+        self._base = np.asarray(image.convert("RGB"), dtype=np.float32) * (1.0 - NOISE_ALPHA)
+        self._noise_params = noise_params
+        self.frames = [None] * self.pool_size
+        self.overlays = [None] * self.pool_size
+        self.index = 0
+        self.key = key
+
+    def is_current(self, key):
+        return self.key is not None and self.key == key
+
+    def invalidate(self):
+        self.key = None
+        self.frames = []
+        self.overlays = []
+        self._base = None
+
+    def next_frame(self):
+        """Returns (slot, frame) for the next slot of the ring buffer."""
+        if self._base is None:
+            raise RuntimeError("NoiseEngine.build must be called before next_frame")
+        slot = self.index
+        if self.frames[slot] is None:
+            self.frames[slot] = self._render(self._base, self._noise_params)
+        self.index = (slot + 1) % self.pool_size
+        return slot, self.frames[slot]
+
+    def render(self, image, noise_params):
+        """Renders a single noisy frame of `image` without touching the pool."""
+        base = np.asarray(image.convert("RGB"), dtype=np.float32) * (1.0 - NOISE_ALPHA)
+        return self._render(base, noise_params)
+
+    def _render(self, base, noise_params):
+        frame = base.copy()
+        for x, y, patch in self._shapes(frame.shape[0], frame.shape[1], noise_params):
+            frame[y:y + patch.shape[0], x:x + patch.shape[1]] += patch
+        np.clip(frame, 0, 255, out=frame)
+        return Image.fromarray(frame.astype(np.uint8), "RGB")
+
+    def base_image(self):
+        """The darkened background every noise frame is blended onto."""
+        return Image.fromarray(self._base.astype(np.uint8), "RGB")
+
+    def next_overlay(self):
+        """
+        Returns (slot, patches) for the next slot, where patches is a list of (x, y, RGB image)
+        to be added onto base_image(). Used by the layered compositor, which then only
+        redraws the rectangles the noise shapes cover.
+        """
+        if self._base is None:
+            raise RuntimeError("NoiseEngine.build must be called before next_overlay")
+        slot = self.index
+        if self.overlays[slot] is None:
+            height, width = self._base.shape[:2]
+            self.overlays[slot] = [
+                (x, y, Image.fromarray(np.clip(patch, 0, 255).astype(np.uint8), "RGB"))
+                for x, y, patch in self._shapes(height, width, self._noise_params)
+            ]
+        self.index = (slot + 1) % self.pool_size
+        return slot, self.overlays[slot]
+
+    def _shapes(self, height, width, noise_params):
+        """Yields (x, y, float patch) blocks already scaled by the noise opacity."""
+        randomness, pattern, blur_val = noise_params
+        num_elements = max(int(randomness * 10 / 100), 1)
+        kernel = _gaussian_kernel(blur_val)
+        if pattern == "HL":
+            rows = NOISE_ALPHA * self._line_profile(height, num_elements, kernel)
+            for start, stop in _runs(rows):
+                yield 0, start, np.broadcast_to(rows[start:stop, None, :], (stop - start, width, 3))
+        elif pattern == "VL":
+            cols = NOISE_ALPHA * self._line_profile(width, num_elements, kernel)
+            for start, stop in _runs(cols):
+                yield start, 0, np.broadcast_to(cols[None, start:stop, :], (height, stop - start, 3))
+        else:
+            for x, y, patch in self._circles(height, width, num_elements, kernel):
+                yield x, y, NOISE_ALPHA * patch
+
+    def _random_color(self):
+        return self.rng.integers(100, 201, size=3).astype(np.float32)
+
+    def _line_profile(self, length, num_elements, kernel):
+        # A full-width line only varies along one axis, so draw and blur a 1-D profile
+        profile = np.zeros((length, 3), dtype=np.float32)
+        starts = self.rng.integers(0, length, size=num_elements)
+        thicknesses = self.rng.integers(1, 8, size=num_elements)
+        for start, thickness in zip(starts, thicknesses):
+            profile[start:start + thickness + 1] = self._random_color()
+        return _blur_axis(profile, kernel, 0)
+
+    def _circles(self, height, width, num_elements, kernel):
+        pad = len(kernel) // 2 if kernel is not None else 0
+        for _ in range(num_elements):
+            radius = int(self.rng.integers(5, 21))
+            cx = int(self.rng.integers(0, width + 1))
+            cy = int(self.rng.integers(0, height + 1))
+            color = self._random_color()
+            # Draw the outline into a small patch around the circle only
+            half = radius + 1 + pad
+            ys, xs = np.mgrid[-half:half + 1, -half:half + 1]
+            dist = np.sqrt(xs * xs + ys * ys)
+            ring = (np.abs(dist - radius + 0.5) <= 0.5).astype(np.float32)
+            patch = ring[:, :, None] * color
+            patch = _blur_axis(_blur_axis(patch, kernel, 0), kernel, 1)
+            x0, y0 = cx - half, cy - half
+            fx0, fy0 = max(x0, 0), max(y0, 0)
+            fx1, fy1 = min(x0 + patch.shape[1], width), min(y0 + patch.shape[0], height)
+            if fx0 >= fx1 or fy0 >= fy1:
+                continue
+            yield fx0, fy0, patch[fy0 - y0:fy1 - y0, fx0 - x0:fx1 - x0]
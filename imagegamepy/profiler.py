@@ -0,0 +1,341 @@
+"""
+Timing spans for the Tk thread.
+
+A Profiler attached to a StoryWindow wraps every root.after() callback and every key
+or <Configure> handler in a span named after the function. The window also opens
+spans around its heavy stages: decode, resize, grade, upload, canvas and save.
+Spans feed rolling statistics per name. They can be exported as Chrome trace JSON
+for chrome://tracing or https://ui.perfetto.dev.
+
+While no profiler is attached nothing is wrapped, and the stage spans go to
+NULL_PROFILER, whose span() hands back one shared no-op context manager.
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+LATE_THRESHOLD_MS = 16.7
+STAGES = ("decode", "resize", "grade", "upload", "canvas", "save")
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class NullProfiler:
+    """Used while profiling is off: spans cost one method call and record nothing."""
+
+    enabled = False
+
+    def span(self, name, category="stage", **args):
+        return _NULL_SPAN
+
+    def wrap(self, name, func, category="stage"):
+        return func
+
+
+NULL_PROFILER = NullProfiler()
+
+
+def _percentile(samples, fraction):
+    return samples[min(int(round(fraction * (len(samples) - 1))), len(samples) - 1)]
+
+
+class RollingStats:
+    """The last `size` durations of one span name, plus counts since the last reset."""
+
+    def __init__(self, size):
+        self.samples = deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.late = 0
+
+    def add(self, duration, late=False):
+        self.samples.append(duration)
+        self.count += 1
+        self.total += duration
+        if late:
+            self.late += 1
+
+    def summary(self):
+        samples = sorted(self.samples)
+        if not samples:
+            return {"count": 0, "p50_ms": None, "p95_ms": None, "max_ms": None, "total_ms": 0.0, "late": 0}
+        return {
+            "count": self.count,
+            "p50_ms": _percentile(samples, 0.5) * 1000.0,
+            "p95_ms": _percentile(samples, 0.95) * 1000.0,
+            "max_ms": samples[-1] * 1000.0,
+            "total_ms": self.total * 1000.0,
+            "late": self.late,
+        }
+
+
+class _Span:
+    def __init__(self, profiler, name, category, args):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.record(self.name, self.category, self.start, time.perf_counter(), self.args)
+        return False
+
+
+def callback_name(func):
+    func = getattr(func, "func", func)  # functools.partial
+    return getattr(func, "__qualname__", None) or getattr(func, "__name__", None) or repr(func)
+
+
+class Profiler:
+    """
+    Collects spans of one StoryWindow.
+
+    Frame time is the time each callback or handler kept the Tk thread busy, excluding
+    the callbacks that ran nested inside it (e.g. while option() waits for a key).
+    A callback that starts more than `late_threshold_ms` after its due time counts as late.
+
+    :param clock: Scheduling clock of the window, used to measure lateness.
+    :param history: Number of durations kept per span name for the percentiles.
+    :param trace_limit: Number of spans kept for the Chrome trace export.
+    """
+
+    def __init__(self, clock=time.monotonic, history=1000, trace_limit=200000, late_threshold_ms=LATE_THRESHOLD_MS):
+        self.enabled = True
+        self.clock = clock
+        self.history = history
+        self.late_threshold = late_threshold_ms / 1000.0
+        self.spans = {}
+        self.frames = RollingStats(history)
+        self.late_callbacks = 0
+        self.trace = deque(maxlen=trace_limit)
+        self.window = None
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+        self._threads = {}
+        self._nested = []
+        self._patched = []
+        self._overlay = None
+        self._overlay_job = None
+
+    def span(self, name, category="stage", **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, category, args or None)
+
+    def wrap(self, name, func, category="stage"):
+        """`func` timed as a span named `name`, for work handed to other threads or objects."""
+        profiler = self
+
+        def wrapped(*args, **kw):
+            if not profiler.enabled:
+                return func(*args, **kw)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kw)
+            finally:
+                profiler.record(name, category, start, time.perf_counter())
+
+        return wrapped
+
+    def record(self, name, category, start, end, args=None, late=False):
+        thread = threading.current_thread()
+        with self._lock:
+            stats = self.spans.get(name)
+            if stats is None:
+                stats = self.spans[name] = (category, RollingStats(self.history))
+            stats[1].add(end - start, late)
+            self._threads.setdefault(thread.ident, thread.name)
+            self.trace.append((name, category, start, end - start, thread.ident, args))
+
+    def _callback(self, func, category, name, due=None):
+        """Wraps a Tk callback or event handler in a span that also counts towards frame time."""
+        profiler = self
+
+        def callback(*args):
+            if not profiler.enabled:
+                return func(*args)
+            late_by = profiler.clock() - due if due is not None else 0.0
+            profiler._nested.append(0.0)
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                end = time.perf_counter()
+                nested = profiler._nested.pop()
+                if profiler._nested:
+                    profiler._nested[-1] += end - start
+                late = late_by > profiler.late_threshold
+                with profiler._lock:
+                    profiler.frames.add(end - start - nested, late)
+                    if late:
+                        profiler.late_callbacks += 1
+                profiler.record(name, category, start, end, {"late_ms": late_by * 1000.0} if due is not None else None, late)
+
+        return callback
+
+    def _patch(self, obj, attr, replacement):
+        self._patched.append((obj, attr, attr in vars(obj), getattr(obj, attr)))
+        setattr(obj, attr, replacement)
+
+    def attach(self, window):
+        """
+        Starts timing the callbacks and handlers of `window` and routes its stage spans here.
+
+        Handlers bound before attaching are re-wrapped where they can be read back: all of
+        them on a headless window. Tk does not hand bound Python functions back, so there only
+        <Configure> is re-wrapped. Keys bound earlier, like the keys of an option menu that is
+        already open or a StoryRunner's advance key, are timed from the next time they are bound.
+        """
+        self.window = window
+        profiler = self
+        root, canvas = window.root, window.canvas
+        after = root.after
+
+        def timed_after(ms, func=None, *args):
+            if func is None:
+                return after(ms)
+            # Tk's after_idle() comes through here too, with ms 'idle' and no due time
+            due = profiler.clock() + ms / 1000.0 if isinstance(ms, (int, float)) else None
+            return after(ms, profiler._callback(func, "callback", callback_name(func), due), *args)
+
+        self._patch(root, "after", timed_after)
+        for widget in (root, canvas):
+            self._patch(widget, "bind", self._timed_bind(widget.bind))
+        # Handlers bound before profiling started
+        for widget in (root, canvas):
+            for sequence, func in list(getattr(widget, "bindings", {}).items()):
+                if func is not None:
+                    widget.bind(sequence, func)
+        if not hasattr(canvas, "bindings"):
+            canvas.bind("<Configure>", window.resize_image)
+        self._patch(window.animations, "make_photo", self.wrap("upload", window.animations.make_photo))
+        for obj in (window, window.background_cache, window.assets):
+            self._patch(obj, "profiler", self)
+        if window.video_pipeline is not None:
+            self._patch(window.video_pipeline, "profiler", self)
+        return self
+
+    def _timed_bind(self, bind):
+        profiler = self
+
+        def timed_bind(sequence=None, func=None, add=None):
+            if func is None:
+                return bind(sequence, func, add)
+            return bind(sequence, profiler._callback(func, "handler", "%s %s" % (sequence, callback_name(func))), add)
+
+        return timed_bind
+
+    def detach(self):
+        """Stops collecting. Callbacks already scheduled run unwrapped; the statistics stay readable."""
+        self.hide_overlay()
+        self.enabled = False
+        for obj, attr, had_own, value in reversed(self._patched):
+            if had_own:
+                setattr(obj, attr, value)
+            else:
+                delattr(obj, attr)
+        self._patched = []
+
+    def stats(self):
+        """
+        Frame time and per-span statistics in milliseconds: p50, p95 and max over the last
+        `history` durations, plus counts and totals since the last reset().
+        """
+        with self._lock:
+            spans = {name: (category, stats.summary()) for name, (category, stats) in self.spans.items()}
+            frame = self.frames.summary()
+        return {
+            "frame": frame,
+            "late_callbacks": self.late_callbacks,
+            "callbacks": {name: s for name, (category, s) in spans.items() if category in ("callback", "handler")},
+            "stages": {name: s for name, (category, s) in spans.items() if category == "stage"},
+        }
+
+    def slowest(self, count=5):
+        """Names of the callbacks and handlers with the highest max time, slowest first."""
+        callbacks = self.stats()["callbacks"]
+        return sorted(callbacks, key=lambda name: callbacks[name]["max_ms"], reverse=True)[:count]
+
+    def reset(self):
+        with self._lock:
+            self.spans.clear()
+            self.frames = RollingStats(self.history)
+            self.late_callbacks = 0
+            self.trace.clear()
+
+    def chrome_trace(self):
+        """The recorded spans in the Chrome trace event format."""
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.trace)
+            threads = dict(self._threads)
+        events = [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+                  for tid, name in threads.items()]
+        for name, category, start, duration, tid, args in spans:
+            event = {"name": name, "cat": category, "ph": "X", "pid": pid, "tid": tid,
+                     "ts": (start - self._origin) * 1e6, "dur": duration * 1e6}
+            if args:
+                event["args"] = args
+            events.append(event)
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def save_trace(self, path):
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def show_overlay(self, interval=500, position=(10, 10)):
+        """Shows live frame-time stats in a corner of the canvas, refreshed every `interval` ms."""
+        if self._overlay is not None or self.window is None:
+            return
+        canvas = self.window.canvas
+        x, y = position
+        rect = canvas.create_rectangle(x, y, x + 300, y + 54, fill="black", outline="")
+        text = canvas.create_text(x + 6, y + 4, anchor="nw", fill="#00ff66", font=("Courier", 10), text="")
+        self._overlay = (rect, text, interval)
+        self._refresh_overlay()
+
+    def _refresh_overlay(self):
+        self._overlay_job = None
+        if self._overlay is None:
+            return
+        rect, text, interval = self._overlay
+        frame = self.stats()["frame"]
+        slowest = self.slowest(1)
+        lines = [
+            "frame p50 %s  p95 %s  max %s" % tuple(_ms(frame[key]) for key in ("p50_ms", "p95_ms", "max_ms")),
+            "late callbacks %d" % self.late_callbacks,
+            "slowest %s" % (slowest[0] if slowest else "-"),
+        ]
+        canvas = self.window.canvas
+        canvas.itemconfig(text, text="\n".join(lines))
+        canvas.tag_raise(rect)
+        canvas.tag_raise(text)
+        self._overlay_job = self.window.root.after(interval, self._refresh_overlay)
+
+    def hide_overlay(self):
+        if self._overlay is None:
+            return
+        if self._overlay_job is not None:
+            self.window.root.after_cancel(self._overlay_job)
+            self._overlay_job = None
+        self.window.canvas.delete(self._overlay[0], self._overlay[1])
+        self._overlay = None
+
+
+def _ms(value):
+    return "-" if value is None else "%.1fms" % value
@@ -0,0 +1,562 @@
+import heapq
+import itertools
+import time
+import tkinter as tk
+import tkinter.font as tkfont
+from PIL import Image, ImageTk, ImageDraw, ImageFont, ImageColor
+
+
+def _rgb(color, default=None):
+    if color is None or color == '':
+        return default
+    if isinstance(color, tuple):
+        return color[:3]
+    try:
+        return ImageColor.getrgb(color)[:3]
+    except ValueError:
+        return default
+
+
+_fonts = {}
+
+
+def pil_font(font):
+    """Returns a PIL font for a Tk font description such as ("Helvetica", 14)."""
+    size = font[1] if isinstance(font, tuple) and len(font) > 1 else 14
+    cached = _fonts.get(size)
+    if cached is None:
+        try:
+            cached = ImageFont.truetype("DejaVuSans.ttf", size)
+        except OSError:
+            try:
+                cached = ImageFont.load_default(size)
+            except TypeError:
+                cached = ImageFont.load_default()
+        _fonts[size] = cached
+    return cached
+
+
+def wrap_text(text, font, width):
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split(" "):
+            candidate = word if not line else line + " " + word
+            if line and width and font.getlength(candidate) > width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        lines.append(line)
+    return lines
+
+
+class CanvasItem:
+    def __init__(self, kind, coords, options):
+        self.kind = kind
+        self.coords = list(coords)
+        self.options = options
+
+
+class Scene:
+    """
+    Retained copy of the canvas items, used to composite a frame without Tk.
+
+    Items are kept in stacking order. Image items point at photos that carry their PIL
+    image in a `pil` attribute, window items at widgets that can report their text.
+    """
+
+    def __init__(self):
+        self.items = {}
+        self._ids = itertools.count(1)
+
+    def add(self, kind, coords, options, item_id=None):
+        if item_id is None:
+            item_id = next(self._ids)
+        if len(coords) == 1 and isinstance(coords[0], (tuple, list)):
+            coords = coords[0]
+        self.items[item_id] = CanvasItem(kind, coords, dict(options))
+        return item_id
+
+    def config(self, item_id, options):
+        item = self.items.get(item_id)
+        if item is not None:
+            item.options.update(options)
+
+    def set_coords(self, item_id, coords):
+        item = self.items.get(item_id)
+        if item is not None and coords:
+            item.coords = list(coords)
+
+    def insert(self, item_id, text):
+        item = self.items.get(item_id)
+        if item is not None:
+            item.options["text"] = item.options.get("text", "") + text
+
+    def delete(self, item_id):
+        self.items.pop(item_id, None)
+
+    def raise_item(self, item_id):
+        item = self.items.pop(item_id, None)
+        if item is not None:
+            self.items[item_id] = item
+
+    def render(self, size, background_color="#FFFFFF"):
+        frame = Image.new("RGB", size, _rgb(background_color, (255, 255, 255)))
+        for item in list(self.items.values()):
+            if item.options.get("state") == "hidden":
+                continue
+            draw_item = getattr(self, "_draw_" + item.kind, None)
+            if draw_item is not None:
+                draw_item(frame, item)
+        return frame
+
+    def _draw_image(self, frame, item):
+        image = getattr(item.options.get("image"), "pil", None)
+        if image is None:
+            return
+        x, y = int(item.coords[0]), int(item.coords[1])
+        if item.options.get("anchor", "center") == "center":
+            x -= image.size[0] // 2
+            y -= image.size[1] // 2
+        if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+            image = image.convert("RGBA")
+            frame.paste(image, (x, y), image)
+        else:
+            frame.paste(image.convert("RGB"), (x, y))
+
+    def _draw_rectangle(self, frame, item):
+        x1, y1, x2, y2 = [int(c) for c in item.coords[:4]]
+        fill = _rgb(item.options.get("fill"))
+        outline = _rgb(item.options.get("outline"), None if "outline" in item.options else (0, 0, 0))
+        if fill is not None:
+            box = (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+            if item.options.get("stipple"):
+                # Tk's gray50 stipple shows every other pixel, which reads as 50% opacity
+                region = frame.crop(box)
+                frame.paste(Image.blend(region, Image.new("RGB", region.size, fill), 0.5), box[:2])
+            else:
+                ImageDraw.Draw(frame).rectangle(box, fill=fill)
+        if outline is not None:
+            ImageDraw.Draw(frame).rectangle((x1, y1, x2, y2), outline=outline, width=int(item.options.get("width", 1)))
+
+    def _draw_text(self, frame, item):
+        text = item.options.get("text", "")
+        if not text:
+            return
+        font = pil_font(item.options.get("font"))
+        fill = _rgb(item.options.get("fill"), (0, 0, 0))
+        lines = wrap_text(text, font, item.options.get("width"))
+        line_height = font.getbbox("Ay")[3] + 2
+        x, y = item.coords[0], item.coords[1]
+        anchor = item.options.get("anchor", "center")
+        if anchor == "center":
+            y -= line_height * len(lines) / 2
+        draw = ImageDraw.Draw(frame)
+        for i, line in enumerate(lines):
+            lx = x - font.getlength(line) / 2 if anchor == "center" else x
+            draw.text((lx, y + i * line_height), line, fill=fill, font=font)
+
+    def _draw_window(self, frame, item):
+        widget = item.options.get("window")
+        width = int(item.options.get("width") or 0)
+        height = int(item.options.get("height") or 0)
+        if widget is None or not hasattr(widget, "get") or not width or not height:
+            return
+        x, y = int(item.coords[0]), int(item.coords[1])
+        bg = _rgb(widget.cget("bg"), (255, 255, 255))
+        fg = _rgb(widget.cget("fg"), (0, 0, 0))
+        border = int(widget.cget("bd") or 0)
+        ImageDraw.Draw(frame).rectangle((x, y, x + width - 1, y + height - 1), fill=bg)
+        font = pil_font(widget.cget("font") if isinstance(widget.cget("font"), tuple) else ("Helvetica", 14))
+        text = widget.get("1.0", "end-1c")
+        lines = wrap_text(text, font, width - 2 * border)
+        line_height = font.getbbox("Ay")[3] + 4
+        visible = max((height - 2 * border) // line_height, 1)
+        draw = ImageDraw.Draw(frame)
+        # Like the Text widget scrolled to "end", only the last lines are visible
+        for i, line in enumerate(lines[-visible:]):
+            draw.text((x + border, y + border + i * line_height), line, fill=fg, font=font)
+
+
+class RecordingCanvas(tk.Canvas):
+    """tk.Canvas that mirrors its items into a Scene so frames can be rendered from Tk too."""
+
+    def __init__(self, master=None, **kw):
+        super().__init__(master, **kw)
+        self.scene = Scene()
+
+    def _create(self, kind, args, kw):
+        item_id = getattr(super(), "create_" + kind)(*args, **kw)
+        self.scene.add(kind, args, kw, item_id)
+        return item_id
+
+    def create_image(self, *args, **kw):
+        return self._create("image", args, kw)
+
+    def create_rectangle(self, *args, **kw):
+        return self._create("rectangle", args, kw)
+
+    def create_text(self, *args, **kw):
+        return self._create("text", args, kw)
+
+    def create_window(self, *args, **kw):
+        return self._create("window", args, kw)
+
+    def itemconfig(self, tagOrId, cnf=None, **kw):
+        self.scene.config(tagOrId, dict(cnf or {}, **kw))
+        return super().itemconfig(tagOrId, cnf, **kw)
+
+    itemconfigure = itemconfig
+
+    def coords(self, *args):
+        if len(args) > 1:
+            self.scene.set_coords(args[0], args[1:])
+        return super().coords(*args)
+
+    def insert(self, *args):
+        if len(args) == 3:
+            self.scene.insert(args[0], args[2])
+        return super().insert(*args)
+
+    def delete(self, *args):
+        for item_id in args:
+            self.scene.delete(item_id)
+        return super().delete(*args)
+
+    def tag_raise(self, *args):
+        self.scene.raise_item(args[0])
+        return super().tag_raise(*args)
+
+
+class RecordedPhoto(ImageTk.PhotoImage):
+    """ImageTk.PhotoImage that keeps its PIL image so the Scene can composite it."""
+
+    def __init__(self, image=None, size=None, **kw):
+        super().__init__(image, size, **kw)
+        self.pil = image if isinstance(image, Image.Image) else Image.new(image, size)
+
+    def paste(self, im, *args, **kw):
+        super().paste(im, *args, **kw)
+        self.pil = im
+
+
+class HeadlessPhoto:
+    """Stand-in for ImageTk.PhotoImage that only holds the PIL image."""
+
+    def __init__(self, image=None, size=None, **kw):
+        self.pil = image if isinstance(image, Image.Image) else Image.new(image, size)
+
+    def paste(self, im, *args, **kw):
+        self.pil = im
+
+    def width(self):
+        return self.pil.size[0]
+
+    def height(self):
+        return self.pil.size[1]
+
+
+class HeadlessVar:
+    def __init__(self, master=None, value=None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def set(self, value):
+        self.value = value
+
+
+class HeadlessEvent:
+    def __init__(self, widget=None, width=0, height=0, delta=0):
+        self.widget = widget
+        self.width = width
+        self.height = height
+        self.delta = delta
+
+
+class HeadlessRoot:
+    """
+    Tk root replacement with a virtual clock.
+
+    after() callbacks run when the clock is advanced with advance() or run_for().
+    Key presses are fed with feed(). advance() dispatches them in order while their key
+    is bound, and keeps the rest queued for a menu that has not opened yet. update() only
+    runs callbacks, because option() calls it before binding its keys. wait_variable()
+    consumes the keys one at a time, or asks `input_provider` for more, and raises if
+    nothing can ever set the variable.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+        self.jobs = []
+        self.cancelled = set()
+        self.bindings = {}
+        self.events = []
+        self.input_provider = None
+        self._ids = itertools.count(1)
+        self._quit = False
+        self._busy = False
+
+    def clock(self):
+        return self.now
+
+    def title(self, *args):
+        pass
+
+    def after(self, ms, func=None, *args):
+        job_id = "after#%d" % next(self._ids)
+        heapq.heappush(self.jobs, (self.now + ms / 1000.0, job_id, func, args))
+        return job_id
+
+    def after_cancel(self, job_id):
+        self.cancelled.add(job_id)
+
+    def _run_next(self, until):
+        while self.jobs:
+            due, job_id, func, args = self.jobs[0]
+            if due > until:
+                return False
+            heapq.heappop(self.jobs)
+            if job_id in self.cancelled:
+                self.cancelled.discard(job_id)
+                continue
+            self.now = max(self.now, due)
+            func(*args)
+            return True
+        return False
+
+    def _process(self, until, dispatch):
+        # Only the outermost advance() dispatches: a callback may be opening a menu whose keys are not bound yet
+        dispatch = dispatch and not self._busy
+        busy, self._busy = self._busy, True
+        try:
+            while True:
+                if self._run_next(self.now):
+                    continue
+                if dispatch and self.events and self.events[0] in self.bindings:
+                    self.event_generate(self.events.pop(0))
+                    continue
+                if not self._run_next(until):
+                    return
+        finally:
+            self._busy = busy
+
+    def advance(self, seconds):
+        """Moves the clock forward, running every callback that becomes due and dispatching fed keys."""
+        until = self.now + seconds
+        self._process(until, True)
+        self.now = until
+
+    run_for = advance
+
+    def update(self):
+        self._process(self.now, False)
+
+    update_idletasks = update
+
+    def bind(self, sequence, func=None, add=None):
+        self.bindings[sequence] = func
+
+    def unbind(self, sequence, funcid=None):
+        self.bindings.pop(sequence, None)
+
+    def feed(self, *sequences):
+        """Queues key events such as '<Down>' or '<Return>' for option menus."""
+        self.events.extend(sequences)
+
+    def event_generate(self, sequence, **kw):
+        handler = self.bindings.get(sequence)
+        if handler is not None:
+            handler(HeadlessEvent(self))
+
+    def wait_variable(self, var):
+        busy, self._busy = self._busy, True
+        try:
+            while not var.get():
+                if not self.events and self.input_provider is not None:
+                    self.events.extend(self.input_provider() or [])
+                if not self.events:
+                    raise RuntimeError("Headless window is waiting for input; feed() key events first.")
+                self.update()
+                self.event_generate(self.events.pop(0))
+        finally:
+            self._busy = busy
+
+    def mainloop(self):
+        """Runs callbacks until quit() is called or nothing is scheduled anymore."""
+        self._quit = False
+        while not self._quit and self._run_next(float("inf")):
+            pass
+
+    def quit(self):
+        self._quit = True
+
+    def destroy(self):
+        self.jobs = []
+
+
+class HeadlessCanvas:
+    """Canvas replacement that only keeps a Scene."""
+
+    def __init__(self, master=None, width=800, height=600, **kw):
+        self.master = master
+        self.width = width
+        self.height = height
+        self.scene = Scene()
+        self.bindings = {}
+
+    def pack(self, **kw):
+        pass
+
+    def bind(self, sequence, func=None, add=None):
+        self.bindings[sequence] = func
+
+    def winfo_width(self):
+        return self.width
+
+    def winfo_height(self):
+        return self.height
+
+    def resize(self, width, height):
+        """Changes the virtual window size and fires <Configure> like Tk would."""
+        self.width, self.height = width, height
+        handler = self.bindings.get("<Configure>")
+        if handler is not None:
+            handler(HeadlessEvent(self, width, height))
+
+    def update(self):
+        self.master.update()
+
+    def create_image(self, *args, **kw):
+        return self.scene.add("image", args, kw)
+
+    def create_rectangle(self, *args, **kw):
+        return self.scene.add("rectangle", args, kw)
+
+    def create_text(self, *args, **kw):
+        return self.scene.add("text", args, kw)
+
+    def create_window(self, *args, **kw):
+        return self.scene.add("window", args, kw)
+
+    def itemconfig(self, item_id, cnf=None, **kw):
+        self.scene.config(item_id, dict(cnf or {}, **kw))
+
+    itemconfigure = itemconfig
+
+    def coords(self, item_id, *coords):
+        if len(coords) == 1 and isinstance(coords[0], (tuple, list)):
+            coords = coords[0]
+        self.scene.set_coords(item_id, coords)
+        item = self.scene.items.get(item_id)
+        return item.coords if item is not None else []
+
+    def insert(self, item_id, index, text):
+        self.scene.insert(item_id, text)
+
+    def delete(self, *item_ids):
+        for item_id in item_ids:
+            self.scene.delete(item_id)
+
+    def tag_raise(self, item_id, *args):
+        self.scene.raise_item(item_id)
+
+
+class HeadlessText:
+    """The subset of tk.Text used by dialog boxes."""
+
+    def __init__(self, master=None, **options):
+        self.options = {"bg": "white", "fg": "black", "bd": 0, "font": ("Helvetica", 14)}
+        self.options.update(options)
+        self.text = ""
+
+    def config(self, **options):
+        self.options.update(options)
+
+    configure = config
+
+    def cget(self, key):
+        return self.options.get(key)
+
+    def delete(self, start, end=None):
+        self.text = ""
+
+    def insert(self, index, text):
+        self.text += text
+
+    def get(self, start, end=None):
+        return self.text
+
+    def see(self, index):
+        pass
+
+    def bind(self, sequence, func=None, add=None):
+        pass
+
+    def yview_scroll(self, number, what):
+        pass
+
+    def destroy(self):
+        pass
+
+
+class HeadlessFont:
+    """Font metrics from PIL, standing in for tkinter.font.Font."""
+
+    def __init__(self, font=("Helvetica", 14), **kw):
+        self.font = pil_font(font)
+
+    def measure(self, text):
+        return int(self.font.getlength(text))
+
+    def metrics(self, name):
+        if name == "linespace":
+            return self.font.getbbox("Ay")[3] + 4
+        raise ValueError(name)
+
+
+class TkBackend:
+    """Draws into a real Tk window; the canvas also records a Scene for render_frame()."""
+
+    headless = False
+    Photo = RecordedPhoto
+    Variable = tk.BooleanVar
+    Text = tk.Text
+    Font = tkfont.Font
+
+    def __init__(self, size=(800, 600), title="Story Telling Game"):
+        self.root = tk.Tk()
+        self.root.title(title)
+        self.canvas = RecordingCanvas(self.root, width=size[0], height=size[1])
+        self.canvas.pack(fill="both", expand=True)
+
+    def clock(self):
+        return time.monotonic()
+
+    def upload(self, photo, frame, box):
+        """Copies the `box` region of `frame` into `photo` without re-uploading the rest."""
+        region = ImageTk.PhotoImage(frame.crop(box))
+        self.root.tk.call(str(photo), "copy", str(region), "-to", box[0], box[1])
+        photo.pil = frame
+
+
+class HeadlessBackend:
+    """No display needed: a virtual clock, scripted input and frames composited with PIL."""
+
+    headless = True
+    Photo = HeadlessPhoto
+    Variable = HeadlessVar
+    Text = HeadlessText
+    Font = HeadlessFont
+
+    def __init__(self, size=(800, 600), title="Story Telling Game"):
+        self.root = HeadlessRoot()
+        self.canvas = HeadlessCanvas(self.root, width=size[0], height=size[1])
+
+    def clock(self):
+        return self.root.now
+
+    def upload(self, photo, frame, box):
+        photo.pil = frame
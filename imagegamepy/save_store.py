@@ -0,0 +1,268 @@
+import glob
+import json
+import os
+import threading
+
+LEGACY_FILE = 'gamedata.json'
+DEFAULT_SLOT = 'default'
+
+
+class SaveStore:
+    """
+    In-memory save of the interface choice and the story choices of one slot.
+
+    Every backend keeps this index in memory, so lookups never touch the disk.
+    Like the original gamedata.json scan, get(id) returns the first choice recorded for an id.
+    """
+
+    def __init__(self, slot=DEFAULT_SLOT):
+        self.slot = slot
+        self.interface = None
+        self.story = []
+        self._first = {}
+        self._lock = threading.Lock()
+
+    def _index(self, record):
+        if record.get('type') == 'interface':
+            self.interface = {"options": record.get('options'), "choice": record.get('choice')}
+        else:
+            entry = {"id": str(record.get('id')), "choice": record.get('choice')}
+            self.story.append(entry)
+            self._first.setdefault(entry['id'], entry['choice'])
+
+    def _write(self, record):
+        pass
+
+    def _write_many(self, records):
+        for record in records:
+            self._write(record)
+
+    def _written(self):
+        pass
+
+    @staticmethod
+    def _make_record(id, result):
+        if id == 'interface':
+            return {"type": "interface", "options": result.get("options"), "choice": result.get("choice")}
+        return {"type": "story", "id": str(id), "choice": result.get("choice")}
+
+    def record(self, id, result):
+        """Saves an option result. `id == 'interface'` replaces the interface choice."""
+        record = self._make_record(id, result)
+        with self._lock:
+            self._write(record)
+            self._index(record)
+            self._written()
+
+    def get(self, id=None):
+        """Same lookups as StoryWindow.return_options."""
+        if id is None or id == '':
+            return self.interface.get("choice") if self.interface else None
+        if id == 'checkmem':
+            return self.story[-1]["id"] if self.story else None
+        return self._first.get(str(id))
+
+    def is_empty(self):
+        return self.interface is None and not self.story
+
+    def as_legacy(self):
+        """Returns the data in the old gamedata.json layout."""
+        return [self.interface or {'state': ''}, {'story': list(self.story)}]
+
+    def import_legacy(self, path=LEGACY_FILE):
+        """Imports an existing gamedata.json into this store. Returns True if anything was imported."""
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if not isinstance(data, list) or len(data) < 2:
+            return False
+        records = []
+        if isinstance(data[0], dict) and 'choice' in data[0]:
+            records.append(self._make_record('interface', data[0]))
+        for item in data[1].get('story', []):
+            records.append(self._make_record(item.get('id'), item))
+        # One write (and one fsync) for the whole file instead of one per choice
+        with self._lock:
+            self._write_many(records)
+            for record in records:
+                self._index(record)
+            self._written()
+        return True
+
+    def slots(self):
+        return [self.slot]
+
+    def close(self):
+        pass
+
+
+class MemorySaveStore(SaveStore):
+    """Save store that never touches the disk, e.g. for tests and automated playthroughs."""
+
+
+class JsonlSaveStore(SaveStore):
+    """
+    Append-only journal with one JSON record per line.
+
+    Each choice is appended and fsynced, so a crash can at most lose a partly written
+    last line, which is dropped on the next open. The journal is rewritten without
+    superseded interface records every `compact_every` appends; the story history is
+    kept in full, so as_legacy() returns the same data before and after.
+    """
+
+    def __init__(self, slot=DEFAULT_SLOT, directory='.', compact_every=1000):
+        super().__init__(slot)
+        self.directory = directory
+        self.compact_every = compact_every
+        self.path = self.slot_path(directory, slot)
+        self._appended = 0
+        self._file = None
+        self._load()
+
+    @staticmethod
+    def slot_path(directory, slot):
+        name = 'gamedata.jsonl' if slot == DEFAULT_SLOT else 'gamedata.%s.jsonl' % slot
+        return os.path.join(directory, name)
+
+    def _load(self):
+        good = 0
+        newline = True
+        if os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break
+                    self._index(record)
+                    good += len(line)
+                    newline = line.endswith(b'\n')
+            if good != os.path.getsize(self.path):
+                # Torn write from a crash: keep everything before it
+                with open(self.path, 'r+b') as f:
+                    f.truncate(good)
+        self._file = open(self.path, 'ab')
+        if not newline:
+            # The last record is whole but lost its newline; the next append would join it
+            self._file.write(b'\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def _write(self, record):
+        self._write_many([record])
+
+    def _write_many(self, records):
+        self._file.write(b''.join(json.dumps(record).encode('utf-8') + b'\n' for record in records))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._appended += len(records)
+
+    def _written(self):
+        if self._appended >= self.compact_every:
+            self._compact()
+
+    def _records(self):
+        records = []
+        if self.interface is not None:
+            records.append(dict(self.interface, type='interface'))
+        records.extend(dict(entry, type='story') for entry in self.story)
+        return records
+
+    def compact(self):
+        with self._lock:
+            self._compact()
+
+    def _compact(self):
+        records = self._records()
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            for record in records:
+                f.write(json.dumps(record).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, 'ab')
+        self.story = [{"id": r['id'], "choice": r['choice']} for r in records if r['type'] == 'story']
+        self._appended = 0
+
+    def slots(self):
+        found = []
+        for path in glob.glob(os.path.join(self.directory, 'gamedata*.jsonl')):
+            name = os.path.basename(path)
+            found.append(DEFAULT_SLOT if name == 'gamedata.jsonl' else name[len('gamedata.'):-len('.jsonl')])
+        return sorted(found)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SqliteSaveStore(SaveStore):
+    """Save store backed by a stdlib sqlite3 database holding every slot."""
+
+    def __init__(self, slot=DEFAULT_SLOT, path='gamedata.sqlite3'):
+        super().__init__(slot)
+        self.path = path
+        import sqlite3
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS interface (slot TEXT PRIMARY KEY, options TEXT, choice TEXT)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS story (seq INTEGER PRIMARY KEY AUTOINCREMENT, slot TEXT, id TEXT, choice TEXT)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS story_slot ON story (slot, seq)")
+        self._conn.commit()
+        self._load()
+
+    def _load(self):
+        row = self._conn.execute("SELECT options, choice FROM interface WHERE slot = ?", (self.slot,)).fetchone()
+        if row is not None:
+            self._index({"type": "interface", "options": json.loads(row[0]), "choice": row[1]})
+        for id, choice in self._conn.execute("SELECT id, choice FROM story WHERE slot = ? ORDER BY seq", (self.slot,)):
+            self._index({"type": "story", "id": id, "choice": choice})
+
+    def _write(self, record):
+        self._write_many([record])
+
+    def _write_many(self, records):
+        with self._conn:
+            for record in records:
+                if record['type'] == 'interface':
+                    self._conn.execute("INSERT OR REPLACE INTO interface (slot, options, choice) VALUES (?, ?, ?)",
+                                       (self.slot, json.dumps(record['options']), record['choice']))
+                else:
+                    self._conn.execute("INSERT INTO story (slot, id, choice) VALUES (?, ?, ?)",
+                                       (self.slot, record['id'], record['choice']))
+
+    def slots(self):
+        rows = self._conn.execute("SELECT slot FROM interface UNION SELECT slot FROM story").fetchall()
+        return sorted(row[0] for row in rows)
+
+    def close(self):
+        self._conn.close()
+
+
+SAVE_BACKENDS = {
+    'jsonl': JsonlSaveStore,
+    'sqlite': SqliteSaveStore,
+    'memory': MemorySaveStore,
+}
+
+
+def open_save_store(backend='jsonl', slot=DEFAULT_SLOT, legacy_file=LEGACY_FILE):
+    """
+    Opens a save store for `slot`. A store instance is returned as is.
+
+    When the default slot is still empty, an existing gamedata.json is imported into it.
+    """
+    if isinstance(backend, SaveStore):
+        return backend
+    if backend not in SAVE_BACKENDS:
+        raise ValueError("Unsupported save backend: " + str(backend))
+    store = SAVE_BACKENDS[backend](slot)
+    if backend != 'memory' and slot == DEFAULT_SLOT and store.is_empty() and legacy_file and os.path.exists(legacy_file):
+        store.import_legacy(legacy_file)
+    return store
@@ -0,0 +1,407 @@
+import json
+import os
+from collections import deque
+
+from .background import BackgroundSource
+
+ASSET_TYPES = ('png', 'gif', 'audio', 'video')
+IMAGE_TYPES = ('png', 'gif')
+LINE_OPTIONS = {"speed": "speed", "position": "position", "color": "text_color", "box": "dialog_box_color"}
+
+
+class Scene:
+    """One compiled scene: what to show, what to say and where to go next."""
+
+    def __init__(self, index, name, background=None, background_color=None, warm=None, noise=None,
+                 assets=(), lines=(), options=None, next_scene=None):
+        self.index = index
+        self.name = name
+        self.background = background
+        self.background_color = background_color
+        self.warm = warm
+        self.noise = noise
+        self.assets = list(assets)
+        self.lines = list(lines)
+        self.options = options
+        self.next = next_scene
+
+    @property
+    def targets(self):
+        if self.options is not None:
+            return [target for _, target in self.options["choices"]]
+        return [self.next] if self.next is not None else []
+
+
+class StoryGraph:
+    """
+    A story compiled into scenes addressed by index.
+
+    `edges[i]` holds the indices of the scenes that can follow scene `i`, so looking
+    ahead never has to touch the story source again.
+    """
+
+    def __init__(self, scenes, start):
+        self.scenes = scenes
+        self.index = dict((scene.name, scene.index) for scene in scenes)
+        self.start = self.index[start]
+        self.edges = [[self.index[target] for target in scene.targets if target is not None] for scene in scenes]
+
+    def __len__(self):
+        return len(self.scenes)
+
+    def scene(self, name_or_index):
+        if isinstance(name_or_index, int):
+            return self.scenes[name_or_index]
+        return self.scenes[self.index[name_or_index]]
+
+    def reachable(self, index, depth):
+        """Scenes reachable from `index` in 1 to `depth` steps, as (distance, index), nearest first."""
+        seen = {index}
+        queue = deque([(0, index)])
+        found = []
+        while queue:
+            distance, current = queue.popleft()
+            if distance == depth:
+                continue
+            for target in self.edges[current]:
+                if target not in seen:
+                    seen.add(target)
+                    found.append((distance + 1, target))
+                    queue.append((distance + 1, target))
+        return found
+
+
+def _resolve(address, base_dir):
+    if base_dir and not os.path.isabs(address):
+        return os.path.join(base_dir, address)
+    return address
+
+
+def _compile_asset(asset, base_dir, where):
+    if not isinstance(asset, dict) or asset.get("type") not in ASSET_TYPES or "address" not in asset:
+        raise ValueError(where + ": assets need a type (png, gif, audio or video) and an address")
+    settings = asset.get("settings")
+    if asset["type"] in IMAGE_TYPES:
+        settings = [tuple(settings[0]), tuple(settings[1])]
+    return {"type": asset["type"], "settings": settings, "address": _resolve(asset["address"], base_dir),
+            "loop": 'l' if asset.get("loop") else ''}
+
+
+def _compile_line(line, defaults, where):
+    if isinstance(line, str):
+        line = {"text": line}
+    if not isinstance(line, dict) or "text" not in line:
+        raise ValueError(where + ": dialog lines must be strings or objects with a text")
+    compiled = dict(defaults)
+    for key, value in line.items():
+        if key == "text":
+            compiled["text"] = value
+        elif key in LINE_OPTIONS:
+            compiled[LINE_OPTIONS[key]] = value
+        else:
+            raise ValueError(where + ": unknown dialog setting " + repr(key))
+    return compiled
+
+
+def compile_story(story, base_dir=None):
+    """
+    Compiles a story description into a StoryGraph.
+
+    A story is a dict with a "start" scene name and a "scenes" mapping. Each scene may set
+    "background" (image path) or "background_color", "warm", "noise" ([randomness, pattern, blur]),
+    "assets" (dicts with type, settings and address, as passed to load()), "lines" (strings or
+    dicts with text, speed, position, color and box) and either "options" or "next".
+    "options" is a dict with "choices" ([{"text": ..., "next": ...}]) and optionally
+    "id", "color" and "background"; a choice without "next" ends the story.
+    A top-level "dialog" dict sets default line settings. Relative paths are resolved against `base_dir`.
+    """
+    from .game_lib import noise
+
+    if "scenes" not in story or not story["scenes"]:
+        raise ValueError("A story needs at least one scene")
+    line_defaults = _compile_line(dict(story.get("dialog", {}), text=""), {}, "dialog")
+    del line_defaults["text"]
+    scenes = []
+    for index, (name, data) in enumerate(story["scenes"].items()):
+        where = "scene " + repr(name)
+        options = data.get("options")
+        if options is not None:
+            choices = options.get("choices") or []
+            if not choices:
+                raise ValueError(where + ": options need at least one choice")
+            options = {
+                "id": options.get("id", "interface"),
+                "color": options.get("color", ''),
+                "background": options.get("background", ''),
+                "choices": [(choice["text"], choice.get("next")) for choice in choices],
+            }
+        # None keeps the current noise, false or [] turns it off
+        noise_params = data.get("noise")
+        if noise_params:
+            noise_params = noise(*noise_params)
+        elif "noise" in data:
+            noise_params = False
+        scenes.append(Scene(
+            index, name,
+            background=_resolve(data["background"], base_dir) if data.get("background") else None,
+            background_color=data.get("background_color"),
+            warm=data.get("warm"),
+            noise=noise_params,
+            assets=[_compile_asset(asset, base_dir, where) for asset in data.get("assets", [])],
+            lines=[_compile_line(line, line_defaults, where) for line in data.get("lines", [])],
+            options=options,
+            next_scene=data.get("next"),
+        ))
+    names = set(scene.name for scene in scenes)
+    start = story.get("start", scenes[0].name)
+    if start not in names:
+        raise ValueError("Unknown start scene " + repr(start))
+    for scene in scenes:
+        for target in scene.targets:
+            if target is not None and target not in names:
+                raise ValueError("scene %r: unknown target scene %r" % (scene.name, target))
+    return StoryGraph(scenes, start)
+
+
+def load_story(path):
+    """Reads a JSON story file and compiles it. Asset paths are relative to the file."""
+    with open(path, "r", encoding="utf-8") as f:
+        story = json.load(f)
+    return compile_story(story, os.path.dirname(os.path.abspath(path)))
+
+
+def _decode_background(address, size, pack=None):
+    # Runs on a worker: the packed warm variants are put into the window's cache on the Tk thread
+    source = pack.background(address, size) if pack is not None else None
+    if source is None:
+        pack = None
+        source = BackgroundSource.open(address, size)
+    return source, size, source.resize(size), pack
+
+
+def _image_bytes(image):
+    return image.size[0] * image.size[1] * len(image.getbands())
+
+
+class StoryRunner:
+    """
+    Plays a StoryGraph on a StoryWindow.
+
+    The advance key finishes the current dialog line or moves to the next one; option
+    scenes branch on the player's choice. Whenever a scene starts, the backgrounds and
+    assets of every scene reachable within `prefetch_depth` choices are decoded on the
+    asset threads, nearest scenes first, until `prefetch_budget` bytes are in flight.
+    stats() tells how many of the assets the story used had been prefetched in time.
+
+    :param window: The StoryWindow to play on.
+    :param graph: A StoryGraph from compile_story() or load_story().
+    :param prefetch_depth: How many choices ahead to prefetch.
+    :param prefetch_budget: Maximum estimated size of prefetched, not yet used assets, in bytes.
+    :param advance_key: Key event that advances the dialog.
+    :param on_finish: Called with the runner when the story ends.
+    """
+
+    def __init__(self, window, graph, prefetch_depth=2, prefetch_budget=64 * 1024 * 1024,
+                 advance_key="<Return>", on_finish=None):
+        self.window = window
+        self.graph = graph
+        self.prefetch_depth = prefetch_depth
+        self.prefetch_budget = prefetch_budget
+        self.advance_key = advance_key
+        self.on_finish = on_finish
+        self.current = None
+        self.line = 0
+        self.history = []
+        self.choices = []
+        self.finished = False
+        self.hits = 0
+        self.late = 0
+        self.misses = 0
+        self.issued = 0
+        self.unused = 0
+        self.prefetch_bytes = 0
+        self._prefetched = {}
+        self._asking = False
+
+    def start(self, scene=None):
+        self.finished = False
+        self.window.root.bind(self.advance_key, self._on_key)
+        self.enter(self.graph.start if scene is None else scene)
+
+    def enter(self, scene):
+        scene = self.graph.scene(scene)
+        self.current = scene
+        self.line = 0
+        self.history.append(scene.name)
+        self._stage(scene)
+        self.prefetch(scene.index)
+        self._show_line()
+
+    def _stage(self, scene):
+        window = self.window
+        if scene.background:
+            self._set_background(scene.background)
+        elif scene.background_color:
+            window.set_background_color(scene.background_color)
+        if scene.warm is not None:
+            window.set_warm(scene.warm)
+        if scene.noise is not None:
+            window.set_noise_params(scene.noise or None)
+        for asset in scene.assets:
+            if asset["type"] != 'video':
+                self._take(self._asset_key(asset))
+            window.load(asset["type"], asset["settings"], asset["address"], asset["loop"])
+
+    def _set_background(self, address):
+        entry = self._take(('background', address))
+        if entry is None or entry[0].exception() is not None:
+            self.window.set_background_image(address)
+            return
+        # A decode still running is waited for rather than started again
+        source, size, base, pack = entry[0].result()
+        self.window._set_background_source(source)
+        if pack is not None:
+            pack.prime(source, size, self.window.background_cache)
+        else:
+            self.window.background_cache.prime(source, size, base)
+        self.window.update_background()
+
+    def _take(self, key):
+        entry = self._prefetched.pop(key, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry[0].done():
+            self.hits += 1
+        else:
+            self.late += 1
+        self.prefetch_bytes -= entry[1]
+        return entry
+
+    def _asset_key(self, asset):
+        if asset["type"] in IMAGE_TYPES:
+            return (asset["type"], asset["settings"][0], asset["address"])
+        return (asset["type"], asset["address"])
+
+    def _settle(self):
+        """Replaces the size estimates of finished prefetches with their real size."""
+        for key, entry in self._prefetched.items():
+            future, nbytes, settled = entry
+            if settled or not future.done():
+                continue
+            actual = nbytes
+            if future.exception() is None:
+                result = future.result()
+                if key[0] == 'background':
+                    actual = sum(_image_bytes(level) for level in result[0].levels) + _image_bytes(result[2])
+                elif key[0] in IMAGE_TYPES:
+                    actual = result.nbytes
+            self.prefetch_bytes += actual - nbytes
+            self._prefetched[key] = [future, actual, True]
+
+    def _requests(self, scene):
+        """(key, estimated bytes, submit) for everything `scene` will need."""
+        window = self.window
+        if scene.background:
+            size = (window.canvas.winfo_width(), window.canvas.winfo_height())
+            yield (('background', scene.background), size[0] * size[1] * 3 * 2,
+                   lambda address=scene.background, size=size: window.assets.executor.submit(
+                       window.profiler.wrap("decode", _decode_background), address, size, window.asset_pack))
+        for asset in scene.assets:
+            if asset["type"] in IMAGE_TYPES:
+                scale = asset["settings"][0]
+                yield (self._asset_key(asset), scale[0] * scale[1] * 4,
+                       lambda asset=asset: window.assets.request(asset["address"], asset["settings"][0], asset["type"]))
+            elif asset["type"] == 'audio' and not window.audio.should_stream(asset["address"], -1 if asset["loop"] else 0):
+                yield (self._asset_key(asset), os.path.getsize(asset["address"]),
+                       lambda asset=asset: window.audio.preload([asset["address"]])[0])
+
+    def prefetch(self, index):
+        """Starts decoding what the scenes reachable from `index` need, within the budget."""
+        self._settle()
+        wanted = []
+        for _, target in self.graph.reachable(index, self.prefetch_depth):
+            wanted.extend(self._requests(self.graph.scene(target)))
+        wanted_keys = set(key for key, _, _ in wanted)
+        for key in [key for key in self._prefetched if key not in wanted_keys]:
+            # That branch can no longer be reached in time
+            future, nbytes, _ = self._prefetched.pop(key)
+            if key[0] == 'background':
+                future.cancel()
+            self.prefetch_bytes -= nbytes
+            self.unused += 1
+        for key, estimate, submit in wanted:
+            if key in self._prefetched:
+                continue
+            if self.prefetch_bytes + estimate > self.prefetch_budget:
+                break
+            try:
+                future = submit()
+            except ImportError:
+                continue
+            self._prefetched[key] = [future, estimate, False]
+            self.prefetch_bytes += estimate
+            self.issued += 1
+
+    def _on_key(self, event=None):
+        if self.current is None or self.finished or self._asking:
+            return
+        if not self.window.dialogs.done:
+            self.window.skip_dialog()
+            return
+        self.line += 1
+        self._show_line()
+
+    def _show_line(self):
+        lines = self.current.lines
+        if self.line < len(lines):
+            self.window.dialog(**lines[self.line])
+            return
+        if lines:
+            self.window.close_text_box()
+        if self.current.options is not None:
+            self._asking = True
+            self.window.root.after(0, self._ask)
+        elif self.current.next is not None:
+            self.enter(self.current.next)
+        else:
+            self.finish()
+
+    def _ask(self):
+        scene = self.current
+        options = scene.options
+        texts = [text for text, _ in options["choices"]]
+        save_type = 'json' if options["id"] != 'interface' else 'default'
+        result = self.window.option(texts, options["background"], options["color"], save_type, options["id"])
+        # option() unbinds the return key when it is done
+        self.window.root.bind(self.advance_key, self._on_key)
+        self._asking = False
+        choice = result["choice"] if isinstance(result, dict) else result
+        self.choices.append((scene.name, choice))
+        target = options["choices"][texts.index(choice)][1]
+        if target is None:
+            self.finish()
+        else:
+            self.enter(target)
+
+    def finish(self):
+        self.finished = True
+        self.window.root.unbind(self.advance_key)
+        self.window.close_text_box()
+        if self.on_finish is not None:
+            self.on_finish(self)
+
+    def stats(self):
+        """Prefetch counters: hits (ready in time), late (still decoding), misses (never prefetched)."""
+        self._settle()
+        used = self.hits + self.late + self.misses
+        return {
+            "hits": self.hits,
+            "late": self.late,
+            "misses": self.misses,
+            "hit_rate": self.hits / float(used) if used else None,
+            "issued": self.issued,
+            "unused": self.unused,
+            "prefetch_bytes": self.prefetch_bytes,
+            "scenes": len(self.history),
+        }
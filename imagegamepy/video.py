@@ -0,0 +1,205 @@
+import queue
+import threading
+import time
+from PIL import Image
+
+from .profiler import NULL_PROFILER
+
+EOF_MARK = 'eof'
+
+
+def frame_to_image(frame, size=None):
+    """
+    Converts an ffpyplayer rgb24 image to a PIL image of `size`.
+
+    The pixels are read through a memoryview when available, and only frames the
+    decoder did not already scale go through a (bilinear) resize.
+    """
+    w, h = frame.get_size()
+    try:
+        data = frame.to_memoryview(keep_align=False)[0]
+    except AttributeError:
+        data = frame.to_bytearray()[0]
+    image = Image.frombuffer("RGB", (w, h), data, "raw", "RGB", 0, 1)
+    if size is not None and image.size != tuple(size):
+        return image.resize(size, Image.BILINEAR)
+    # frombuffer shares the decoder's memory, which is reused for the next frame
+    return image.copy()
+
+
+class VideoPipeline:
+    """
+    Decodes and scales video frames on a worker thread and presents them on the Tk thread.
+
+    Frames wait in a bounded queue and are shown at their PTS. When presentation falls
+    behind, frames that are already overdue are dropped in favour of the newest due one.
+    Every frame is pasted into the same PhotoImage shown by a single canvas item.
+
+    :param player: An ffpyplayer MediaPlayer opened with out_fmt 'rgb24'.
+    :param size: Output size (width, height).
+    :param position: Top-left canvas position of the video.
+    :param make_photo: Callable (mode, size) -> PhotoImage-like object with a paste() method.
+    :param queue_size: Number of decoded frames allowed to wait for presentation.
+    :param late_threshold: Seconds after its PTS a shown frame counts as late.
+    :param clock: Time source in seconds shared with the presentation loop.
+    :param profiler: Receives decode and upload spans, see StoryWindow.enable_profiler().
+    """
+
+    def __init__(self, player, size, position, root, canvas, make_photo, queue_size=4, late_threshold=0.02,
+                 clock=time.monotonic, profiler=NULL_PROFILER):
+        self.player = player
+        self.clock = clock
+        self.profiler = profiler
+        self.size = tuple(size)
+        self.position = position
+        self.root = root
+        self.canvas = canvas
+        self.make_photo = make_photo
+        self.late_threshold = late_threshold
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.photo = None
+        self.item = None
+        self.running = False
+        self.finished = False
+        self.decoded = 0
+        self.shown = 0
+        self.dropped = 0
+        self.late = 0
+        self._clock_base = None
+        self._pending = None
+        self._job = None
+        self._thread = None
+        self._decoding = False
+        self._close_when_done = False
+        self._close_lock = threading.Lock()
+        try:
+            # Let ffmpeg scale while decoding instead of resizing every frame afterwards
+            player.set_size(self.size[0], self.size[1])
+        except Exception:
+            pass
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._decoding = True
+        self._thread = threading.Thread(target=self._decode_loop, name="imagegamepy-video", daemon=True)
+        self._thread.start()
+        self._job = self.root.after(1, self._present)
+
+    def stop(self, join_timeout=1.0):
+        """Stops presenting, waits up to `join_timeout` seconds for the decode thread, then closes the player."""
+        self.running = False
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+        if self.item is not None:
+            self.canvas.delete(self.item)
+            self.item = None
+        # The decode thread may be inside player.get_frame(); closing the player under it is a native race
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(join_timeout)
+        with self._close_lock:
+            if self._decoding:
+                # Still stuck in the decoder: the thread closes the player once it gets out
+                self._close_when_done = True
+                return
+        self._close_player()
+
+    def _close_player(self):
+        try:
+            self.player.close_player()
+        except Exception:
+            pass
+
+    def stats(self):
+        return {
+            "decoded": self.decoded,
+            "shown": self.shown,
+            "dropped": self.dropped,
+            "late": self.late,
+            "queued": self.frames.qsize(),
+            "finished": self.finished,
+        }
+
+    def _decode_loop(self):
+        try:
+            self._decode_frames()
+        finally:
+            with self._close_lock:
+                self._decoding = False
+                close = self._close_when_done
+            if close:
+                self._close_player()
+
+    def _decode_frames(self):
+        while self.running:
+            frame, val = self.player.get_frame()
+            if val == EOF_MARK:
+                self._put((None, EOF_MARK))
+                return
+            if frame is None:
+                time.sleep(min(val, 0.01) if isinstance(val, float) and val > 0 else 0.005)
+                continue
+            img, pts = frame
+            now = self.clock()
+            due = pts if pts is not None else now
+            if self._clock_base is None or abs(self._clock_base + due - now) > 0.5:
+                # (Re)anchor the PTS clock on the first frame and after seeks or pauses
+                self._clock_base = now - due
+            with self.profiler.span("decode"):
+                image = frame_to_image(img, self.size)
+            self._put((self._clock_base + due, image))
+            self.decoded += 1
+
+    def _put(self, entry):
+        while self.running:
+            try:
+                self.frames.put(entry, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def _next(self):
+        if self._pending is None:
+            try:
+                self._pending = self.frames.get_nowait()
+            except queue.Empty:
+                return None
+        return self._pending
+
+    def _present(self):
+        self._job = None
+        if not self.running:
+            return
+        now = self.clock()
+        shown = None
+        while True:
+            entry = self._next()
+            if entry is None or entry[0] is None or entry[0] > now:
+                break
+            if shown is not None:
+                self.dropped += 1
+            shown = entry
+            self._pending = None
+        if shown is not None:
+            due, image = shown
+            if now - due > self.late_threshold:
+                self.late += 1
+            self._show(image)
+        entry = self._next()
+        if entry is not None and entry[0] is None:
+            self.finished = True
+            self.running = False
+            return
+        delay = int((entry[0] - self.clock()) * 1000) if entry is not None else 5
+        self._job = self.root.after(max(delay, 1), self._present)
+
+    def _show(self, image):
+        if self.photo is None:
+            self.photo = self.make_photo("RGB", image.size)
+            self.item = self.canvas.create_image(self.position[0], self.position[1], image=self.photo, anchor="nw")
+        with self.profiler.span("upload"):
+            self.photo.paste(image)
+        self.shown += 1
@@ -19,6 +19,9 @@ setup(
     long_description_content_type='text/markdown',
     packages=find_packages(),
     install_requires=['Pillow', 'pygame', 'numpy', 'keyboard', 'ffpyplayer'],
+    entry_points={
+        'console_scripts': ['imagegamepy-pack=imagegamepy.asset_pack:main'],
+    },
     keywords=['python', 'video game', 'Novel', 'game', 'image', 'image game'],
     license='Apache 2.0',
     url='https://github.com/winnyblackstart/imagegamepy.git',
@@ -0,0 +1,11 @@
+import pytest
+from PIL import Image
+
+import imagegamepy
+
+
+@pytest.fixture
+def game(tmp_path):
+    background = tmp_path / 'background.png'
+    Image.new('RGB', (64, 48), 'navy').save(background)
+    return imagegamepy.body(str(background), headless=True, size=(64, 48), save_backend='memory')
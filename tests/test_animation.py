@@ -0,0 +1,34 @@
+from PIL import Image
+
+
+def _frames(count):
+    return [Image.new('RGB', (4, 4), (i * 40, 0, 0)) for i in range(count)]
+
+
+def test_sprites_follow_their_own_delays_on_one_tick_chain(game):
+    root = game.root
+    fast = game.animations.add((0, 0), _frames(4), [100] * 4)
+    slow = game.animations.add((10, 0), _frames(3), [250] * 3)
+    root.advance(0.35)
+    assert (fast.frame_index, slow.frame_index) == (3, 1)
+    root.advance(0.2)
+    assert (fast.frame_index, slow.frame_index) == (1, 2)
+    # Both sprites share one pending tick, due at the next frame change (fast, at 0.6s) and not before
+    pending = [job for job in root.jobs if job[1] not in root.cancelled]
+    assert len(pending) == 1
+    assert 0.6 <= pending[0][0] < 0.601
+
+
+def test_paused_sprite_keeps_its_place(game):
+    root = game.root
+    sprite = game.animations.add((0, 0), _frames(3), [100] * 3)
+    root.advance(0.15)
+    sprite.pause()
+    root.advance(1.0)
+    assert sprite.frame_index == 1
+    sprite.resume()
+    # 50 ms of the second frame were left when it was paused
+    root.advance(0.04)
+    assert sprite.frame_index == 1
+    root.advance(0.02)
+    assert sprite.frame_index == 2
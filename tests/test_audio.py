@@ -0,0 +1,97 @@
+from imagegamepy.audio import AudioManager
+
+
+class FakeChannel:
+    def __init__(self):
+        self.sound = None
+
+    def play(self, sound, loops=0, fade_ms=0):
+        self.sound = sound
+
+    def set_volume(self, volume):
+        pass
+
+    def stop(self):
+        self.sound = None
+
+    def fadeout(self, ms):
+        self.sound = None
+
+    def get_busy(self):
+        return self.sound is not None
+
+    def get_sound(self):
+        return self.sound
+
+
+class FakeSound:
+    def __init__(self, address):
+        self.address = address
+
+    def get_length(self):
+        return 0.1
+
+
+class FakeMusic:
+    def __init__(self):
+        self.busy = False
+
+    def load(self, address):
+        pass
+
+    def play(self, loops=0, fade_ms=0):
+        self.busy = True
+
+    def set_volume(self, volume):
+        pass
+
+    def get_busy(self):
+        return self.busy
+
+
+class FakeMixer:
+    def __init__(self):
+        self.channels = {}
+        self.music = FakeMusic()
+
+    def get_init(self):
+        return (22050, -16, 2)
+
+    def set_num_channels(self, count):
+        pass
+
+    def Channel(self, channel_id):
+        return self.channels.setdefault(channel_id, FakeChannel())
+
+    def Sound(self, address):
+        return FakeSound(address)
+
+
+def test_effects_do_not_steal_a_looped_sound(tmp_path):
+    addresses = []
+    for name in ('ambience', 'click'):
+        path = tmp_path / (name + '.wav')
+        path.write_bytes(b'\0' * 64)
+        addresses.append(str(path))
+    ambience, click = addresses
+    audio = AudioManager(FakeMixer(), root=None, channels=2)
+    loop = audio.play(ambience, loops=-1)
+    for _ in range(5):
+        assert audio.play(click) is not None
+    assert loop.playing
+    assert audio.play(ambience, loops=-1) is not None
+
+
+def test_second_long_loop_plays_on_a_channel(tmp_path):
+    addresses = []
+    for name in ('rain', 'wind'):
+        path = tmp_path / (name + '.ogg')
+        path.write_bytes(b'\0' * 64)
+        addresses.append(str(path))
+    rain, wind = addresses
+    audio = AudioManager(FakeMixer(), root=None, channels=2, stream_threshold=32)
+    assert audio.should_stream(rain, -1)
+    music = audio.play_music(rain)
+    assert not audio.should_stream(wind, -1)
+    assert audio.play(wind, loops=-1) is not None
+    assert music.playing
@@ -0,0 +1,8 @@
+def test_skip_after_last_chunk_finishes_the_dialog(game):
+    game.dialog('ab', speed=50)
+    # The last chunk is typed, the tick that marks the dialog done has not run yet
+    game.root.advance(0.05)
+    assert not game.dialogs.done
+    game.skip_dialog()
+    assert game.dialogs.done
+    game.skip_dialog()
@@ -0,0 +1,41 @@
+import pytest
+from PIL import Image
+
+from imagegamepy.explorer import explore
+
+
+def _diamonds(tmp_path, count):
+    """`count` two-way questions in a row; both answers lead to the same next question."""
+    background = tmp_path / 'hall.png'
+    Image.new('RGB', (32, 24), 'gray').save(background)
+    scenes = {}
+    for i in range(count):
+        after = 'q%d' % (i + 1) if i + 1 < count else 'end'
+        scenes['q%d' % i] = {'lines': ['Question %d' % i], 'options': {'id': 'q%d' % i, 'choices': [
+            {'text': 'A', 'next': 'a%d' % i}, {'text': 'B', 'next': 'b%d' % i}]}}
+        scenes['a%d' % i] = {'lines': ['a'], 'background': str(background), 'next': after}
+        scenes['b%d' % i] = {'lines': ['b'], 'next': after}
+    scenes['end'] = {'lines': ['The end']}
+    scenes['orphan'] = {'lines': ['Never shown']}
+    return {'start': 'q0', 'scenes': scenes}
+
+
+@pytest.mark.parametrize('workers', [0, 2])
+def test_explore_dedupes_merged_states_and_reports_coverage(tmp_path, workers):
+    report = explore(_diamonds(tmp_path, 3), workers=workers, size=(64, 48))
+    summary = report.summary()
+    # One full path, then one per question for the other answer: it merges at the next question, or ends after the last
+    assert summary['paths'] == 4
+    assert summary['outcomes'] == {'end': 2, 'merged': 2}
+    coverage = report.coverage()
+    assert (coverage['menus'], coverage['choices'], coverage['choices_taken']) == (3, 6, 6)
+    assert coverage['untaken'] == []
+    assert coverage['unreached_scenes'] == ['orphan']
+    assert all(path['dialog_s'] > 0 for path in report.paths)
+    assert any(path['load_ms'] > 0 for path in report.paths)
+    assert summary['wall_ms']['max'] is not None
+
+
+def test_explore_without_dedupe_plays_every_path(tmp_path):
+    report = explore(_diamonds(tmp_path, 3), workers=0, size=(64, 48), dedupe=False)
+    assert report.summary()['outcomes'] == {'end': 8}
@@ -0,0 +1,20 @@
+import random
+
+import pytest
+from PIL import Image, ImageChops
+
+from imagegamepy.grading import COOL_COLOR, WARM_COLOR, Grade, grade_image
+
+
+@pytest.fixture
+def noise():
+    rng = random.Random(7)
+    return Image.frombytes('RGB', (128, 128), bytes(rng.randrange(256) for _ in range(128 * 128 * 3)))
+
+
+@pytest.mark.parametrize('warm', [-100, -60, -35, 1, 35, 60, 99, 100])
+def test_warm_grade_matches_overlay_blend(noise, warm):
+    overlay = Image.new('RGB', noise.size, WARM_COLOR if warm > 0 else COOL_COLOR)
+    expected = Image.blend(noise, overlay, abs(warm) / 100.0)
+    diff = ImageChops.difference(expected, grade_image(noise, Grade(warm=warm)))
+    assert diff.getbbox() is None
@@ -0,0 +1,28 @@
+import imagegamepy
+
+
+def test_advance_dispatches_fed_keys(game):
+    story = imagegamepy.compile_story({
+        'start': 'intro',
+        'scenes': {
+            'intro': {'lines': ['One', 'Two'], 'next': 'ask'},
+            'ask': {'lines': ['Pick'], 'options': {'id': 'pick', 'choices': [
+                {'text': 'left', 'next': None}, {'text': 'right', 'next': None}]}},
+        },
+    })
+    runner = imagegamepy.StoryRunner(game, story, prefetch_depth=0)
+    runner.start()
+    game.root.advance(5)
+    # One key finishes typing a line and the next goes on; the menu keys wait for the menu to open
+    game.root.feed('<Return>', '<Return>', '<Return>', '<Return>', '<Return>', '<Down>', '<Return>')
+    game.root.advance(5)
+    assert runner.finished
+    assert runner.choices == [('ask', 'right')]
+    assert game.root.events == []
+
+
+def test_update_leaves_fed_keys_for_the_next_menu(game):
+    game.root.feed('<Down>', '<Return>')
+    game.root.update()
+    game.root.advance(1)
+    assert game.option(['a', 'b'])['choice'] == 'b'
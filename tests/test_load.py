@@ -0,0 +1,20 @@
+import pytest
+from PIL import Image
+
+import imagegamepy
+
+
+def test_load_rejects_wrong_format_right_away(game, tmp_path):
+    gif = tmp_path / 'sprite.gif'
+    Image.new('RGB', (8, 8)).save(gif)
+    with pytest.raises(ValueError):
+        game.load('png', [(8, 8), (0, 0)], str(gif))
+
+
+def test_load_rejects_unreadable_file_right_away(game, tmp_path):
+    broken = tmp_path / 'broken.png'
+    broken.write_bytes(b'not an image')
+    with pytest.raises(ValueError):
+        game.load('png', [(8, 8), (0, 0)], str(broken))
+    with pytest.raises(ValueError):
+        game.load('gif', [(8, 8), (0, 0)], str(tmp_path / 'missing.gif'))
@@ -0,0 +1,15 @@
+import imagegamepy
+
+
+def test_attach_times_handlers_bound_before_it(game):
+    story = imagegamepy.compile_story({'start': 'intro', 'scenes': {'intro': {'lines': ['One', 'Two']}}})
+    runner = imagegamepy.StoryRunner(game, story, prefetch_depth=0)
+    runner.start()
+    profiler = game.enable_profiler()
+    game.root.event_generate('<Return>')
+    game.canvas.resize(80, 60)
+    assert any(name.startswith('<Return> ') for name in profiler.stats()['callbacks'])
+    assert any(name.startswith('<Configure> ') for name in profiler.stats()['callbacks'])
+    game.disable_profiler()
+    game.root.event_generate('<Return>')
+    assert runner.line == 1
@@ -0,0 +1,18 @@
+def test_map_configure_keeps_the_open_menu(game):
+    game.open_options(['a', 'b'])
+    game.canvas.resize(64, 48)
+    game.root.advance(1)
+    assert game.option_box is not None
+    game.canvas.resize(64, 48)
+    game.root.advance(1)
+    assert game.option_box is not None
+
+
+def test_size_change_closes_the_boxes(game):
+    game.canvas.resize(64, 48)
+    game.root.advance(1)
+    game.open_options(['a', 'b'])
+    game.canvas.resize(80, 60)
+    game.root.advance(1)
+    assert game.option_box is None
+    assert game.background_image.size == (80, 60)
@@ -0,0 +1,78 @@
+import json
+import os
+
+from imagegamepy.save_store import JsonlSaveStore, SqliteSaveStore, open_save_store
+
+
+def test_whole_last_record_without_newline_is_kept(tmp_path):
+    store = JsonlSaveStore(directory=str(tmp_path))
+    store.record('a', {"choice": "x"})
+    store.close()
+    # A crash that lost only the newline
+    with open(store.path, 'rb+') as f:
+        f.truncate(os.path.getsize(store.path) - 1)
+
+    store = JsonlSaveStore(directory=str(tmp_path))
+    store.record('c', {"choice": "y"})
+    store.record('d', {"choice": "z"})
+    store.close()
+
+    store = JsonlSaveStore(directory=str(tmp_path))
+    assert [entry["id"] for entry in store.story] == ['a', 'c', 'd']
+    store.close()
+
+
+def test_torn_last_line_is_dropped(tmp_path):
+    store = JsonlSaveStore(directory=str(tmp_path))
+    store.record('a', {"choice": "x"})
+    store.close()
+    with open(store.path, 'ab') as f:
+        f.write(b'{"type": "story", "id": "b", "cho')
+
+    store = JsonlSaveStore(directory=str(tmp_path))
+    store.record('c', {"choice": "y"})
+    store.close()
+    store = JsonlSaveStore(directory=str(tmp_path))
+    assert [entry["id"] for entry in store.story] == ['a', 'c']
+    store.close()
+
+
+def test_legacy_import_is_one_write(tmp_path, monkeypatch):
+    legacy = tmp_path / 'gamedata.json'
+    story = [{"id": "q%d" % i, "choice": "a"} for i in range(500)]
+    legacy.write_text(json.dumps([{"options": ["a", "b"], "choice": "a"}, {"story": story}]))
+    fsyncs = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: (fsyncs.append(fd), real_fsync(fd)))
+    monkeypatch.chdir(tmp_path)
+
+    store = open_save_store('jsonl', legacy_file=str(legacy))
+    assert len(fsyncs) == 1
+    assert store.as_legacy()[1]["story"] == story
+    store.close()
+
+
+def test_compaction_keeps_story_history(tmp_path):
+    store = JsonlSaveStore(directory=str(tmp_path), compact_every=4)
+    expected = []
+    for i in range(10):
+        store.record('chapter%d' % (i % 3), {"choice": str(i)})
+        expected.append({"id": 'chapter%d' % (i % 3), "choice": str(i)})
+    assert store.as_legacy()[1]["story"] == expected
+    store.close()
+
+    store = JsonlSaveStore(directory=str(tmp_path))
+    assert store.as_legacy()[1]["story"] == expected
+    assert store.get('chapter1') == '1'
+    store.close()
+
+
+def test_sqlite_legacy_import(tmp_path):
+    legacy = tmp_path / 'gamedata.json'
+    legacy.write_text(json.dumps([{'state': ''}, {"story": [{"id": "q1", "choice": "b"}]}]))
+    store = SqliteSaveStore(path=str(tmp_path / 'saves.sqlite3'))
+    assert store.import_legacy(str(legacy))
+    store.close()
+    store = SqliteSaveStore(path=str(tmp_path / 'saves.sqlite3'))
+    assert store.get('q1') == 'b'
+    store.close()
@@ -0,0 +1,89 @@
+import os
+
+import pytest
+from PIL import Image
+
+import imagegamepy
+from imagegamepy.asset_pack import PackedBackground, build_pack, entries_from_story
+
+
+def _image(tmp_path, name, color):
+    path = tmp_path / (name + '.png')
+    Image.new('RGB', (32, 24), color).save(path)
+    return str(path)
+
+
+def _branching_story(tmp_path):
+    return imagegamepy.compile_story({
+        'start': 'crossroads',
+        'scenes': {
+            'crossroads': {'lines': ['Which way?'], 'options': {'choices': [
+                {'text': 'left', 'next': 'forest'}, {'text': 'right', 'next': 'river'}]}},
+            'forest': {'lines': ['Trees'], 'background': _image(tmp_path, 'forest', 'green'),
+                       'assets': [{'type': 'png', 'settings': [(8, 8), (0, 0)], 'address': _image(tmp_path, 'owl', 'brown')}],
+                       'next': 'cave'},
+            'river': {'lines': ['Water'], 'background': _image(tmp_path, 'river', 'blue')},
+            'cave': {'lines': ['Dark'], 'background': _image(tmp_path, 'cave', 'black')},
+        },
+    })
+
+
+@pytest.mark.parametrize('story, message', [
+    ({'scenes': {'a': {'next': 'b'}}}, "unknown target scene 'b'"),
+    ({'scenes': {'a': {'options': {'choices': [{'text': 'go', 'next': 'nowhere'}]}}}}, "unknown target scene 'nowhere'"),
+    ({'start': 'b', 'scenes': {'a': {}}}, "Unknown start scene 'b'"),
+    ({'scenes': {'a': {'options': {'choices': []}}}}, 'at least one choice'),
+    ({'scenes': {}}, 'at least one scene'),
+])
+def test_compile_rejects_broken_stories(story, message):
+    with pytest.raises(ValueError, match=message):
+        imagegamepy.compile_story(story)
+
+
+def test_prefetch_decodes_the_next_scenes_only(game, tmp_path):
+    story = _branching_story(tmp_path)
+    runner = game.play_story(story, prefetch_depth=1)
+    kinds = sorted((key[0], os.path.basename(key[-1])) for key in runner._prefetched)
+    assert kinds == [('background', 'forest.png'), ('background', 'river.png'), ('png', 'owl.png')]
+    _wait_for_prefetch(runner)
+    game.root.advance(5)
+    game.root.feed('<Return>', '<Return>')
+    game.root.advance(5)
+    assert runner.current.name == 'forest'
+    # Background and sprite of the forest were ready; the river branch is dropped, the cave comes next
+    assert runner.stats()['hits'] == 2
+    assert runner.stats()['unused'] == 1
+    assert [key[0] for key in runner._prefetched] == ['background']
+
+
+def test_prefetch_stays_within_the_budget(game, tmp_path):
+    runner = game.play_story(_branching_story(tmp_path), prefetch_depth=2, prefetch_budget=1)
+    assert runner._prefetched == {}
+
+
+def _wait_for_prefetch(runner):
+    for future, _, _ in list(runner._prefetched.values()):
+        future.result(timeout=10)
+
+
+def test_prefetched_scene_background_comes_from_the_pack(game, tmp_path):
+    room = tmp_path / 'room.png'
+    Image.new('RGB', (320, 240), 'olive').save(room)
+    story = imagegamepy.compile_story({
+        'start': 'hall',
+        'scenes': {
+            'hall': {'lines': ['Knock'], 'next': 'room'},
+            'room': {'lines': ['Inside'], 'background': str(room), 'warm': 40},
+        },
+    })
+    pack = tmp_path / 'story.igpack'
+    build_pack(entries_from_story(story, (64, 48), warm=True), str(pack))
+    game.use_asset_pack(str(pack))
+    runner = game.play_story(story)
+    _wait_for_prefetch(runner)
+    game.root.feed('<Return>', '<Return>')
+    game.root.advance(5)
+    assert runner.current.name == 'room'
+    assert runner.hits == 1
+    assert isinstance(game.background_source, PackedBackground)
+    assert (game.background_source.key, (64, 48), 40) in game.background_cache.entries